@@ -95,12 +95,19 @@ import config
 from database import supabase_client as db
 from services import ml_api
 
+
+@st.cache_data(ttl=config.ESTADISTICAS_TTL_SEG, show_spinner=False)
+def cargar_estadisticas():
+    """Estadísticas generales (se reutilizan entre recargas durante unos segundos)"""
+    return db.get_estadisticas_generales()
+
+
 # Verificar conexiones
 col1, col2, col3 = st.columns(3)
 
 with col1:
     try:
-        stats = db.get_estadisticas_generales()
+        stats = cargar_estadisticas()
         st.success("✅ Supabase conectado")
         st.metric("Total Órdenes", stats['total_ordenes'])
     except:
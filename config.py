@@ -3,6 +3,7 @@ Configuración general de la aplicación
 """
 
 import os
+import tempfile
 
 # ============================================================================
 # SUPABASE - meli_reconciliation (tablas: discrepancias, tbc_facturas)
@@ -60,10 +61,107 @@ TIMEZONE = os.getenv("TIMEZONE", "America/Bogota")
 # Evento TBC para Mercado Libre Flex
 TBC_EVENTO_FLEX = "S66"
 
+# Segundos que la página principal reutiliza las estadísticas generales
+ESTADISTICAS_TTL_SEG = int(os.getenv("ESTADISTICAS_TTL_SEG", "60"))
+
 # Configuración de paginación
 ITEMS_PER_PAGE = 20
 MAX_ORDERS_TO_FETCH = 50
 
+# Descarga paginada de órdenes del OMS por keyset (order_date, order_id):
+# filas por página y tramos de fechas que se recorren en paralelo
+OMS_PAGE_SIZE = int(os.getenv("OMS_PAGE_SIZE", "1000"))
+OMS_FETCH_WORKERS = int(os.getenv("OMS_FETCH_WORKERS", "4"))
+# Máximo de fechas enviadas en un filtro `in`; con más se filtra por rango
+OMS_MAX_FECHAS_IN = int(os.getenv("OMS_MAX_FECHAS_IN", "60"))
+
+# Caché local (SQLite) de las órdenes del OMS (database/oms_cache.py).
+# Apagada por defecto: la primera sincronización descarga todo el histórico
+# del canal, así que solo conviene con disco persistente
+OMS_CACHE_HABILITADO = os.getenv("OMS_CACHE", "0") == "1"
+OMS_CACHE_PATH = os.getenv(
+    "OMS_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "meli_reconciliation", "oms_cache.sqlite3")
+)
+# Sin volver a consultar el OMS si la última sincronización es más reciente que esto
+OMS_CACHE_TTL_SEG = int(os.getenv("OMS_CACHE_TTL_SEG", "60"))
+OMS_CACHE_MARGEN_SEG = int(os.getenv("OMS_CACHE_MARGEN_SEG", "120"))
+
+# Recorrido de /orders/search de Mercado Libre
+ML_ORDERS_PAGE_SIZE = 50
+ML_ORDERS_MAX_OFFSET = int(os.getenv("ML_ORDERS_MAX_OFFSET", "10000"))
+ML_CRAWL_WORKERS = int(os.getenv("ML_CRAWL_WORKERS", "4"))
+
+# Cliente HTTP compartido de Mercado Libre (services/ml_http.py)
+ML_HTTP_TIMEOUT = float(os.getenv("ML_HTTP_TIMEOUT", "30"))
+ML_HTTP_POOL_SIZE = int(os.getenv("ML_HTTP_POOL_SIZE", "10"))
+ML_MAX_REINTENTOS = int(os.getenv("ML_MAX_REINTENTOS", "5"))
+ML_HTTP_BACKOFF = float(os.getenv("ML_HTTP_BACKOFF", "1"))
+
+# Token ML en memoria (services/ml_token_provider.py)
+# Se refresca ML_TOKEN_MARGEN_SEG antes de vencer; sin vencimiento conocido se
+# vuelve a leer la fuente cada ML_TOKEN_RECARGA_SEG
+ML_TOKEN_MARGEN_SEG = int(os.getenv("ML_TOKEN_MARGEN_SEG", "600"))
+ML_TOKEN_RECARGA_SEG = int(os.getenv("ML_TOKEN_RECARGA_SEG", "300"))
+ML_TOKEN_REINTENTO_SEG = int(os.getenv("ML_TOKEN_REINTENTO_SEG", "60"))
+ML_TOKEN_TTL_SEG = 21600  # Vigencia de un access_token de ML (6 horas)
+# Reserva del refresco entre sesiones (claim_ml_token_refresh)
+ML_TOKEN_LEASE_SEG = int(os.getenv("ML_TOKEN_LEASE_SEG", "30"))
+
+# Cliente asíncrono (services/ml_async.py): peticiones simultáneas y por segundo
+ML_ASYNC_CONCURRENCIA = int(os.getenv("ML_ASYNC_CONCURRENCIA", "20"))
+ML_ASYNC_POR_SEGUNDO = float(os.getenv("ML_ASYNC_POR_SEGUNDO", "25"))
+
+# Webhook de notificaciones de ML (services/ml_webhook.py)
+ML_WEBHOOK_PORT = int(os.getenv("ML_WEBHOOK_PORT", "8080"))
+ML_WEBHOOK_PATH = os.getenv("ML_WEBHOOK_PATH", "/notifications")
+ML_WEBHOOK_LOTE = int(os.getenv("ML_WEBHOOK_LOTE", "50"))
+ML_WEBHOOK_ESPERA_SEG = float(os.getenv("ML_WEBHOOK_ESPERA_SEG", "2"))
+ML_WEBHOOK_MAX_INTENTOS = int(os.getenv("ML_WEBHOOK_MAX_INTENTOS", "3"))
+
+# Valores con los que el webhook crea órdenes nuevas en el OMS
+# (la tienda no debe ser la bodega de Medellín, que la reconciliación excluye)
+ML_OMS_STATUS_NUEVO = os.getenv("ML_OMS_STATUS_NUEVO", "pendiente")
+ML_OMS_STORE_NAME = os.getenv("ML_OMS_STORE_NAME", "Mercado Libre")
+
+# Discrepancias por petición al guardar una corrida
+DISCREPANCIAS_CHUNK_SIZE = int(os.getenv("DISCREPANCIAS_CHUNK_SIZE", "1000"))
+
+# Órdenes por petición al sincronizar ML -> ml_orders
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "200"))
+
+# Caché en disco de archivos TBC ya parseados
+TBC_CACHE_DIR = os.getenv(
+    "TBC_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "meli_reconciliation", "tbc_cache")
+)
+TBC_CACHE_MAX_MB = int(os.getenv("TBC_CACHE_MAX_MB", "200"))
+
+# Procesos para parsear varios archivos TBC a la vez (procesar_archivos_tbc)
+TBC_PARSE_WORKERS = int(os.getenv("TBC_PARSE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+# Caché de la página de reconciliación: segundos que una consulta de órdenes
+# del OMS se comparte entre sesiones (dentro de una sesión las órdenes se
+# conservan hasta "Volver a consultar el OMS"), y combinaciones archivo/fechas guardadas
+RECONCILIACION_CACHE_TTL_SEG = int(os.getenv("RECONCILIACION_CACHE_TTL_SEG", "300"))
+RECONCILIACION_CACHE_ENTRADAS = int(os.getenv("RECONCILIACION_CACHE_ENTRADAS", "8"))
+
+# Motor de la reconciliación en la página: "python" (reconciliar_ml_tbc)
+# o "duckdb" (reconciliation_duckdb, para archivos de varios meses)
+RECONCILIACION_MOTOR = os.getenv("RECONCILIACION_MOTOR", "python").strip().lower()
+
+# Filas por grupo (row group) al exportar una reconciliación a Parquet
+EXPORTACION_FILAS_POR_GRUPO = int(os.getenv("EXPORTACION_FILAS_POR_GRUPO", "50000"))
+
+# Líneas TBC por petición al importar un archivo a tbc_facturas
+TBC_IMPORT_CHUNK_SIZE = int(os.getenv("TBC_IMPORT_CHUNK_SIZE", "2000"))
+
+# Estado de la reconciliación incremental (una corrida previa por archivo TBC)
+RECONCILIACION_ESTADO_DIR = os.getenv(
+    "RECONCILIACION_ESTADO_DIR",
+    os.path.join(tempfile.gettempdir(), "meli_reconciliation", "estado")
+)
+
 # ============================================================================
 # VALIDACIONES
 # ============================================================================
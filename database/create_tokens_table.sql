@@ -15,22 +15,61 @@ CREATE TABLE IF NOT EXISTS ml_tokens (
 -- Índice para búsqueda rápida por user_id
 CREATE INDEX IF NOT EXISTS idx_ml_tokens_user_id ON ml_tokens(user_id);
 
+-- Lease del refresco: solo una sesión a la vez pide un token nuevo a ML
+ALTER TABLE ml_tokens ADD COLUMN IF NOT EXISTS refresh_lease_until TIMESTAMP WITH TIME ZONE;
+
 -- Solo queremos un registro (el más reciente)
--- Podemos usar una función para asegurar esto
+-- Con p_expected_updated_at hace compare-and-swap: solo actualiza si nadie
+-- más guardó un token desde que se leyó; retorna FALSE si perdió la carrera
+DROP FUNCTION IF EXISTS update_ml_token(TEXT, TEXT, BIGINT, TEXT, INTEGER);
+
 CREATE OR REPLACE FUNCTION update_ml_token(
     p_access_token TEXT,
     p_refresh_token TEXT,
     p_user_id BIGINT,
     p_nickname TEXT,
-    p_expires_in INTEGER
-) RETURNS void AS $$
+    p_expires_in INTEGER,
+    p_expected_updated_at TIMESTAMP WITH TIME ZONE DEFAULT NULL
+) RETURNS boolean AS $$
 BEGIN
+    IF p_expected_updated_at IS NOT NULL THEN
+        UPDATE ml_tokens
+        SET access_token = p_access_token,
+            refresh_token = p_refresh_token,
+            user_id = p_user_id,
+            nickname = p_nickname,
+            expires_in = p_expires_in,
+            updated_at = NOW(),
+            refresh_lease_until = NULL
+        WHERE updated_at = p_expected_updated_at;
+        
+        RETURN FOUND;
+    END IF;
+    
     -- Eliminar tokens antiguos
     DELETE FROM ml_tokens;
     
     -- Insertar el nuevo token
     INSERT INTO ml_tokens (access_token, refresh_token, user_id, nickname, expires_in)
     VALUES (p_access_token, p_refresh_token, p_user_id, p_nickname, p_expires_in);
+    
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reclama el refresco del token leído (updated_at) por p_lease_seconds
+-- Retorna FALSE si otra sesión ya lo tiene o si el token ya cambió
+CREATE OR REPLACE FUNCTION claim_ml_token_refresh(
+    p_expected_updated_at TIMESTAMP WITH TIME ZONE,
+    p_lease_seconds INTEGER DEFAULT 30
+) RETURNS boolean AS $$
+BEGIN
+    UPDATE ml_tokens
+    SET refresh_lease_until = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE updated_at = p_expected_updated_at
+      AND (refresh_lease_until IS NULL OR refresh_lease_until < NOW());
+    
+    RETURN FOUND;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -39,3 +78,4 @@ COMMENT ON TABLE ml_tokens IS 'Almacena los tokens de autenticación de Mercado
 COMMENT ON COLUMN ml_tokens.access_token IS 'Token de acceso actual';
 COMMENT ON COLUMN ml_tokens.refresh_token IS 'Token para renovar el access_token';
 COMMENT ON COLUMN ml_tokens.user_id IS 'ID del usuario/vendedor en Mercado Libre';
+COMMENT ON COLUMN ml_tokens.refresh_lease_until IS 'Hasta cuándo una sesión tiene reservado el refresco del token';
@@ -0,0 +1,29 @@
+-- Estadísticas de la página principal en una sola llamada
+-- Ejecuta este SQL en Supabase SQL Editor (después de schema.sql)
+--
+-- Conteos exactos (COUNT) en una sola consulta: una sola ida y vuelta en
+-- vez de una por contador. Las discrepancias pendientes se cuentan con el
+-- índice parcial, sin recorrer las ya resueltas.
+
+-- Índice parcial: las pendientes se cuentan sin recorrer las ya resueltas
+CREATE INDEX IF NOT EXISTS idx_discrepancias_pendientes ON discrepancias(id) WHERE resuelto = FALSE;
+
+-- Versión anterior (contadores estimados con pg_class.reltuples)
+DROP INDEX IF EXISTS idx_ml_orders_con_remision;
+DROP FUNCTION IF EXISTS estimar_filas(regclass);
+
+CREATE OR REPLACE FUNCTION get_estadisticas_generales()
+RETURNS json AS $$
+    SELECT json_build_object(
+        'total_ordenes', o.total,
+        'ordenes_con_remision', o.con_remision,
+        'ordenes_sin_remision', o.total - o.con_remision,
+        'discrepancias_pendientes', (SELECT COUNT(*) FROM discrepancias WHERE resuelto = FALSE)
+    )
+    FROM (
+        SELECT COUNT(*) AS total, COUNT(remision) AS con_remision
+        FROM ml_orders
+    ) o;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_estadisticas_generales() IS 'Contadores de la página principal (órdenes y discrepancias pendientes)';
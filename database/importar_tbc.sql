@@ -0,0 +1,76 @@
+-- Importación de archivos TBC: tabla de staging y reemplazo atómico por contenido
+-- Ejecuta este SQL en Supabase SQL Editor (después de schema.sql)
+
+-- Columnas que trae el parser y faltaban en bases creadas antes
+ALTER TABLE tbc_facturas ADD COLUMN IF NOT EXISTS unidad TEXT;
+ALTER TABLE tbc_facturas ADD COLUMN IF NOT EXISTS valor_total NUMERIC(14,2);
+ALTER TABLE tbc_facturas ALTER COLUMN cantidad TYPE NUMERIC(12,2);
+ALTER TABLE tbc_facturas ALTER COLUMN valor_unitario TYPE NUMERIC(14,2);
+CREATE INDEX IF NOT EXISTS idx_tbc_facturas_archivo ON tbc_facturas(archivo_nombre);
+
+-- Hash SHA-256 del contenido del archivo: identifica la carga. Todos los
+-- exportes de TBC se llaman RESUXDOC.XLS, así que archivo_nombre es solo
+-- informativo y no sirve para decidir qué líneas reemplazar.
+ALTER TABLE tbc_facturas ADD COLUMN IF NOT EXISTS hash_archivo TEXT;
+CREATE INDEX IF NOT EXISTS idx_tbc_facturas_hash ON tbc_facturas(hash_archivo);
+
+-- Líneas en carga: se suben por bloques con un carga_id y luego se pasan
+-- de una vez a tbc_facturas con swap_tbc_facturas
+CREATE UNLOGGED TABLE IF NOT EXISTS tbc_facturas_staging (
+    carga_id TEXT NOT NULL,
+    evento TEXT,
+    remision TEXT NOT NULL,
+    fecha DATE,
+    producto_codigo TEXT,
+    producto_nombre TEXT,
+    unidad TEXT,
+    valor_unitario NUMERIC(14,2),
+    cantidad NUMERIC(12,2),
+    valor_total NUMERIC(14,2),
+    archivo_nombre TEXT,
+    hash_archivo TEXT,
+    creado TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE tbc_facturas_staging ADD COLUMN IF NOT EXISTS hash_archivo TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_tbc_staging_carga ON tbc_facturas_staging(carga_id);
+
+-- Versión anterior (reemplazaba por archivo_nombre)
+DROP FUNCTION IF EXISTS swap_tbc_facturas(TEXT, TEXT);
+
+-- Reemplaza las líneas de una carga anterior del mismo contenido (mismo
+-- hash_archivo) por las de esta carga, todo o nada: volver a importar el
+-- mismo archivo no duplica líneas y las cargas de otros días no se tocan.
+-- Retorna la cantidad de líneas insertadas
+CREATE OR REPLACE FUNCTION swap_tbc_facturas(
+    p_carga_id TEXT,
+    p_hash_archivo TEXT,
+    p_archivo_nombre TEXT
+) RETURNS integer AS $$
+DECLARE
+    v_insertadas integer;
+BEGIN
+    DELETE FROM tbc_facturas WHERE hash_archivo = p_hash_archivo;
+    
+    INSERT INTO tbc_facturas (
+        evento, remision, fecha, producto_codigo, producto_nombre,
+        unidad, valor_unitario, cantidad, valor_total, archivo_nombre, hash_archivo
+    )
+    SELECT
+        evento, remision, fecha, producto_codigo, producto_nombre,
+        unidad, valor_unitario, cantidad, valor_total, p_archivo_nombre, p_hash_archivo
+    FROM tbc_facturas_staging
+    WHERE carga_id = p_carga_id;
+    
+    GET DIAGNOSTICS v_insertadas = ROW_COUNT;
+    
+    -- Limpiar esta carga y las abandonadas (cargas que fallaron a medias)
+    DELETE FROM tbc_facturas_staging
+    WHERE carga_id = p_carga_id OR creado < NOW() - INTERVAL '1 day';
+    
+    RETURN v_insertadas;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE tbc_facturas_staging IS 'Líneas TBC en carga antes de reemplazar las del mismo contenido en tbc_facturas';
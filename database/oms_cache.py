@@ -0,0 +1,353 @@
+"""
+Caché local (SQLite) de las órdenes ML del OMS
+
+La primera vez descarga todas las órdenes del canal mercadolibre (todo el
+histórico, incluidas canceladas y Medellín, que el delta necesita para
+retirarlas); después solo pide al OMS las filas con updated_at posterior a
+la marca de la última sincronización. Las consultas de supabase_client
+(rango de fechas, remisión, estado) se resuelven aquí con índices, sin
+esperar al OMS.
+
+Está apagada por defecto (OMS_CACHE=1 para activarla): solo conviene con
+disco persistente; en un contenedor efímero cada reinicio repite la carga
+completa.
+
+Las filas borradas en el OMS no se detectan con el delta: usar
+recargar_completo() si hace falta.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, Iterable, Iterator
+
+import config
+
+CACHE_VERSION = "1"
+
+# Columnas del OMS que se guardan (los alias JSON van como columnas planas)
+_COLUMNAS = (
+    'order_id', 'pack_id', 'shipping_id', 'order_date', 'total_amount', 'items',
+    'receiver_name', 'customer_nickname', 'remision_tbc', 'fecha_remision_tbc',
+    'status', 'store_name', 'updated_at'
+)
+
+_SELECT_OMS = (
+    "order_id,pack_id,shipping_id,order_date,total_amount,items,"
+    "receiver_name:shipping_address->>receiverName,"
+    "customer_nickname:customer->>nickname,"
+    "remision_tbc,fecha_remision_tbc,status,store_name,updated_at"
+)
+
+# Mismos filtros que aplica supabase_client a las órdenes vigentes
+# (en SQL, NULL no pasa neq / not ilike)
+_VIGENTE = (
+    "status IS NOT NULL AND status != 'cancelado' "
+    "AND store_name IS NOT NULL AND store_name NOT LIKE '%medell%'"
+)
+
+_lock_sync = threading.Lock()
+
+
+# ============================================================================
+# BASE LOCAL
+# ============================================================================
+
+def _ruta() -> str:
+    os.makedirs(os.path.dirname(config.OMS_CACHE_PATH) or '.', exist_ok=True)
+    return config.OMS_CACHE_PATH
+
+
+def _conectar() -> sqlite3.Connection:
+    conn = sqlite3.connect(_ruta(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (
+            clave TEXT PRIMARY KEY,
+            valor TEXT
+        );
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id TEXT PRIMARY KEY,
+            pack_id TEXT,
+            shipping_id TEXT,
+            order_date TEXT,
+            order_date_utc TEXT,
+            total_amount REAL,
+            items TEXT,
+            receiver_name TEXT,
+            customer_nickname TEXT,
+            remision_tbc TEXT,
+            fecha_remision_tbc TEXT,
+            status TEXT,
+            store_name TEXT,
+            updated_at TEXT,
+            updated_at_utc TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_orders_fecha ON orders(order_date_utc);
+        CREATE INDEX IF NOT EXISTS idx_orders_remision ON orders(fecha_remision_tbc, remision_tbc);
+        CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+        CREATE INDEX IF NOT EXISTS idx_orders_updated ON orders(updated_at_utc);
+    """)
+
+    version = conn.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()
+    if not version or version[0] != CACHE_VERSION:
+        conn.execute("DELETE FROM orders")
+        conn.execute("DELETE FROM meta")
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (CACHE_VERSION,))
+        conn.commit()
+
+    return conn
+
+
+def _utc(valor: Optional[str]) -> Optional[str]:
+    """
+    Fecha ISO (con o sin zona, o solo fecha) -> texto UTC de ancho fijo,
+    comparable como string. Sin zona se toma como UTC, igual que Postgres.
+    """
+    if not valor:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    except ValueError:
+        return str(valor)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+
+def _meta(conn: sqlite3.Connection, clave: str) -> Optional[str]:
+    fila = conn.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+    return fila[0] if fila else None
+
+
+def _set_meta(conn: sqlite3.Connection, clave: str, valor: str):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (clave, valor))
+
+
+def _guardar_filas(conn: sqlite3.Connection, filas: List[Dict[str, Any]]):
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO orders VALUES
+            (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                str(row['order_id']), row.get('pack_id'), row.get('shipping_id'),
+                row.get('order_date'), _utc(row.get('order_date')),
+                row.get('total_amount'), json.dumps(row.get('items') or []),
+                row.get('receiver_name'), row.get('customer_nickname'),
+                row.get('remision_tbc'), row.get('fecha_remision_tbc'),
+                row.get('status'), row.get('store_name'),
+                row.get('updated_at'), _utc(row.get('updated_at'))
+            )
+            for row in filas
+        ]
+    )
+
+
+# ============================================================================
+# SINCRONIZACIÓN CON EL OMS
+# ============================================================================
+
+def sincronizar(forzar: bool = False) -> Dict[str, Any]:
+    """
+    Trae del OMS las órdenes nuevas o modificadas desde la última sincronización
+
+    No consulta el OMS si la última sincronización tiene menos de
+    OMS_CACHE_TTL_SEG (salvo forzar=True). La primera vez descarga todo.
+
+    Returns:
+        {"success": bool, "filas": filas recibidas, "completa": bool, "error": ...}
+    """
+    from database import supabase_client as db
+
+    with _lock_sync:
+        conn = _conectar()
+        try:
+            ultima = _meta(conn, 'ultima_sync')
+            if not forzar and ultima and time.time() - float(ultima) < config.OMS_CACHE_TTL_SEG:
+                return {"success": True, "filas": 0, "completa": False}
+
+            marca = _meta(conn, 'high_water')
+            completa = marca is None
+
+            oms = db._get_oms_client()
+            desde = None
+            if marca:
+                # Margen para filas confirmadas tarde con un updated_at anterior
+                desde = datetime.fromisoformat(marca) - timedelta(seconds=config.OMS_CACHE_MARGEN_SEG)
+
+            def consultar(cursor, n):
+                query = (
+                    oms.table("orders").select(_SELECT_OMS)
+                    .eq("channel", "mercadolibre")
+                    .not_.is_("updated_at", "null")
+                )
+                if desde:
+                    query = query.gte("updated_at", desde.isoformat() + "+00:00")
+                if cursor:
+                    query = query.or_(db._condicion_keyset("updated_at", cursor, desc=False))
+                query = query.order("updated_at").order("order_id").limit(n)
+                return query.execute().data or []
+
+            inicio = time.time()
+            total = 0
+
+            # Keyset ascendente por (updated_at, order_id): la marca solo avanza
+            # hasta la última fila de una página ya guardada, así que un corte
+            # a mitad de camino retoma desde ahí y nada queda sin leer
+            for filas in db._paginas_keyset(consultar, "updated_at", config.OMS_PAGE_SIZE):
+                _guardar_filas(conn, filas)
+                _set_meta(conn, 'high_water', _utc(filas[-1]['updated_at']))
+                conn.commit()
+                total += len(filas)
+
+            _set_meta(conn, 'ultima_sync', str(inicio))
+            conn.commit()
+
+            print(f"[INFO] Caché OMS: {total} órdenes {'(carga completa)' if completa else 'actualizadas'}")
+            return {"success": True, "filas": total, "completa": completa}
+
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERROR] Caché OMS: no se pudo sincronizar: {e}")
+            return {"success": False, "filas": 0, "completa": False, "error": str(e)}
+        finally:
+            conn.close()
+
+
+def recargar_completo() -> Dict[str, Any]:
+    """Vacía el caché y lo vuelve a descargar entero"""
+    with _lock_sync:
+        conn = _conectar()
+        try:
+            conn.execute("DELETE FROM orders")
+            conn.execute("DELETE FROM meta WHERE clave != 'version'")
+            conn.commit()
+        finally:
+            conn.close()
+
+    return sincronizar(forzar=True)
+
+
+def estado() -> Dict[str, Any]:
+    """Órdenes en caché, marca de agua y hora de la última sincronización"""
+    conn = _conectar()
+    try:
+        ultima = _meta(conn, 'ultima_sync')
+        return {
+            'ordenes': conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0],
+            'high_water': _meta(conn, 'high_water'),
+            'ultima_sync': datetime.fromtimestamp(float(ultima), timezone.utc).isoformat() if ultima else None,
+        }
+    finally:
+        conn.close()
+
+
+# ============================================================================
+# CONSULTAS LOCALES
+# ============================================================================
+
+def _consultar(condiciones: List[str], params: List[Any], limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Filas con el mismo formato que devuelve el select del OMS (ver _map_oms_order)"""
+    sql = f"SELECT {', '.join(_COLUMNAS)} FROM orders"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(f"({c})" for c in condiciones)
+    sql += " ORDER BY order_date_utc DESC, order_id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [limit]
+
+    conn = _conectar()
+    try:
+        for fila in conn.execute(sql, params):
+            row = dict(fila)
+            row['items'] = json.loads(row['items']) if row['items'] else []
+            yield row
+    finally:
+        conn.close()
+
+
+def _en(columna: str, valores: Iterable[Any], params: List[Any]) -> str:
+    valores = list(valores)
+    params.extend(valores)
+    return f"{columna} IN ({', '.join('?' * len(valores))})"
+
+
+def filas_ml_orders(
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    con_remision: Optional[bool] = None,
+    fechas_remision: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Equivalente local del filtro de iterar_ml_orders"""
+    condiciones = [_VIGENTE]
+    params: List[Any] = []
+
+    if fecha_desde:
+        condiciones.append("order_date_utc >= ?")
+        params.append(_utc(fecha_desde))
+
+    if fecha_hasta:
+        condiciones.append("order_date_utc <= ?")
+        params.append(_utc(fecha_hasta))
+
+    if con_remision is True:
+        condiciones.append("remision_tbc IS NOT NULL")
+    elif con_remision is False:
+        condiciones.append("remision_tbc IS NULL")
+
+    if fechas_remision is not None:
+        condiciones.append(_en("fecha_remision_tbc", fechas_remision, params))
+
+    return _consultar(condiciones, params, limit)
+
+
+def filas_reconciliacion(
+    fechas_remision: Iterable[str],
+    corte_sin_remision: Optional[datetime] = None,
+    fecha_desde: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Equivalente local de la consulta de get_ml_orders_reconciliacion"""
+    params: List[Any] = []
+    particiones = []
+
+    fechas = list(fechas_remision)
+    if fechas:
+        particiones.append(f"remision_tbc IS NOT NULL AND {_en('fecha_remision_tbc', fechas, params)}")
+
+    if corte_sin_remision:
+        particiones.append("remision_tbc IS NULL AND order_date_utc < ?")
+        params.append(_utc(corte_sin_remision.isoformat()))
+
+    if not particiones:
+        return iter(())
+
+    condiciones = [_VIGENTE, " OR ".join(f"({p})" for p in particiones)]
+
+    if fecha_desde:
+        condiciones.append("order_date_utc >= ?")
+        params.append(_utc(fecha_desde))
+
+    return _consultar(condiciones, params)
+
+
+def filas_actualizadas(
+    actualizado_desde: str,
+    fecha_desde: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Equivalente local de get_ml_orders_actualizadas (incluye no vigentes)"""
+    condiciones = ["updated_at_utc >= ?"]
+    params: List[Any] = [_utc(actualizado_desde)]
+
+    if fecha_desde:
+        condiciones.append("order_date_utc >= ?")
+        params.append(_utc(fecha_desde))
+
+    return _consultar(condiciones, params, limit)
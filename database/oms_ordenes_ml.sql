@@ -0,0 +1,43 @@
+-- Escritura de órdenes de Mercado Libre (webhook) en `orders` del OMS
+-- Ejecuta este SQL en el SQL Editor del proyecto Supabase del OMS, después
+-- de database/oms_ordenes_ml_indice.sql: ON CONFLICT (channel, order_id)
+-- necesita el índice único idx_orders_channel_order_id
+
+-- Inserta las órdenes nuevas completas (canal, estado y tienda incluidos
+-- para que pasen los filtros de la reconciliación). En las que ya existen
+-- solo toca lo que es de ML: el total y la cancelación; items, remisión y
+-- el estado del flujo del OMS se conservan.
+--
+-- p_ordenes: [{"order_id", "pack_id", "shipping_id", "order_date",
+--              "total_amount", "items", "ml_status"}, ...]
+-- Retorna la cantidad de filas insertadas o actualizadas
+CREATE OR REPLACE FUNCTION upsert_ordenes_ml(
+    p_ordenes JSONB,
+    p_status_nuevo TEXT,
+    p_store_name TEXT
+) RETURNS integer AS $$
+    WITH escritas AS (
+        INSERT INTO orders (
+            channel, order_id, pack_id, shipping_id, order_date,
+            total_amount, items, status, store_name, updated_at
+        )
+        SELECT
+            'mercadolibre',
+            o->>'order_id',
+            o->>'pack_id',
+            o->>'shipping_id',
+            o->>'order_date',
+            o->>'total_amount',
+            o->'items',
+            CASE WHEN o->>'ml_status' = 'cancelled' THEN 'cancelado' ELSE p_status_nuevo END,
+            p_store_name,
+            NOW()
+        FROM jsonb_array_elements(p_ordenes) AS o
+        ON CONFLICT (channel, order_id) DO UPDATE SET
+            total_amount = EXCLUDED.total_amount,
+            status = CASE WHEN EXCLUDED.status = 'cancelado' THEN 'cancelado' ELSE orders.status END,
+            updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT COUNT(*)::integer FROM escritas;
+$$ LANGUAGE sql;
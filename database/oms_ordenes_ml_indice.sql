@@ -0,0 +1,27 @@
+-- Índice único (channel, order_id) en `orders` del OMS
+-- Ejecuta este SQL en el SQL Editor del proyecto Supabase del OMS ANTES de
+-- database/oms_ordenes_ml.sql (el ON CONFLICT de upsert_ordenes_ml lo necesita)
+--
+-- `orders` es la tabla de producción del OMS y ya tiene datos: el índice no
+-- se puede crear si hay órdenes repetidas, y un CREATE INDEX normal bloquea
+-- las escrituras mientras se construye. Por eso va en dos pasos.
+
+-- Paso 1: buscar órdenes repetidas por canal. Debe devolver 0 filas; si
+-- devuelve alguna, decidir con el equipo del OMS cuál fila se conserva
+-- (normalmente la de updated_at más reciente) y borrar o corregir las demás
+-- antes de seguir.
+SELECT channel, order_id, COUNT(*) AS filas, MAX(updated_at) AS ultima_actualizacion
+FROM orders
+GROUP BY channel, order_id
+HAVING COUNT(*) > 1
+ORDER BY filas DESC;
+
+-- Paso 2: crear el índice sin bloquear las escrituras. CONCURRENTLY no
+-- puede ir dentro de una transacción: ejecutar esta sentencia sola.
+-- La tabla es multicanal: un order_id de ML solo choca con otro de ML.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_channel_order_id ON orders(channel, order_id);
+
+-- Si el paso 2 falla (p. ej. entró un duplicado mientras se construía) el
+-- índice queda marcado como inválido. Verificar con:
+--   SELECT indisvalid FROM pg_index WHERE indexrelid = 'idx_orders_channel_order_id'::regclass;
+-- y si es false: DROP INDEX CONCURRENTLY idx_orders_channel_order_id; volver al paso 1.
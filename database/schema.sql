@@ -30,9 +30,12 @@ CREATE TABLE IF NOT EXISTS tbc_facturas (
     fecha DATE,                              -- Fecha de factura
     producto_codigo TEXT,                    -- SKU del producto
     producto_nombre TEXT,                    -- Descripción del producto
-    valor_unitario NUMERIC(10,2),           -- VALUNI
-    cantidad INTEGER,                        -- CANTID
-    archivo_nombre TEXT,                     -- Nombre del archivo cargado
+    unidad TEXT,                             -- UNIMED
+    valor_unitario NUMERIC(14,2),           -- VALUNI
+    cantidad NUMERIC(12,2),                  -- CANTID
+    valor_total NUMERIC(14,2),              -- VALTOT
+    archivo_nombre TEXT,                     -- Nombre del archivo cargado (informativo)
+    hash_archivo TEXT,                       -- SHA-256 del contenido (identifica la carga)
     fecha_carga TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -46,9 +49,17 @@ CREATE TABLE IF NOT EXISTS discrepancias (
     fecha_deteccion TIMESTAMPTZ DEFAULT NOW(),
     resuelto BOOLEAN DEFAULT FALSE,
     fecha_resolucion TIMESTAMPTZ,
-    notas_resolucion TEXT
+    notas_resolucion TEXT,
+    clave TEXT UNIQUE,                       -- Hash de (alcance, tipo, remisión): evita duplicados al repetir una corrida
+    alcance TEXT,                            -- Corrida de origen (hash del archivo TBC)
+    ultima_deteccion TIMESTAMPTZ
 );
 
+-- Para bases creadas antes de guardar corridas completas
+ALTER TABLE discrepancias ADD COLUMN IF NOT EXISTS clave TEXT UNIQUE;
+ALTER TABLE discrepancias ADD COLUMN IF NOT EXISTS alcance TEXT;
+ALTER TABLE discrepancias ADD COLUMN IF NOT EXISTS ultima_deteccion TIMESTAMPTZ;
+
 -- ============================================================================
 -- ÍNDICES para mejorar performance de queries
 -- ============================================================================
@@ -59,9 +70,12 @@ CREATE INDEX IF NOT EXISTS idx_ml_orders_order_id ON ml_orders(order_id);
 
 CREATE INDEX IF NOT EXISTS idx_tbc_facturas_remision ON tbc_facturas(remision);
 CREATE INDEX IF NOT EXISTS idx_tbc_facturas_fecha ON tbc_facturas(fecha);
+CREATE INDEX IF NOT EXISTS idx_tbc_facturas_archivo ON tbc_facturas(archivo_nombre);
+CREATE INDEX IF NOT EXISTS idx_tbc_facturas_hash ON tbc_facturas(hash_archivo);
 
 CREATE INDEX IF NOT EXISTS idx_discrepancias_remision ON discrepancias(remision);
 CREATE INDEX IF NOT EXISTS idx_discrepancias_resuelto ON discrepancias(resuelto);
+CREATE INDEX IF NOT EXISTS idx_discrepancias_alcance ON discrepancias(alcance, resuelto);
 
 -- ============================================================================
 -- TRIGGER: Actualizar updated_at automáticamente
@@ -3,9 +3,15 @@ Cliente de Supabase para interactuar con la base de datos
 """
 
 from supabase import create_client, Client
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable, Iterator, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
 import json
+import math
+import queue
+import threading
+import uuid
 import config
 
 # ============================================================================
@@ -34,10 +40,52 @@ def _get_oms_client() -> Client:
     return _oms_client
 
 
-def _map_oms_order(row: Dict[str, Any]) -> Dict[str, Any]:
+# ============================================================================
+# PROYECCIÓN DE COLUMNAS DEL OMS
+# ============================================================================
+
+# Expresión de select (PostgREST) del OMS para cada campo del formato ml_orders.
+# Los datos del comprador se leen como rutas JSON para no traer los objetos completos.
+# `items` es un arreglo JSON: PostgREST no proyecta claves por elemento, así que va completo.
+COLUMNAS_OMS_POR_CAMPO = {
+    'order_id': 'order_id',
+    'pack_id': 'pack_id',
+    'shipping_id': 'shipping_id',
+    'fecha_orden': 'order_date',
+    'total': 'total_amount',
+    'productos': 'items',
+    'buyer_name': 'receiver_name:shipping_address->>receiverName',
+    'buyer_nickname': 'customer_nickname:customer->>nickname',
+    'remision': 'remision_tbc',
+    'fecha_remision': 'fecha_remision_tbc',
+}
+
+# Campos que necesita cada consumidor
+CAMPOS_DETALLE = tuple(COLUMNAS_OMS_POR_CAMPO)
+CAMPOS_RECONCILIACION = (
+    'order_id', 'pack_id', 'fecha_orden', 'total', 'productos', 'remision', 'fecha_remision'
+)
+
+
+def _select_oms(campos: Optional[Iterable[str]] = None, extra: Iterable[str] = ()) -> str:
+    """Arma la lista de columnas del select para los campos pedidos"""
+    campos = CAMPOS_DETALLE if campos is None else campos
+
+    desconocidos = [c for c in campos if c not in COLUMNAS_OMS_POR_CAMPO]
+    if desconocidos:
+        raise ValueError(f"Campos de orden desconocidos: {', '.join(desconocidos)}")
+
+    # order_id siempre se incluye (identifica la orden entre páginas)
+    columnas = ['order_id'] + [COLUMNAS_OMS_POR_CAMPO[c] for c in campos] + list(extra)
+    return ','.join(dict.fromkeys(columnas))
+
+
+def _map_oms_order(row: Dict[str, Any], campos: Optional[Iterable[str]] = None) -> Dict[str, Any]:
     """
     Convierte una fila de `orders` del OMS al formato que espera
     el motor de reconciliación (mismo esquema que ml_orders).
+    
+    Si se indican `campos`, los que no se pidieron quedan en None.
     """
     customer = row.get('customer') or {}
     shipping = row.get('shipping_address') or {}
@@ -53,20 +101,27 @@ def _map_oms_order(row: Dict[str, Any]) -> Dict[str, Any]:
         for item in items
     ]
 
-    return {
+    orden = {
         'order_id': row.get('order_id'),
         'pack_id': row.get('pack_id'),
         'shipping_id': row.get('shipping_id'),
         'fecha_orden': row.get('order_date'),
         'total': row.get('total_amount', 0),
         'productos': json.dumps(productos),
-        'buyer_name': shipping.get('receiverName'),
-        'buyer_nickname': customer.get('nickname'),
+        'buyer_name': row['receiver_name'] if 'receiver_name' in row else shipping.get('receiverName'),
+        'buyer_nickname': row['customer_nickname'] if 'customer_nickname' in row else customer.get('nickname'),
         'remision': row.get('remision_tbc'),
         'fecha_remision': row.get('fecha_remision_tbc'),
         'usuario': None,
     }
 
+    if campos is not None:
+        for campo in COLUMNAS_OMS_POR_CAMPO:
+            if campo not in campos and campo != 'order_id':
+                orden[campo] = None
+
+    return orden
+
 # ============================================================================
 # FUNCIONES PARA ML_ORDERS
 # ============================================================================
@@ -80,6 +135,59 @@ def insert_ml_order(order_data: Dict[str, Any]) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
+def insert_ml_orders_bulk(orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Inserta varias órdenes en una sola petición.
+    Las que ya existen (mismo order_id) se ignoran: no se pisan remisiones asignadas.
+    
+    Returns:
+        {"success": True, "data": filas efectivamente insertadas} o {"success": False, "error": ...}
+    """
+    try:
+        response = (
+            supabase.table("ml_orders")
+            .upsert(orders, on_conflict="order_id", ignore_duplicates=True)
+            .execute()
+        )
+        return {"success": True, "data": response.data or []}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+# Campos que manda el webhook por orden (ver ml_api.transform_order_for_oms)
+COLUMNAS_OMS_ML = (
+    'order_id', 'pack_id', 'shipping_id', 'order_date', 'total_amount', 'items', 'ml_status'
+)
+
+
+def upsert_oms_orders_ml(orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Escribe órdenes de ML en `orders` del OMS en una sola petición
+    (función upsert_ordenes_ml de database/oms_ordenes_ml.sql)
+    
+    Las nuevas se insertan con channel='mercadolibre', estado y tienda; en
+    las existentes solo se actualizan el total y la cancelación, el resto
+    (items, remisión, estado del OMS) no se toca.
+    
+    Returns:
+        {"success": True, "count": filas escritas} o {"success": False, "error": ...}
+    """
+    if not orders:
+        return {"success": True, "count": 0}
+    
+    filas = [{col: order.get(col) for col in COLUMNAS_OMS_ML} for order in orders]
+    
+    try:
+        response = _get_oms_client().rpc("upsert_ordenes_ml", {
+            "p_ordenes": filas,
+            "p_status_nuevo": config.ML_OMS_STATUS_NUEVO,
+            "p_store_name": config.ML_OMS_STORE_NAME
+        }).execute()
+        return {"success": True, "count": response.data}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 def update_ml_order_remision(order_id: str, remision: str, fecha_remision: str) -> Dict[str, Any]:
     """Actualiza la remisión de una orden de ML"""
     try:
@@ -94,23 +202,223 @@ def update_ml_order_remision(order_id: str, remision: str, fecha_remision: str)
         return {"success": False, "error": str(e)}
 
 
-def get_ml_orders(
+def _con_columnas(columnas: str, requeridas: Iterable[str]) -> str:
+    """Agrega al select las columnas que usa la paginación si no están"""
+    if columnas == "*":
+        return columnas
+    presentes = columnas.split(',')
+    return ','.join(presentes + [c for c in requeridas if c not in presentes])
+
+
+def _condicion_keyset(columna: str, cursor: Tuple[Any, Any], desc: bool) -> str:
+    """Filas posteriores al cursor (valor de `columna`, order_id) en sintaxis `or` de PostgREST"""
+    valor, order_id = cursor
+    op = "lt" if desc else "gt"
+    return f'{columna}.{op}."{valor}",and({columna}.eq."{valor}",order_id.{op}."{order_id}")'
+
+
+def _paginas_keyset(
+    consultar: Callable[[Optional[Tuple[Any, Any]], int], List[Dict[str, Any]]],
+    columna: str,
+    page_size: int
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Páginas de una consulta paginada por keyset sobre (columna, order_id)
+    
+    `consultar(cursor, n)` trae hasta n filas posteriores al cursor (None =
+    desde el principio) ordenadas por (columna, order_id). Se sigue hasta una
+    página vacía: si PostgREST recorta la respuesta (max-rows) por debajo de
+    page_size no se pierde nada. Insertar o modificar filas durante el
+    recorrido no desplaza las páginas, como sí pasa con offset.
+    """
+    cursor = None
+    while True:
+        filas = consultar(cursor, page_size)
+        if not filas:
+            return
+        yield filas
+        cursor = (filas[-1][columna], filas[-1]['order_id'])
+
+
+def _tramos_order_date(oms, aplicar_filtros: Callable, corte: str, partes: int) -> List[Tuple[Optional[str], str]]:
+    """
+    Divide (orden más antigua del filtro, corte] en `partes` tramos de igual
+    duración, del más reciente al más antiguo: (desde exclusivo, hasta inclusivo).
+    El último no tiene límite inferior. [] si el filtro no tiene órdenes.
+    """
+    query = aplicar_filtros(oms.table("orders").select("order_date")).lte("order_date", corte)
+    primera = query.order("order_date").limit(1).execute().data
+    if not primera:
+        return []
+
+    inicio = datetime.fromisoformat(primera[0]['order_date'].replace('Z', '+00:00'))
+    fin = datetime.fromisoformat(corte)
+    if inicio.tzinfo is None:
+        inicio = inicio.replace(tzinfo=timezone.utc)
+
+    paso = (fin - inicio) / partes
+    limites = [corte] + [(fin - paso * k).isoformat() for k in range(1, partes)] + [None]
+    return list(zip(limites[1:], limites[:-1]))
+
+
+def _iterar_filas_oms(
+    aplicar_filtros: Callable,
+    columnas: str = "*",
+    limit: Optional[int] = None,
+    page_size: Optional[int] = None,
+    max_workers: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Itera las filas crudas de `orders` del OMS (order_date descendente)
+    paginando por keyset sobre (order_date, order_id).
+    
+    Sin limit, el rango de fechas se parte en max_workers tramos que se
+    recorren en paralelo (un hilo y a lo sumo una petición en curso por
+    tramo); cada tramo deja como máximo dos páginas en espera, así que la
+    memoria no crece con el tamaño del resultado. Las filas se entregan en
+    orden a medida que llegan. Las órdenes creadas durante la descarga no se
+    mezclan porque la consulta queda acotada a order_date <= momento de inicio.
+    
+    Args:
+        aplicar_filtros: Función que recibe el query builder y le agrega filtros
+        columnas: Lista de columnas del select (ver _select_oms)
+        limit: Máximo de filas a devolver (None = todas)
+        page_size: Filas por página (default: config.OMS_PAGE_SIZE)
+        max_workers: Tramos simultáneos (default: config.OMS_FETCH_WORKERS)
+    """
+    oms = _get_oms_client()
+    page_size = page_size or config.OMS_PAGE_SIZE
+    max_workers = max_workers or config.OMS_FETCH_WORKERS
+    corte = datetime.now(timezone.utc).isoformat()
+    columnas = _con_columnas(columnas, ('order_id', 'order_date'))
+
+    def paginas(desde: Optional[str], hasta: str, tope: int):
+        def consultar(cursor, n):
+            query = aplicar_filtros(oms.table("orders").select(columnas)).lte("order_date", hasta)
+            if desde:
+                query = query.gt("order_date", desde)
+            if cursor:
+                query = query.or_(_condicion_keyset("order_date", cursor, desc=True))
+            query = (
+                query.order("order_date", desc=True)
+                .order("order_id", desc=True)  # desempate estable entre páginas
+                .limit(n)
+            )
+            return query.execute().data or []
+
+        return _paginas_keyset(consultar, "order_date", tope)
+
+    if limit is not None:
+        # Una fila de más para avisar si el filtro tenía más órdenes que limit
+        entregadas = 0
+        for filas in paginas(None, corte, min(page_size, limit + 1)):
+            for row in filas:
+                if entregadas == limit:
+                    print(f"[WARN] OMS: el filtro tiene más de {limit} órdenes, solo se devuelven {limit} (limit={limit})")
+                    return
+                entregadas += 1
+                yield row
+        return
+
+    tramos = _tramos_order_date(oms, aplicar_filtros, corte, max_workers) if max_workers > 1 else [(None, corte)]
+    if len(tramos) == 1:
+        for filas in paginas(*tramos[0], page_size):
+            yield from filas
+        return
+
+    detener = threading.Event()
+    colas = [queue.Queue(maxsize=2) for _ in tramos]
+
+    def poner(cola, item) -> bool:
+        while not detener.is_set():
+            try:
+                cola.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producir(cola, desde, hasta):
+        try:
+            for filas in paginas(desde, hasta, page_size):
+                if not poner(cola, filas):
+                    return
+            poner(cola, None)
+        except Exception as e:
+            poner(cola, e)
+
+    with ThreadPoolExecutor(max_workers=len(tramos)) as pool:
+        for cola, (desde, hasta) in zip(colas, tramos):
+            pool.submit(producir, cola, desde, hasta)
+        try:
+            for cola in colas:
+                while True:
+                    item = cola.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield from item
+        finally:
+            # Si el consumidor se detiene (o hay error) los demás tramos terminan
+            detener.set()
+
+
+def _filas_cache(consulta: Callable) -> Optional[Iterator[Dict[str, Any]]]:
+    """
+    Filas desde la caché local del OMS (database/oms_cache.py) si está
+    habilitada; la sincroniza antes (solo el delta). None = consultar el OMS.
+    """
+    if not config.OMS_CACHE_HABILITADO:
+        return None
+
+    from database import oms_cache
+
+    if not oms_cache.sincronizar()["success"]:
+        return None
+    return consulta(oms_cache)
+
+
+def _filtrar_fechas_remision(query, fechas: set):
+    """
+    Filtra fecha_remision_tbc en el servidor: con `in` si son pocas fechas,
+    o con el rango [mínima, máxima] si la lista no cabe en la URL
+    """
+    if len(fechas) <= config.OMS_MAX_FECHAS_IN:
+        return query.in_("fecha_remision_tbc", sorted(fechas))
+
+    return query.gte("fecha_remision_tbc", min(fechas)).lte("fecha_remision_tbc", max(fechas))
+
+
+def _condicion_fechas_remision(fechas: set) -> str:
+    """Mismo filtro que _filtrar_fechas_remision, en sintaxis de `or`/`and` de PostgREST"""
+    if len(fechas) <= config.OMS_MAX_FECHAS_IN:
+        return f"fecha_remision_tbc.in.({','.join(sorted(fechas))})"
+
+    return f"fecha_remision_tbc.gte.{min(fechas)},fecha_remision_tbc.lte.{max(fechas)}"
+
+
+def iterar_ml_orders(
     fecha_desde: Optional[str] = None,
     fecha_hasta: Optional[str] = None,
     con_remision: Optional[bool] = None,
-    limit: int = 50
-) -> List[Dict[str, Any]]:
+    limit: Optional[int] = None,
+    campos: Optional[Iterable[str]] = None,
+    fechas_remision: Optional[Iterable[str]] = None
+) -> Iterator[Dict[str, Any]]:
     """
-    Obtiene órdenes ML desde el OMS (fuente de verdad).
-    Devuelve los datos mapeados al formato histórico de ml_orders para
-    mantener compatibilidad con el motor de reconciliación.
+    Igual que get_ml_orders pero entrega las órdenes (ya mapeadas) como
+    generador, página a página. Los errores de red se propagan.
     """
-    try:
-        oms = _get_oms_client()
+    campos = CAMPOS_DETALLE if campos is None else tuple(campos)
+    fechas = set(fechas_remision) if fechas_remision is not None else None
+
+    if fechas is not None and not fechas:
+        return
+
+    def aplicar_filtros(query):
         query = (
-            oms.table("orders")
-            .select("*")
-            .eq("channel", "mercadolibre")
+            query.eq("channel", "mercadolibre")
             .neq("status", "cancelado")
             .not_.ilike("store_name", "%medell%")  # Excluir bodega Medellín
         )
@@ -126,13 +434,188 @@ def get_ml_orders(
         elif con_remision is False:
             query = query.is_("remision_tbc", "null")
 
-        query = query.order("order_date", desc=True).limit(limit)
+        if fechas is not None:
+            query = _filtrar_fechas_remision(query, fechas)
 
-        response = query.execute()
-        return [_map_oms_order(row) for row in (response.data or [])]
+        return query
+
+    filas = _filas_cache(
+        lambda cache: cache.filas_ml_orders(fecha_desde, fecha_hasta, con_remision, fechas, limit)
+    )
+    if filas is None:
+        filas = _iterar_filas_oms(aplicar_filtros, _select_oms(campos), limit=limit)
+
+    for row in filas:
+        # Con muchas fechas el OMS filtra por rango; aquí se descartan las intermedias
+        if fechas is not None and row.get('fecha_remision_tbc') not in fechas:
+            continue
+        yield _map_oms_order(row, campos)
+
+
+def get_ml_orders(
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    con_remision: Optional[bool] = None,
+    limit: Optional[int] = 50,
+    campos: Optional[Iterable[str]] = None,
+    fechas_remision: Optional[Iterable[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Obtiene órdenes ML desde el OMS (fuente de verdad).
+    Devuelve los datos mapeados al formato histórico de ml_orders para
+    mantener compatibilidad con el motor de reconciliación.
+    
+    Con limit=None trae todas las órdenes del filtro (paginando).
+    Si OMS_CACHE está habilitado se resuelve en la caché local (oms_cache),
+    que antes trae del OMS solo las filas modificadas.
+    `campos` limita las columnas pedidas al OMS (ver CAMPOS_RECONCILIACION,
+    CAMPOS_DETALLE); por defecto CAMPOS_DETALLE.
+    `fechas_remision` limita a órdenes cuya fecha_remision_tbc esté en ese
+    conjunto (filtrado en el OMS).
+    """
+    try:
+        return list(iterar_ml_orders(
+            fecha_desde, fecha_hasta, con_remision, limit, campos, fechas_remision
+        ))
+
+    except Exception as e:
+        print(f"Error obteniendo órdenes desde OMS: {e}")
+        return []
+
+
+def get_ml_orders_reconciliacion(
+    fechas_remision: Iterable[str],
+    fecha_minima_tbc: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    campos: Optional[Iterable[str]] = None,
+    lanzar_errores: bool = False
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Trae en una sola consulta (paginada) las dos particiones que usa la
+    reconciliación y las separa en el cliente:
+    - órdenes con remisión cuya fecha_remision_tbc está en `fechas_remision`
+    - órdenes sin remisión anteriores a `fecha_minima_tbc` (hora de Colombia),
+      el mismo corte que aplica reconciliar_ml_tbc a los pedidos sin facturar
+    
+    Si falla la consulta devuelve ([], []), o propaga el error con
+    lanzar_errores=True (para no confundir un fallo con "sin órdenes").
+    
+    Returns:
+        (ordenes_con_remision, ordenes_sin_remision)
+    """
+    import pytz
+
+    campos = CAMPOS_RECONCILIACION if campos is None else tuple(campos)
+    fechas = set(fechas_remision)
+
+    condiciones = []
+    if fechas:
+        condiciones.append(f"and(remision_tbc.not.is.null,{_condicion_fechas_remision(fechas)})")
+
+    corte = None
+    if fecha_minima_tbc:
+        zona = pytz.timezone(config.TIMEZONE)
+        corte = zona.localize(datetime.fromisoformat(fecha_minima_tbc)).astimezone(timezone.utc)
+        condiciones.append(f'and(remision_tbc.is.null,order_date.lt."{corte.isoformat()}")')
+
+    if not condiciones:
+        return [], []
+
+    def aplicar_filtros(query):
+        query = (
+            query.eq("channel", "mercadolibre")
+            .neq("status", "cancelado")
+            .not_.ilike("store_name", "%medell%")  # Excluir bodega Medellín
+            .or_(",".join(condiciones))
+        )
+
+        if fecha_desde:
+            query = query.gte("order_date", fecha_desde)
+
+        return query
+
+    con_remision = []
+    sin_remision = []
+
+    try:
+        filas = _filas_cache(lambda cache: cache.filas_reconciliacion(fechas, corte, fecha_desde))
+        if filas is None:
+            filas = _iterar_filas_oms(aplicar_filtros, _select_oms(campos))
+
+        for row in filas:
+            if row.get('remision_tbc') is None:
+                sin_remision.append(_map_oms_order(row, campos))
+            elif row.get('fecha_remision_tbc') in fechas:
+                con_remision.append(_map_oms_order(row, campos))
 
     except Exception as e:
+        if lanzar_errores:
+            raise
         print(f"Error obteniendo órdenes desde OMS: {e}")
+        return [], []
+
+    return con_remision, sin_remision
+
+
+def iterar_ml_orders_actualizadas(
+    actualizado_desde: str,
+    fecha_desde: Optional[str] = None,
+    limit: Optional[int] = None,
+    campos: Optional[Iterable[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Igual que get_ml_orders_actualizadas pero como generador.
+    Los errores de red se propagan.
+    """
+
+    def aplicar_filtros(query):
+        query = query.eq("channel", "mercadolibre").gte("updated_at", actualizado_desde)
+
+        if fecha_desde:
+            query = query.gte("order_date", fecha_desde)
+
+        return query
+
+    campos = CAMPOS_DETALLE if campos is None else tuple(campos)
+    columnas = _select_oms(campos, extra=('status', 'store_name'))
+
+    filas = _filas_cache(lambda cache: cache.filas_actualizadas(actualizado_desde, fecha_desde, limit))
+    if filas is None:
+        filas = _iterar_filas_oms(aplicar_filtros, columnas, limit=limit)
+
+    for row in filas:
+        orden = _map_oms_order(row, campos)
+        status = row.get('status')
+        store_name = row.get('store_name')
+        # Mismos filtros que get_ml_orders (en SQL, NULL no pasa neq / not ilike)
+        orden['vigente'] = (
+            status is not None
+            and status != 'cancelado'
+            and store_name is not None
+            and 'medell' not in store_name.lower()
+        )
+        yield orden
+
+
+def get_ml_orders_actualizadas(
+    actualizado_desde: str,
+    fecha_desde: Optional[str] = None,
+    limit: Optional[int] = None,
+    campos: Optional[Iterable[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Obtiene las órdenes ML del OMS modificadas desde `actualizado_desde`
+    (columna updated_at), sin importar si tienen remisión.
+    
+    A diferencia de get_ml_orders no excluye canceladas ni Medellín: cada
+    orden trae `vigente` = False cuando get_ml_orders la habría excluido,
+    para que la reconciliación incremental pueda retirarla.
+    """
+    try:
+        return list(iterar_ml_orders_actualizadas(actualizado_desde, fecha_desde, limit, campos))
+
+    except Exception as e:
+        print(f"Error obteniendo órdenes actualizadas desde OMS: {e}")
         return []
 
 
@@ -156,6 +639,31 @@ def check_order_exists(order_id: str) -> bool:
         return False
 
 
+def get_existing_order_ids(order_ids: List[str]) -> set:
+    """Retorna el subconjunto de order_ids que ya existen en ml_orders (una sola consulta `in`)"""
+    if not order_ids:
+        return set()
+
+    try:
+        response = supabase.table("ml_orders").select("order_id").in_("order_id", order_ids).execute()
+        return {row['order_id'] for row in (response.data or [])}
+    except Exception as e:
+        print(f"Error verificando órdenes existentes: {e}")
+        return set()
+
+
+def get_ultima_fecha_orden_ml() -> Optional[str]:
+    """fecha_orden de la orden más reciente guardada en ml_orders (None si no hay)"""
+    response = (
+        supabase.table("ml_orders").select("fecha_orden")
+        .not_.is_("fecha_orden", "null")
+        .order("fecha_orden", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data[0]['fecha_orden'] if response.data else None
+
+
 # ============================================================================
 # FUNCIONES PARA TBC_FACTURAS
 # ============================================================================
@@ -169,6 +677,94 @@ def insert_tbc_facturas(facturas: List[Dict[str, Any]]) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
+# Columnas de tbc_facturas que vienen del parser TBC (nombre_evento no se guarda)
+COLUMNAS_TBC_FACTURAS = (
+    'evento', 'remision', 'fecha', 'producto_codigo', 'producto_nombre',
+    'unidad', 'valor_unitario', 'cantidad', 'valor_total'
+)
+
+
+def _valor_tbc(valor: Any) -> Any:
+    """NaN / vacío -> None (PostgREST no acepta NaN en JSON)"""
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    return valor
+
+
+def alinear_facturas_tbc(
+    facturas: Iterable[Dict[str, Any]],
+    archivo_nombre: str,
+    hash_archivo: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Líneas del parser TBC con solo las columnas de tbc_facturas"""
+    return [
+        {
+            **{columna: _valor_tbc(factura.get(columna)) for columna in COLUMNAS_TBC_FACTURAS},
+            'archivo_nombre': archivo_nombre,
+            'hash_archivo': hash_archivo
+        }
+        for factura in facturas
+    ]
+
+
+def importar_tbc_facturas(
+    facturas: Iterable[Dict[str, Any]],
+    hash_archivo: str,
+    archivo_nombre: str,
+    chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Carga todas las líneas de un archivo TBC reemplazando las de una carga
+    anterior del mismo contenido
+    
+    Las líneas se suben por bloques a tbc_facturas_staging con un carga_id y
+    luego swap_tbc_facturas las pasa a tbc_facturas en una sola transacción
+    (borra las del mismo hash_archivo e inserta las nuevas). Si falla a
+    medias, tbc_facturas queda como estaba.
+    
+    La carga se identifica por hash_archivo (tbc_cache.calcular_hash_archivo),
+    no por el nombre: todos los exportes de TBC se llaman RESUXDOC.XLS.
+    archivo_nombre se guarda solo como referencia.
+    
+    `facturas` puede ser un iterador (p. ej. los lotes de
+    tbc_parser.iterar_resuxdoc encadenados): se consume de a un bloque, sin
+    armar la lista completa.
+    
+    Requiere database/importar_tbc.sql.
+    
+    Returns:
+        {"success": bool, "count": líneas en tbc_facturas, "error": ...}
+    """
+    chunk_size = chunk_size or config.TBC_IMPORT_CHUNK_SIZE
+    carga_id = uuid.uuid4().hex
+    facturas = iter(facturas)
+    
+    try:
+        while True:
+            bloque = alinear_facturas_tbc(islice(facturas, chunk_size), archivo_nombre, hash_archivo)
+            if not bloque:
+                break
+            filas = [{**fila, 'carga_id': carga_id} for fila in bloque]
+            supabase.table("tbc_facturas_staging").insert(filas, returning="minimal").execute()
+        
+        response = supabase.rpc("swap_tbc_facturas", {
+            "p_carga_id": carga_id,
+            "p_hash_archivo": hash_archivo,
+            "p_archivo_nombre": archivo_nombre
+        }).execute()
+        
+        print(f"[INFO] TBC: {response.data} líneas de {archivo_nombre} importadas")
+        return {"success": True, "count": response.data}
+    
+    except Exception as e:
+        print(f"[ERROR] TBC: no se pudo importar {archivo_nombre}: {e}")
+        try:
+            supabase.table("tbc_facturas_staging").delete(returning="minimal").eq("carga_id", carga_id).execute()
+        except Exception:
+            pass
+        return {"success": False, "count": 0, "error": str(e)}
+
+
 def get_tbc_facturas_by_remision(remision: str) -> List[Dict[str, Any]]:
     """Obtiene todas las líneas de factura para una remisión específica"""
     try:
@@ -201,6 +797,53 @@ def insert_discrepancia(discrepancia_data: Dict[str, Any]) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
+def guardar_discrepancias(
+    filas: List[Dict[str, Any]],
+    alcance: str,
+    chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Guarda en bloque las discrepancias de una corrida (ver
+    reconciliation.discrepancias_para_guardar), sin duplicar al repetirla:
+    cada fila se identifica por su `clave` y se hace upsert sobre ella.
+    
+    Las discrepancias ya marcadas como resueltas en ese alcance no se tocan.
+    
+    Returns:
+        {"success": bool, "guardadas": int, "omitidas_resueltas": int, "error": ...}
+    """
+    chunk_size = chunk_size or config.DISCREPANCIAS_CHUNK_SIZE
+    
+    try:
+        resueltas = supabase.table("discrepancias").select("clave").eq("alcance", alcance).eq("resuelto", True).execute()
+        claves_resueltas = {r['clave'] for r in resueltas.data or []}
+    except Exception as e:
+        return {"success": False, "guardadas": 0, "omitidas_resueltas": 0, "error": str(e)}
+    
+    ahora = datetime.now(timezone.utc).isoformat()
+    pendientes = [
+        {**fila, 'ultima_deteccion': ahora}
+        for fila in filas
+        if fila['clave'] not in claves_resueltas
+    ]
+    
+    guardadas = 0
+    try:
+        for i in range(0, len(pendientes), chunk_size):
+            bloque = pendientes[i:i + chunk_size]
+            supabase.table("discrepancias").upsert(bloque, on_conflict="clave", returning="minimal").execute()
+            guardadas += len(bloque)
+    except Exception as e:
+        return {
+            "success": False,
+            "guardadas": guardadas,
+            "omitidas_resueltas": len(filas) - len(pendientes),
+            "error": str(e)
+        }
+    
+    return {"success": True, "guardadas": guardadas, "omitidas_resueltas": len(filas) - len(pendientes)}
+
+
 def get_discrepancias(resuelto: Optional[bool] = None) -> List[Dict[str, Any]]:
     """Obtiene discrepancias con filtro opcional de resuelto"""
     try:
@@ -238,28 +881,40 @@ def marcar_discrepancia_resuelta(discrepancia_id: int, notas: str = "") -> Dict[
 # ============================================================================
 
 def get_estadisticas_generales() -> Dict[str, Any]:
-    """Obtiene estadísticas generales del sistema"""
+    """
+    Obtiene estadísticas generales del sistema
+    
+    Usa la función get_estadisticas_generales (database/estadisticas.sql),
+    que devuelve todos los contadores en una sola llamada; si no está
+    instalada, hace los conteos por separado.
+    
+    Raises:
+        Exception: si Supabase no responde (quien llama decide qué mostrar;
+        app.py no guarda en caché un error como si fueran ceros)
+    """
     try:
-        # Total de órdenes
-        total_orders = supabase.table("ml_orders").select("id", count="exact").execute()
-        
-        # Órdenes con remisión
-        orders_with_remision = supabase.table("ml_orders").select("id", count="exact").not_.is_("remision", "null").execute()
-        
-        # Discrepancias pendientes
-        discrepancias_pendientes = supabase.table("discrepancias").select("id", count="exact").eq("resuelto", False).execute()
-        
-        return {
-            "total_ordenes": total_orders.count,
-            "ordenes_con_remision": orders_with_remision.count,
-            "ordenes_sin_remision": total_orders.count - orders_with_remision.count,
-            "discrepancias_pendientes": discrepancias_pendientes.count
-        }
+        response = supabase.rpc("get_estadisticas_generales").execute()
+        if isinstance(response.data, dict):
+            return response.data
     except Exception as e:
-        print(f"Error obteniendo estadísticas: {e}")
-        return {
-            "total_ordenes": 0,
-            "ordenes_con_remision": 0,
-            "ordenes_sin_remision": 0,
-            "discrepancias_pendientes": 0
-        }
+        print(f"[WARN] RPC get_estadisticas_generales no disponible, se cuentan por separado: {e}")
+    
+    return _estadisticas_por_conteo()
+
+
+def _estadisticas_por_conteo() -> Dict[str, Any]:
+    """Estadísticas con una consulta count="exact" por contador (los errores se propagan)"""
+    # Total de órdenes
+    total_orders = supabase.table("ml_orders").select("id", count="exact").limit(1).execute()
+    # Órdenes con remisión
+    orders_with_remision = supabase.table("ml_orders").select("id", count="exact").not_.is_("remision", "null").limit(1).execute()
+    
+    # Discrepancias pendientes
+    discrepancias_pendientes = supabase.table("discrepancias").select("id", count="exact").eq("resuelto", False).limit(1).execute()
+    
+    return {
+        "total_ordenes": total_orders.count,
+        "ordenes_con_remision": orders_with_remision.count,
+        "ordenes_sin_remision": total_orders.count - orders_with_remision.count,
+        "discrepancias_pendientes": discrepancias_pendientes.count
+    }
@@ -8,6 +8,7 @@ import json
 import webbrowser
 from urllib.parse import urlparse, parse_qs, urlencode
 import config
+from services import ml_http
 import hashlib
 import base64
 import secrets
@@ -39,7 +40,7 @@ def get_authorization_url(code_challenge):
 
 def exchange_code_for_token(code: str, code_verifier: str):
     """Intercambia el código de autorización por un access token usando PKCE"""
-    url = "https://api.mercadolibre.com/oauth/token"
+    url = "/oauth/token"
     
     data = {
         'grant_type': 'authorization_code',
@@ -51,7 +52,7 @@ def exchange_code_for_token(code: str, code_verifier: str):
     }
     
     try:
-        response = requests.post(url, data=data)
+        response = ml_http.post(url, data=data)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -62,11 +63,8 @@ def exchange_code_for_token(code: str, code_verifier: str):
 
 def get_user_info(access_token: str):
     """Obtiene información del usuario autenticado"""
-    url = "https://api.mercadolibre.com/users/me"
-    headers = {'Authorization': f'Bearer {access_token}'}
-    
     try:
-        response = requests.get(url, headers=headers)
+        response = ml_http.get("/users/me", access_token=access_token)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
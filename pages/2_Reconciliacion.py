@@ -6,17 +6,82 @@ import streamlit as st
 from datetime import datetime
 import pandas as pd
 import json
-from io import BytesIO
-import tempfile
-import os
 
 # Importar módulos
 import sys
 sys.path.append('..')
 
+import config
 from database import supabase_client as db
 from services import tbc_parser
+from services import tbc_cache
 from services import reconciliation
+from services import reconciliation_duckdb
+from services import reconciliation_incremental
+from services import reporte_excel
+from services import exportacion
+
+
+# ============================================================================
+# CACHÉ DE LA PÁGINA
+# ============================================================================
+# Streamlit vuelve a ejecutar la página completa con cada clic: el parseo,
+# las consultas al OMS y la reconciliación se guardan por hash del archivo y
+# rango de fechas para que desplegar un detalle o exportar no repita nada.
+
+@st.cache_data(show_spinner=False, max_entries=config.RECONCILIACION_CACHE_ENTRADAS)
+def cargar_tbc(hash_archivo: str, _contenido: bytes, nombre_archivo: str):
+    """Archivo TBC parseado (más sus fechas de remisión), por hash del contenido"""
+    resultado = tbc_cache.procesar_archivo_tbc_cacheado(_contenido, nombre_archivo)
+    resultado['fechas'] = sorted({f['fecha'] for f in resultado['facturas'] if f.get('fecha')})
+    return resultado
+
+
+@st.cache_data(show_spinner=False, ttl=config.RECONCILIACION_CACHE_TTL_SEG,
+               max_entries=config.RECONCILIACION_CACHE_ENTRADAS)
+def cargar_ordenes_ml(fechas_tbc: tuple, fecha_minima_tbc: str, fecha_desde: str):
+    """
+    Órdenes con remisión en esas fechas y sin remisión anteriores a la mínima,
+    más el momento de la consulta (identifica la versión de las órdenes)
+    
+    Si el OMS falla se propaga el error: Streamlit no guarda excepciones en
+    caché, así que el siguiente rerun vuelve a consultar.
+    """
+    ordenes_ml, ordenes_sin_remision = db.get_ml_orders_reconciliacion(
+        fechas_remision=list(fechas_tbc),
+        fecha_minima_tbc=fecha_minima_tbc,
+        fecha_desde=fecha_desde,
+        lanzar_errores=True
+    )
+    return ordenes_ml, ordenes_sin_remision, datetime.now().isoformat()
+
+
+@st.cache_data(show_spinner=False, max_entries=config.RECONCILIACION_CACHE_ENTRADAS)
+def reconciliar(hash_archivo: str, fechas_tbc: tuple, consulta_ordenes: str, _agrupadas, _ordenes_ml, _ordenes_sin_remision):
+    """
+    Reconciliación completa por hash del archivo, rango de fechas y consulta
+    de órdenes (consulta_ordenes = momento que devolvió cargar_ordenes_ml):
+    si las órdenes se vuelven a traer, la reconciliación se recalcula
+
+    Con RECONCILIACION_MOTOR=duckdb el cruce se resuelve en DuckDB.
+    """
+    if config.RECONCILIACION_MOTOR == "duckdb":
+        return reconciliation_duckdb.reconciliar_duckdb(
+            _ordenes_ml,
+            _agrupadas,
+            fecha_minima_tbc=fechas_tbc[0],
+            ordenes_sin_remision=_ordenes_sin_remision
+        )
+    return reconciliation.reconciliar_ml_tbc(
+        _ordenes_ml,
+        _agrupadas,
+        fecha_minima_tbc=fechas_tbc[0],
+        ordenes_sin_remision=_ordenes_sin_remision
+    )
+
+
+# Órdenes del OMS desde esta fecha (las anteriores ya están conciliadas)
+FECHA_DESDE_OMS = "2026-01-01"
 
 
 st.title("🔍 Reconciliación TBC vs Mercado Libre")
@@ -39,11 +104,6 @@ if not uploaded_file:
     st.info("👆 Por favor carga el archivo RESUXDOC.XLS para continuar")
     st.stop()
 
-# Guardar archivo temporalmente
-temp_file_path = os.path.join(tempfile.gettempdir(), uploaded_file.name)
-with open(temp_file_path, "wb") as f:
-    f.write(uploaded_file.getbuffer())
-
 st.success(f"✅ Archivo cargado: {uploaded_file.name}")
 
 # ============================================================================
@@ -53,8 +113,12 @@ st.success(f"✅ Archivo cargado: {uploaded_file.name}")
 st.markdown("---")
 st.subheader("📊 Paso 2: Procesar Archivo TBC")
 
+contenido_tbc = uploaded_file.getvalue()
+hash_archivo = tbc_cache.calcular_hash_archivo(contenido_tbc)
+
 with st.spinner("Procesando archivo TBC..."):
-    resultado_tbc = tbc_parser.procesar_archivo_tbc(temp_file_path)
+    # En memoria por hash del contenido; si no está, tbc_cache lo busca en disco antes de parsear
+    resultado_tbc = cargar_tbc(hash_archivo, contenido_tbc, uploaded_file.name)
 
 if not resultado_tbc['facturas']:
     st.error("❌ No se pudieron extraer facturas del archivo. Verifica que sea un archivo RESUXDOC.XLS válido.")
@@ -83,6 +147,15 @@ with st.expander("👁️ Ver preview de facturas TBC"):
     df_facturas = pd.DataFrame(resultado_tbc['facturas'][:20])  # Primeras 20
     st.dataframe(df_facturas, use_container_width=True)
 
+if st.button("💾 Guardar facturas TBC en la base de datos"):
+    with st.spinner(f"Importando {resultado_tbc['total_lineas']} líneas..."):
+        importado = db.importar_tbc_facturas(resultado_tbc['facturas'], hash_archivo, uploaded_file.name)
+
+    if importado['success']:
+        st.success(f"✅ {importado['count']} líneas de {uploaded_file.name} guardadas (si este mismo archivo ya se había guardado, se reemplazan sus líneas)")
+    else:
+        st.error(f"❌ Error guardando facturas TBC: {importado['error']}")
+
 # ============================================================================
 # PASO 3: OBTENER ÓRDENES ML
 # ============================================================================
@@ -90,13 +163,8 @@ with st.expander("👁️ Ver preview de facturas TBC"):
 st.markdown("---")
 st.subheader("📦 Paso 3: Obtener Órdenes de Mercado Libre")
 
-# Extraer fechas únicas del archivo TBC
-fechas_tbc = set()
-for factura in resultado_tbc['facturas']:
-    if factura.get('fecha'):
-        fechas_tbc.add(factura['fecha'])
-
-fechas_tbc = sorted(list(fechas_tbc))
+# Fechas únicas del archivo TBC (calculadas junto con el parseo)
+fechas_tbc = resultado_tbc['fechas']
 
 # Mostrar fechas encontradas en el archivo TBC
 if fechas_tbc:
@@ -110,40 +178,56 @@ else:
     st.warning("⚠️ No se encontraron fechas en el archivo TBC")
     st.stop()
 
-with st.spinner("Obteniendo órdenes de ML..."):
-    # Obtener todas las órdenes con remisión desde el 01 de enero de 2026
-    ordenes_ml_todas = db.get_ml_orders(
-        fecha_desde="2026-01-01",
-        fecha_hasta=None,
-        con_remision=True,  # Solo las que tienen remisión
-        limit=10000  # Límite alto para obtener todas las órdenes
+modo_incremental = st.toggle(
+    "⚡ Reconciliación incremental",
+    help="Reutiliza la corrida anterior sobre este mismo archivo y solo trae del OMS "
+         "las órdenes modificadas desde entonces"
+)
+
+# Fecha mínima del archivo TBC (corte para pedidos sin facturar)
+fecha_minima_tbc = min(fechas_tbc)
+
+consulta_ordenes = None
+
+if not modo_incremental:
+    # Las órdenes se consultan una vez por archivo / rango de fechas y quedan
+    # en la sesión: desplegar un detalle o exportar no vuelve al OMS (aunque
+    # haya vencido la caché), solo este botón o un archivo con otras fechas
+    clave_ordenes = (tuple(fechas_tbc), fecha_minima_tbc, FECHA_DESDE_OMS)
+    volver_a_consultar = st.button(
+        "🔄 Volver a consultar el OMS",
+        help="Trae de nuevo las órdenes y descarta el resultado de la corrida anterior"
     )
     
-    # Filtrar por fecha_remision que coincida con fechas del archivo TBC
-    ordenes_ml = [
-        orden for orden in ordenes_ml_todas 
-        if orden.get('fecha_remision') in fechas_tbc
-    ]
-
-if not ordenes_ml:
-    st.warning(f"⚠️ No se encontraron órdenes con fecha de remisión en: {', '.join(fechas_tbc)}")
-    st.info("💡 Verifica que las remisiones estén asignadas con las fechas correctas en la página de 'Asignación de Remisiones'.")
-    st.info(f"📊 Total de órdenes con remisión en la base de datos: {len(ordenes_ml_todas)}")
-    st.stop()
+    if volver_a_consultar:
+        cargar_ordenes_ml.clear(*clave_ordenes)
+    
+    if volver_a_consultar or st.session_state.get('clave_ordenes') != clave_ordenes:
+        with st.spinner("Obteniendo órdenes de ML..."):
+            # Una sola consulta al OMS (desde el 01 de enero de 2026) que trae:
+            # - órdenes con remisión cuya fecha coincide con el archivo TBC
+            # - órdenes sin remisión anteriores a la fecha mínima del archivo
+            try:
+                st.session_state['ordenes_oms'] = cargar_ordenes_ml(*clave_ordenes)
+                st.session_state['clave_ordenes'] = clave_ordenes
+            except Exception as e:
+                st.error(f"❌ Error obteniendo órdenes desde el OMS: {e}")
+                st.stop()
+    
+    ordenes_ml, ordenes_sin_remision, consulta_ordenes = st.session_state['ordenes_oms']
 
-st.success(f"✅ Se encontraron {len(ordenes_ml)} órdenes con fecha de remisión coincidente (de {len(ordenes_ml_todas)} totales)")
+    if not ordenes_ml:
+        st.warning(f"⚠️ No se encontraron órdenes con fecha de remisión en: {', '.join(fechas_tbc)}")
+        st.info("💡 Verifica que las remisiones estén asignadas con las fechas correctas en el OMS.")
+        st.stop()
 
-# También obtener órdenes SIN remisión para detectar pedidos antiguos sin facturar
-with st.spinner("Obteniendo pedidos sin facturar..."):
-    # Limitar solo a pedidos de 2026 en adelante
-    ordenes_sin_remision = db.get_ml_orders(
-        fecha_desde="2026-01-01",
-        fecha_hasta=None,
-        con_remision=False,  # Solo las que NO tienen remisión
-        limit=10000  # Límite alto para obtener todas las órdenes
-    )
+    st.success(f"✅ Se encontraron {len(ordenes_ml)} órdenes con fecha de remisión coincidente")
+    st.info(f"📊 Pedidos sin remisión anteriores a {fecha_minima_tbc}: {len(ordenes_sin_remision)}")
 
-st.info(f"📊 Pedidos sin remisión encontrados: {len(ordenes_sin_remision)}")
+# Identifica la corrida: los resultados guardados solo se muestran para este
+# archivo, fechas y consulta de órdenes (solo cambia al volver a consultar el
+# OMS a propósito; entonces hay que reconciliar de nuevo)
+clave_corrida = (hash_archivo, tuple(fechas_tbc), modo_incremental, consulta_ordenes)
 
 # ============================================================================
 # PASO 4: RECONCILIAR
@@ -154,20 +238,40 @@ st.subheader("🔄 Paso 4: Ejecutar Reconciliación")
 
 if st.button("🚀 Comparar ML vs TBC", type="primary", use_container_width=True):
     with st.spinner("Reconciliando datos..."):
-        # Obtener fecha mínima del archivo TBC
-        fecha_minima_tbc = min(fechas_tbc) if fechas_tbc else None
-        
-        resultado = reconciliation.reconciliar_ml_tbc(
-            ordenes_ml,
-            resultado_tbc['agrupadas'],
-            fecha_minima_tbc=fecha_minima_tbc,
-            ordenes_sin_remision=ordenes_sin_remision
-        )
+        if modo_incremental:
+            try:
+                salida = reconciliation_incremental.reconciliar_incremental(
+                    resultado_tbc['hash_archivo'],
+                    resultado_tbc['agrupadas'],
+                    fechas_tbc,
+                    fecha_minima_tbc=fecha_minima_tbc
+                )
+            except Exception as e:
+                st.error(f"❌ Error consultando el OMS, no se actualizó la corrida incremental: {e}")
+                st.stop()
+            resultado = salida['resultado']
+            st.session_state['diff_reconciliacion'] = salida
+        else:
+            resultado = reconciliar(
+                hash_archivo,
+                tuple(fechas_tbc),
+                consulta_ordenes,
+                resultado_tbc['agrupadas'],
+                ordenes_ml,
+                ordenes_sin_remision
+            )
+            st.session_state.pop('diff_reconciliacion', None)
         
         # Guardar en session state
         st.session_state['resultado_reconciliacion'] = resultado
+        st.session_state['clave_reconciliacion'] = clave_corrida
         st.rerun()
 
+# Un resultado de otro archivo o rango de fechas no se muestra con este
+if st.session_state.get('clave_reconciliacion') != clave_corrida:
+    st.session_state.pop('resultado_reconciliacion', None)
+    st.session_state.pop('diff_reconciliacion', None)
+
 # ============================================================================
 # PASO 5: MOSTRAR RESULTADOS
 # ============================================================================
@@ -195,6 +299,34 @@ if 'resultado_reconciliacion' in st.session_state:
         total_procesado = resultado['total_ordenes_ml'] + resultado['total_facturas_tbc']
         st.metric("🔢 Total Procesado", total_procesado)
     
+    # Cambios respecto a la corrida anterior (modo incremental)
+    if 'diff_reconciliacion' in st.session_state:
+        salida = st.session_state['diff_reconciliacion']
+        diff = salida['diff']
+        
+        if salida['incremental']:
+            st.caption(f"⚡ Corrida incremental: {salida['ordenes_actualizadas']} órdenes modificadas desde la corrida anterior")
+        else:
+            st.caption("⚡ Primera corrida sobre este archivo: se guardó el estado para las siguientes")
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("🆕 Discrepancias nuevas", len(diff['nuevas']))
+        
+        with col2:
+            st.metric("✔️ Discrepancias resueltas", len(diff['resueltas']))
+        
+        with col3:
+            st.metric("➖ Sin cambio", len(diff['sin_cambio']))
+        
+        if diff['nuevas'] or diff['resueltas']:
+            with st.expander("Ver cambios respecto a la corrida anterior"):
+                for d in diff['nuevas']:
+                    st.write(f"🆕 Remisión {d['remision']}: {d['tipo'].replace('_', ' ')}")
+                for d in diff['resueltas']:
+                    st.write(f"✔️ Remisión {d['remision']}: {d['tipo'].replace('_', ' ')}")
+    
     st.markdown("---")
     st.subheader(f"✅ Coincidencias ({len(resultado['coincidencias'])})")
     
@@ -363,6 +495,25 @@ if 'resultado_reconciliacion' in st.session_state:
     else:
         st.success("🎉 ¡No se encontraron discrepancias! Todos los datos coinciden.")
     
+    # ========================================================================
+    # GUARDAR DISCREPANCIAS
+    # ========================================================================
+    
+    if resultado['discrepancias']:
+        st.markdown("---")
+        
+        if st.button("💾 Guardar discrepancias en la base de datos", use_container_width=True):
+            with st.spinner("Guardando discrepancias..."):
+                filas = reconciliation.discrepancias_para_guardar(resultado, resultado_tbc['hash_archivo'])
+                guardado = db.guardar_discrepancias(filas, resultado_tbc['hash_archivo'])
+            
+            if guardado['success']:
+                st.success(f"✅ {guardado['guardadas']} discrepancias guardadas")
+                if guardado['omitidas_resueltas']:
+                    st.info(f"ℹ️ {guardado['omitidas_resueltas']} ya estaban marcadas como resueltas y no se modificaron")
+            else:
+                st.error(f"❌ Error guardando discrepancias: {guardado['error']}")
+    
     # ========================================================================
     # EXPORTAR REPORTE
     # ========================================================================
@@ -371,272 +522,40 @@ if 'resultado_reconciliacion' in st.session_state:
     st.subheader("📥 Exportar Reporte")
     
     if st.button("📊 Generar Reporte Excel", use_container_width=True):
-        import pytz
-        COLOMBIA_TZ = pytz.timezone('America/Bogota')
-        
-        # Crear archivo Excel
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            workbook = writer.book
-            
-            # ================================================================
-            # FORMATOS
-            # ================================================================
-            
-            # Formato para encabezados
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#4472C4',
-                'font_color': 'white',
-                'border': 1,
-                'align': 'center',
-                'valign': 'vcenter'
-            })
-            
-            # Formato para título de resumen
-            title_format = workbook.add_format({
-                'bold': True,
-                'font_size': 14,
-                'bg_color': '#2E5090',
-                'font_color': 'white',
-                'align': 'center',
-                'valign': 'vcenter'
-            })
-            
-            # Formatos por tipo de discrepancia
-            formato_sin_facturar = workbook.add_format({
-                'bg_color': '#FFF2CC',  # Amarillo claro
-                'border': 1
-            })
-            
-            formato_remision_sin_factura = workbook.add_format({
-                'bg_color': '#FFE699',  # Amarillo
-                'border': 1
-            })
-            
-            formato_factura_sin_remision = workbook.add_format({
-                'bg_color': '#F4B084',  # Naranja claro
-                'border': 1
-            })
-            
-            formato_valor_diferente = workbook.add_format({
-                'bg_color': '#F8CBAD',  # Rojo claro
-                'border': 1
-            })
-            
-            formato_normal = workbook.add_format({
-                'border': 1
-            })
-            
-            # ================================================================
-            # HOJA 1: RESUMEN EJECUTIVO
-            # ================================================================
-            
-            worksheet_resumen = workbook.add_worksheet('Resumen')
-            
-            # Título
-            worksheet_resumen.merge_range('A1:B1', 'RESUMEN EJECUTIVO - RECONCILIACIÓN', title_format)
-            
-            # Información general
-            row = 2
-            worksheet_resumen.write(row, 0, 'Fecha de Reconciliación:', header_format)
-            worksheet_resumen.write(row, 1, datetime.now(COLOMBIA_TZ).strftime('%Y-%m-%d %H:%M'))
-            
-            row += 1
-            worksheet_resumen.write(row, 0, 'Rango de Fechas:', header_format)
-            if fechas_tbc:
-                rango = f"{fechas_tbc[0]} a {fechas_tbc[-1]}" if len(fechas_tbc) > 1 else fechas_tbc[0]
-                worksheet_resumen.write(row, 1, rango)
-            
-            row += 2
-            worksheet_resumen.write(row, 0, 'Total Coincidencias:', header_format)
-            worksheet_resumen.write(row, 1, len(resultado['coincidencias']))
-            
-            row += 1
-            worksheet_resumen.write(row, 0, 'Total Discrepancias:', header_format)
-            worksheet_resumen.write(row, 1, len(resultado['discrepancias']))
-            
-            # Resumen por tipo
-            if resultado['discrepancias']:
-                resumen = reconciliation.generar_resumen_discrepancias(resultado)
-                
-                row += 2
-                worksheet_resumen.write(row, 0, 'DISCREPANCIAS POR TIPO', title_format)
-                worksheet_resumen.write(row, 1, '', title_format)
-                
-                row += 1
-                worksheet_resumen.write(row, 0, 'Pedidos sin facturar:', formato_sin_facturar)
-                worksheet_resumen.write(row, 1, resumen[reconciliation.TIPO_PEDIDOS_SIN_FACTURAR], formato_sin_facturar)
-                
-                row += 1
-                worksheet_resumen.write(row, 0, 'Remisión sin factura en TBC:', formato_remision_sin_factura)
-                worksheet_resumen.write(row, 1, resumen[reconciliation.TIPO_REMISION_SIN_FACTURA], formato_remision_sin_factura)
-                
-                row += 1
-                worksheet_resumen.write(row, 0, 'Factura sin remisión en ML:', formato_factura_sin_remision)
-                worksheet_resumen.write(row, 1, resumen[reconciliation.TIPO_FACTURA_SIN_REMISION], formato_factura_sin_remision)
-                
-                row += 1
-                worksheet_resumen.write(row, 0, 'Valor diferente:', formato_valor_diferente)
-                worksheet_resumen.write(row, 1, resumen[reconciliation.TIPO_VALOR_DIFERENTE], formato_valor_diferente)
-            
-            # Ajustar anchos
-            worksheet_resumen.set_column('A:A', 30)
-            worksheet_resumen.set_column('B:B', 25)
-            
-            # ================================================================
-            # HOJA 2: DISCREPANCIAS DETALLADAS
-            # ================================================================
-            
-            if resultado['discrepancias']:
-                discrepancias_data = []
-                
-                for disc in resultado['discrepancias']:
-                    tipo = disc['tipo']
-                    detalle = disc['detalle']
-                    
-                    if tipo == reconciliation.TIPO_PEDIDOS_SIN_FACTURAR:
-                        # Pedidos sin facturar
-                        for orden in detalle['ordenes']:
-                            display_id = orden.get('pack_id') if orden.get('pack_id') else orden['order_id']
-                            
-                            # Convertir fecha a hora Colombia
-                            fecha_str = ''
-                            if orden.get('fecha_orden'):
-                                fecha_utc = datetime.fromisoformat(orden['fecha_orden'].replace('Z', '+00:00'))
-                                fecha_colombia = fecha_utc.astimezone(COLOMBIA_TZ)
-                                fecha_str = fecha_colombia.strftime('%Y-%m-%d')
-                            
-                            # Productos
-                            productos_str = ''
-                            if orden.get('productos'):
-                                try:
-                                    import json
-                                    prods = json.loads(orden['productos']) if isinstance(orden['productos'], str) else orden['productos']
-                                    productos_str = ', '.join([p.get('title', 'N/A') for p in prods])
-                                except:
-                                    productos_str = ''
-                            
-                            discrepancias_data.append({
-                                'Tipo': 'Pedidos sin facturar',
-                                'Remisión': 'N/A',
-                                'Order ID': display_id,
-                                'Fecha': fecha_str,
-                                'Total ML': orden.get('total', 0),
-                                'Total TBC': '',
-                                'Diferencia': '',
-                                'Productos': productos_str
-                            })
-                    
-                    elif tipo == reconciliation.TIPO_REMISION_SIN_FACTURA:
-                        # Remisión sin factura en TBC
-                        for orden in detalle['ordenes_ml']:
-                            display_id = orden.get('pack_id') if orden.get('pack_id') else orden['order_id']
-                            
-                            # Productos
-                            productos_str = ''
-                            if orden.get('productos'):
-                                try:
-                                    import json
-                                    prods = json.loads(orden['productos']) if isinstance(orden['productos'], str) else orden['productos']
-                                    productos_str = ', '.join([p.get('title', 'N/A') for p in prods])
-                                except:
-                                    productos_str = ''
-                            
-                            discrepancias_data.append({
-                                'Tipo': 'Remisión sin factura en TBC',
-                                'Remisión': disc['remision'],
-                                'Order ID': display_id,
-                                'Fecha': orden.get('fecha_remision', ''),
-                                'Total ML': orden.get('total', 0),
-                                'Total TBC': '',
-                                'Diferencia': '',
-                                'Productos': productos_str
-                            })
-                    
-                    elif tipo == reconciliation.TIPO_FACTURA_SIN_REMISION:
-                        # Factura sin remisión en ML
-                        productos_str = ''
-                        if detalle.get('facturas_tbc'):
-                            productos_str = ', '.join([f.get('producto_nombre', 'N/A') for f in detalle['facturas_tbc']])
-                        
-                        discrepancias_data.append({
-                            'Tipo': 'Factura sin remisión en ML',
-                            'Remisión': disc['remision'],
-                            'Order ID': '',
-                            'Fecha': detalle.get('fecha_tbc', ''),
-                            'Total ML': '',
-                            'Total TBC': detalle.get('total_tbc', 0),
-                            'Diferencia': '',
-                            'Productos': productos_str
-                        })
-                    
-                    elif tipo == reconciliation.TIPO_VALOR_DIFERENTE:
-                        # Valor diferente
-                        discrepancias_data.append({
-                            'Tipo': 'Valor diferente',
-                            'Remisión': disc['remision'],
-                            'Order ID': '',
-                            'Fecha': detalle.get('fecha_ml', ''),
-                            'Total ML': detalle.get('total_ml', 0),
-                            'Total TBC': detalle.get('total_tbc', 0),
-                            'Diferencia': detalle.get('diferencia', 0),
-                            'Productos': ''
-                        })
-                
-                # Crear DataFrame
-                df_discrepancias = pd.DataFrame(discrepancias_data)
-                df_discrepancias.to_excel(writer, sheet_name='Discrepancias', index=False, startrow=1, header=False)
-                
-                # Obtener worksheet
-                worksheet_disc = writer.sheets['Discrepancias']
-                
-                # Escribir encabezados
-                for col_num, value in enumerate(df_discrepancias.columns.values):
-                    worksheet_disc.write(0, col_num, value, header_format)
-                
-                # Aplicar formato por tipo
-                for row_num, row_data in enumerate(discrepancias_data, start=1):
-                    tipo = row_data['Tipo']
-                    
-                    if 'sin facturar' in tipo:
-                        formato = formato_sin_facturar
-                    elif 'sin factura en TBC' in tipo:
-                        formato = formato_remision_sin_factura
-                    elif 'sin remisión' in tipo:
-                        formato = formato_factura_sin_remision
-                    elif 'diferente' in tipo:
-                        formato = formato_valor_diferente
-                    else:
-                        formato = formato_normal
-                    
-                    for col_num in range(len(df_discrepancias.columns)):
-                        worksheet_disc.write(row_num, col_num, df_discrepancias.iloc[row_num-1, col_num], formato)
-                
-                # Ajustar anchos
-                worksheet_disc.set_column('A:A', 30)  # Tipo
-                worksheet_disc.set_column('B:B', 12)  # Remisión
-                worksheet_disc.set_column('C:C', 20)  # Order ID
-                worksheet_disc.set_column('D:D', 12)  # Fecha
-                worksheet_disc.set_column('E:E', 12)  # Total ML
-                worksheet_disc.set_column('F:F', 12)  # Total TBC
-                worksheet_disc.set_column('G:G', 12)  # Diferencia
-                worksheet_disc.set_column('H:H', 50)  # Productos
-        
-        # Preparar descarga
-        output.seek(0)
-        
-        timestamp = datetime.now(COLOMBIA_TZ).strftime("%Y%m%d_%H%M%S")
-        filename = f"Discrepancias_Reconciliacion_{timestamp}.xlsx"
+        with st.spinner("Generando reporte..."):
+            reporte = reporte_excel.generar_reporte_excel(resultado, fechas_tbc)
         
         st.download_button(
             label="💾 Descargar Reporte de Discrepancias",
-            data=output,
-            file_name=filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            data=reporte,
+            file_name=reporte_excel.nombre_reporte(),
+            mime=reporte_excel.MIME_XLSX,
             use_container_width=True
         )
+    
+    # Formatos para análisis (una fila por producto, coincidencias y discrepancias)
+    col1, col2 = st.columns([1, 2])
+    
+    with col1:
+        formato_export = st.selectbox(
+            "Formato para análisis",
+            options=list(exportacion.FORMATOS),
+            format_func=lambda f: {'parquet': 'Parquet', 'jsonl': 'JSON-lines', 'csv': 'CSV'}[f],
+            help="Una fila por producto de cada orden ML y línea TBC, con esquema fijo"
+        )
+    
+    with col2:
+        if st.button("🗂️ Generar exportación", use_container_width=True):
+            with st.spinner("Generando exportación..."):
+                datos_export = exportacion.exportar(resultado, formato_export, corrida=hash_archivo)
+            
+            st.download_button(
+                label=f"💾 Descargar {exportacion.FORMATOS[formato_export][0]}",
+                data=datos_export,
+                file_name=exportacion.nombre_archivo(formato_export),
+                mime=exportacion.FORMATOS[formato_export][1],
+                use_container_width=True
+            )
 
 # ============================================================================
 # FOOTER
@@ -0,0 +1,326 @@
+"""
+Exportación del resultado de una reconciliación para análisis (BI)
+
+Aplana coincidencias y discrepancias a una fila por línea de producto (cada
+producto de una orden ML o cada línea de factura TBC) con un esquema fijo,
+y la escribe como Parquet, JSON-lines o CSV. Parquet se escribe por grupos
+de filas ordenados por categoría / tipo / remisión, así que leer muchas
+corridas filtrando por esas columnas solo abre los grupos que coinciden.
+
+    from services import exportacion
+    exportacion.escribir_parquet(resultado, "corrida.parquet", corrida=hash_archivo)
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Iterator, Union, BinaryIO, TextIO
+
+import pytz
+
+import config
+from services import reconciliation
+from services import tbc_parser
+
+
+CATEGORIA_COINCIDENCIA = "coincidencia"
+CATEGORIA_DISCREPANCIA = "discrepancia"
+
+ORIGEN_ML = "ml"
+ORIGEN_TBC = "tbc"
+
+# Columnas en el orden del esquema (CSV / JSON-lines usan el mismo)
+COLUMNAS = (
+    'corrida', 'fecha_corrida', 'categoria', 'tipo', 'remision',
+    'total_ml', 'total_tbc', 'diferencia', 'fecha_ml', 'fecha_tbc',
+    'origen', 'order_id', 'pack_id', 'sku', 'producto',
+    'cantidad', 'valor_unitario', 'valor_total'
+)
+
+FORMATOS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'jsonl': ('.jsonl', 'application/x-ndjson'),
+    'csv': ('.csv', 'text/csv'),
+}
+
+
+def esquema_exportacion():
+    """Esquema fijo (Arrow) de las filas exportadas"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('corrida', pa.string()),
+        ('fecha_corrida', pa.timestamp('us', tz='UTC')),
+        ('categoria', pa.string()),
+        ('tipo', pa.string()),
+        ('remision', pa.string()),
+        ('total_ml', pa.float64()),
+        ('total_tbc', pa.float64()),
+        ('diferencia', pa.float64()),
+        ('fecha_ml', pa.string()),
+        ('fecha_tbc', pa.string()),
+        ('origen', pa.string()),
+        ('order_id', pa.string()),
+        ('pack_id', pa.string()),
+        ('sku', pa.string()),
+        ('producto', pa.string()),
+        ('cantidad', pa.float64()),
+        ('valor_unitario', pa.float64()),
+        ('valor_total', pa.float64()),
+    ])
+
+
+# ============================================================================
+# FILAS
+# ============================================================================
+
+def _texto(valor: Any) -> Optional[str]:
+    return None if valor is None or valor == '' else str(valor)
+
+
+def _numero(valor: Any) -> Optional[float]:
+    try:
+        return None if valor is None or valor == '' else float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _productos(orden: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Productos de una orden ML (la columna puede venir como texto JSON)"""
+    productos = orden.get('productos')
+    if isinstance(productos, str):
+        try:
+            productos = json.loads(productos)
+        except ValueError:
+            return []
+    return productos or []
+
+
+def _lineas_ml(ordenes: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for orden in ordenes:
+        base = {
+            'origen': ORIGEN_ML,
+            'order_id': _texto(orden.get('order_id')),
+            'pack_id': _texto(orden.get('pack_id')),
+        }
+        productos = _productos(orden)
+        if not productos:
+            # Orden sin productos: una fila con el total de la orden
+            yield {**base, 'valor_total': _numero(orden.get('total'))}
+            continue
+
+        for producto in productos:
+            cantidad = _numero(producto.get('quantity'))
+            precio = _numero(producto.get('unit_price', producto.get('unitPrice')))
+            yield {
+                **base,
+                'sku': _texto(producto.get('sku')),
+                'producto': _texto(producto.get('title')),
+                'cantidad': cantidad,
+                'valor_unitario': precio,
+                'valor_total': cantidad * precio if cantidad is not None and precio is not None else None,
+            }
+
+
+def _lineas_tbc(facturas: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for factura in facturas:
+        yield {
+            'origen': ORIGEN_TBC,
+            'sku': _texto(factura.get('producto_codigo')),
+            'producto': _texto(factura.get('producto_nombre')),
+            'cantidad': _numero(factura.get('cantidad')),
+            'valor_unitario': _numero(factura.get('valor_unitario')),
+            'valor_total': _numero(factura.get('valor_total')),
+        }
+
+
+def _filas_remision(encabezado: Dict[str, Any], ordenes, facturas) -> Iterator[Dict[str, Any]]:
+    """Una fila por línea de ML y de TBC; una sola fila si no hay detalle"""
+    vacia = True
+    for linea in _lineas_ml(ordenes or []):
+        vacia = False
+        yield {**encabezado, **linea}
+    for linea in _lineas_tbc(facturas or []):
+        vacia = False
+        yield {**encabezado, **linea}
+    if vacia:
+        yield dict(encabezado)
+
+
+def filas_exportacion(
+    resultado: Dict[str, Any],
+    corrida: Optional[str] = None,
+    fecha_corrida: Optional[datetime] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Filas planas (una por línea de producto) de un resultado de reconciliar_ml_tbc
+
+    Args:
+        resultado: Resultado de la reconciliación
+        corrida: Identificador de la corrida (p. ej. hash del archivo TBC)
+        fecha_corrida: Momento de la corrida (por defecto ahora, UTC)
+
+    Yields:
+        Dict con todas las claves de COLUMNAS (None donde no aplica)
+    """
+    fecha_corrida = fecha_corrida or datetime.now(timezone.utc)
+    vacia = dict.fromkeys(COLUMNAS)
+    comun = {**vacia, 'corrida': corrida, 'fecha_corrida': fecha_corrida}
+
+    for coincidencia in resultado['coincidencias']:
+        facturas = coincidencia.get('facturas_tbc')
+        total_ml = _numero(coincidencia.get('total'))
+        total_tbc = float(tbc_parser.calcular_total_remision(facturas)) if facturas else None
+        encabezado = {
+            **comun,
+            'categoria': CATEGORIA_COINCIDENCIA,
+            'tipo': reconciliation.TIPO_COINCIDENCIA,
+            'remision': _texto(coincidencia['remision']),
+            'total_ml': total_ml,
+            'total_tbc': total_tbc,
+            'diferencia': abs(total_ml - total_tbc) if total_ml is not None and total_tbc is not None else None,
+            'fecha_ml': _texto(coincidencia.get('fecha')),
+            # coincidencia['fecha'] es la de ML: puede ser None aunque TBC tenga fecha
+            'fecha_tbc': _texto(facturas[0].get('fecha')) if facturas else None,
+        }
+        yield from _filas_remision(encabezado, coincidencia.get('ordenes_ml'), facturas)
+
+    for disc in resultado['discrepancias']:
+        detalle = disc['detalle']
+        encabezado = {
+            **comun,
+            'categoria': CATEGORIA_DISCREPANCIA,
+            'tipo': disc['tipo'],
+            'remision': None if disc['remision'] == 'N/A' else _texto(disc['remision']),
+            'total_ml': _numero(detalle.get('total_ml')),
+            'total_tbc': _numero(detalle.get('total_tbc')),
+            'diferencia': _numero(detalle.get('diferencia')),
+            'fecha_ml': _texto(detalle.get('fecha_ml')),
+            'fecha_tbc': _texto(detalle.get('fecha_tbc')),
+        }
+
+        if disc['tipo'] == reconciliation.TIPO_PEDIDOS_SIN_FACTURAR:
+            # Sin remisión: el encabezado de cada orden lleva su fecha y total
+            for orden in detalle.get('ordenes') or []:
+                yield from _filas_remision(
+                    {**encabezado, 'fecha_ml': _texto(orden.get('fecha_orden')), 'total_ml': _numero(orden.get('total'))},
+                    [orden], None
+                )
+            continue
+
+        # Remisión sin factura: el detalle no trae total_ml, se suma de las órdenes
+        if encabezado['total_ml'] is None and detalle.get('ordenes_ml'):
+            encabezado['total_ml'] = sum(_numero(o.get('total')) or 0.0 for o in detalle['ordenes_ml'])
+
+        yield from _filas_remision(encabezado, detalle.get('ordenes_ml'), detalle.get('facturas_tbc'))
+
+
+def _ordenadas(resultado: Dict[str, Any], corrida, fecha_corrida) -> List[Dict[str, Any]]:
+    """Filas ordenadas por categoría / tipo / remisión (estadísticas útiles por grupo en Parquet)"""
+    filas = list(filas_exportacion(resultado, corrida, fecha_corrida))
+    filas.sort(key=lambda f: (f['categoria'], f['tipo'], f['remision'] or ''))
+    return filas
+
+
+# ============================================================================
+# ESCRITURA
+# ============================================================================
+
+def escribir_parquet(
+    resultado: Dict[str, Any],
+    destino: Union[str, BinaryIO],
+    corrida: Optional[str] = None,
+    fecha_corrida: Optional[datetime] = None,
+    filas_por_grupo: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Escribe el resultado como Parquet (esquema de esquema_exportacion, zstd)
+
+    Returns:
+        {"filas": filas escritas}
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filas_por_grupo = filas_por_grupo or config.EXPORTACION_FILAS_POR_GRUPO
+    esquema = esquema_exportacion()
+    filas = _ordenadas(resultado, corrida, fecha_corrida)
+
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as writer:
+        for i in range(0, len(filas), filas_por_grupo):
+            lote = pa.RecordBatch.from_pylist(filas[i:i + filas_por_grupo], schema=esquema)
+            writer.write_batch(lote, row_group_size=filas_por_grupo)
+
+    return {"filas": len(filas)}
+
+
+def ruta_particionada(raiz: str, corrida: str, fecha_corrida: Optional[datetime] = None) -> str:
+    """
+    Ruta Hive (raiz/anio=AAAA/mes=MM/<corrida>.parquet) para guardar muchas
+    corridas y leerlas juntas filtrando por año / mes sin abrir las demás
+    """
+    fecha_corrida = fecha_corrida or datetime.now(timezone.utc)
+    carpeta = os.path.join(raiz, f"anio={fecha_corrida:%Y}", f"mes={fecha_corrida:%m}")
+    os.makedirs(carpeta, exist_ok=True)
+    return os.path.join(carpeta, f"{corrida}.parquet")
+
+
+def escribir_jsonl(
+    resultado: Dict[str, Any],
+    destino: TextIO,
+    corrida: Optional[str] = None,
+    fecha_corrida: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Escribe una fila JSON por línea a medida que se generan (fechas en ISO 8601)"""
+    total = 0
+    for fila in filas_exportacion(resultado, corrida, fecha_corrida):
+        fila['fecha_corrida'] = fila['fecha_corrida'].isoformat()
+        destino.write(json.dumps(fila, ensure_ascii=False))
+        destino.write('\n')
+        total += 1
+    return {"filas": total}
+
+
+def escribir_csv(
+    resultado: Dict[str, Any],
+    destino: TextIO,
+    corrida: Optional[str] = None,
+    fecha_corrida: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Escribe el CSV (encabezado = COLUMNAS) a medida que se generan las filas"""
+    writer = csv.DictWriter(destino, fieldnames=COLUMNAS)
+    writer.writeheader()
+    total = 0
+    for fila in filas_exportacion(resultado, corrida, fecha_corrida):
+        fila['fecha_corrida'] = fila['fecha_corrida'].isoformat()
+        writer.writerow(fila)
+        total += 1
+    return {"filas": total}
+
+
+def exportar(
+    resultado: Dict[str, Any],
+    formato: str,
+    corrida: Optional[str] = None,
+    fecha_corrida: Optional[datetime] = None
+) -> bytes:
+    """Resultado exportado en 'parquet', 'jsonl' o 'csv' como bytes (para st.download_button)"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato} (usar {', '.join(FORMATOS)})")
+
+    if formato == 'parquet':
+        salida = io.BytesIO()
+        escribir_parquet(resultado, salida, corrida, fecha_corrida)
+        return salida.getvalue()
+
+    texto = io.StringIO(newline='')
+    escribir = escribir_jsonl if formato == 'jsonl' else escribir_csv
+    escribir(resultado, texto, corrida, fecha_corrida)
+    return texto.getvalue().encode('utf-8')
+
+
+def nombre_archivo(formato: str) -> str:
+    timestamp = datetime.now(pytz.timezone(config.TIMEZONE)).strftime("%Y%m%d_%H%M%S")
+    return f"Reconciliacion_{timestamp}{FORMATOS[formato][0]}"
@@ -4,80 +4,43 @@ Servicio para interactuar con la API de Mercado Libre
 
 import requests
 import json
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 import config
+from services import ml_http, ml_token_provider
 
 # ============================================================================
 # AUTENTICACIÓN (usa el token guardado)
 # ============================================================================
 
 def load_ml_token() -> Optional[str]:
-    """Carga el token de ML desde Supabase, Streamlit Secrets o archivo local"""
-    # 1. Primero intentar desde Supabase (fuente principal en producción)
-    try:
-        from services.ml_token_manager import load_ml_token_from_supabase
-        token_data = load_ml_token_from_supabase()
-        if token_data and token_data.get('access_token'):
-            return token_data['access_token']
-    except Exception:
-        pass
-    
-    # 2. Intentar desde Streamlit Secrets (fallback para Streamlit Cloud)
-    try:
-        import streamlit as st
-        if hasattr(st, 'secrets') and 'mercadolibre_token' in st.secrets:
-            return st.secrets['mercadolibre_token']['access_token']
-    except (ImportError, KeyError, FileNotFoundError):
-        pass
-    
-    # 3. Fallback a archivo local (para desarrollo local)
-    try:
-        with open('meli_tokens.json', 'r') as f:
-            token_data = json.load(f)
-            return token_data.get('access_token')
-    except FileNotFoundError:
-        return None
+    """
+    Token de ML vigente (Supabase, Streamlit Secrets o archivo local)
+    Se guarda en memoria y se refresca antes de vencer: ver ml_token_provider
+    """
+    return ml_token_provider.get_access_token()
 
 
 def get_user_id() -> Optional[int]:
-    """Obtiene el user_id desde Supabase, Streamlit Secrets o archivo local"""
-    # 1. Primero intentar desde Supabase
-    try:
-        from services.ml_token_manager import load_ml_token_from_supabase
-        token_data = load_ml_token_from_supabase()
-        if token_data and token_data.get('user_id'):
-            return token_data['user_id']
-    except Exception:
-        pass
-    
-    # 2. Intentar desde Streamlit Secrets
-    try:
-        import streamlit as st
-        if hasattr(st, 'secrets') and 'mercadolibre_token' in st.secrets:
-            return st.secrets['mercadolibre_token']['user_id']
-    except (ImportError, KeyError, FileNotFoundError):
-        pass
-    
-    # 3. Fallback a archivo local
-    try:
-        with open('meli_tokens.json', 'r') as f:
-            token_data = json.load(f)
-            return token_data.get('user_id')
-    except FileNotFoundError:
-        return None
+    """user_id del vendedor, desde la misma caché que load_ml_token"""
+    return ml_token_provider.get_user_id()
 
 
-def refresh_access_token() -> Optional[str]:
+def refresh_access_token(token_actual: Optional[str] = None) -> Optional[str]:
     """
     Refresca el access token usando el refresh token
     Intenta primero con Supabase, luego con archivo local
     Retorna el nuevo access token o None si falla
+    
+    Args:
+        token_actual: access_token que tiene quien pide el refresco (ver
+            ml_token_manager.refresh_ml_token_in_supabase)
     """
     # Intentar refrescar desde Supabase primero
     try:
         from services.ml_token_manager import refresh_ml_token_in_supabase
-        new_token = refresh_ml_token_in_supabase()
+        new_token = refresh_ml_token_in_supabase(token_actual)
         if new_token:
             # También actualizar archivo local si existe
             try:
@@ -105,7 +68,7 @@ def refresh_access_token() -> Optional[str]:
             return None
         
         # Hacer request para refrescar el token
-        url = "https://api.mercadolibre.com/oauth/token"
+        url = "/oauth/token"
         
         data = {
             'grant_type': 'refresh_token',
@@ -114,7 +77,7 @@ def refresh_access_token() -> Optional[str]:
             'refresh_token': refresh_token
         }
         
-        response = requests.post(url, data=data)
+        response = ml_http.post(url, data=data)
         response.raise_for_status()
         
         new_token_data = response.json()
@@ -161,8 +124,6 @@ def get_orders(
 ) -> List[Dict[str, Any]]:
     """Obtiene órdenes de Mercado Libre"""
     
-    url = "https://api.mercadolibre.com/orders/search"
-    
     params = {
         'seller': seller_id,
         'sort': 'date_desc',
@@ -170,15 +131,13 @@ def get_orders(
         'offset': offset
     }
     
-    headers = {'Authorization': f'Bearer {access_token}'}
-    
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = ml_http.get(ORDERS_SEARCH_URL, params=params, access_token=access_token)
         
         # Si es 401 (Unauthorized), intentar refrescar el token
         if response.status_code == 401 and retry_on_401:
             print("⚠️ Token expirado, intentando refrescar...")
-            new_token = refresh_access_token()
+            new_token = ml_token_provider.refrescar()
             
             if new_token:
                 # Reintentar con el nuevo token
@@ -197,14 +156,184 @@ def get_orders(
         return []
 
 
-def get_order_detail(access_token: str, order_id: str) -> Optional[Dict[str, Any]]:
-    """Obtiene el detalle completo de una orden"""
+# ============================================================================
+# RECORRIDO COMPLETO DE ÓRDENES (PAGINADO)
+# ============================================================================
+
+ORDERS_SEARCH_URL = "/orders/search"
+
+
+def _buscar_ordenes(
+    access_token: str,
+    seller_id: int,
+    offset: int,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    sort: str = 'date_desc',
+    limit: Optional[int] = None
+) -> requests.Response:
+    """Una página de /orders/search, opcionalmente acotada a una ventana de fechas"""
+    
+    params = {
+        'seller': seller_id,
+        'sort': sort,
+        'limit': limit or config.ML_ORDERS_PAGE_SIZE,
+        'offset': offset
+    }
+    
+    if desde:
+        params['order.date_created.from'] = desde.isoformat(timespec='milliseconds')
+    if hasta:
+        params['order.date_created.to'] = hasta.isoformat(timespec='milliseconds')
+    
+    return ml_http.get(ORDERS_SEARCH_URL, params=params, access_token=access_token)
+
+
+def _fecha_ml(fecha: str) -> datetime:
+    """Convierte date_created de ML a datetime con zona horaria"""
+    return datetime.fromisoformat(fecha.replace('Z', '+00:00'))
+
+
+def _recorrer_ventana(
+    access_token: str,
+    seller_id: int,
+    desde: Optional[datetime],
+    hasta: Optional[datetime],
+    pool: ThreadPoolExecutor
+) -> List[Dict[str, Any]]:
+    """
+    Trae todas las órdenes de una ventana de fechas
+    
+    Lee paging.total en la primera página y pide el resto de offsets en
+    paralelo. Si la ventana supera el offset máximo que permite ML, la
+    parte en dos mitades y recorre cada una.
+    """
+    
+    response = _buscar_ordenes(access_token, seller_id, 0, desde, hasta)
+    response.raise_for_status()
+    data = response.json()
+    
+    ordenes = list(data.get('results', []))
+    total = data.get('paging', {}).get('total', len(ordenes))
+    page_size = config.ML_ORDERS_PAGE_SIZE
+    
+    if total > config.ML_ORDERS_MAX_OFFSET + page_size:
+        if desde and hasta and hasta - desde > timedelta(seconds=1):
+            mitad = desde + (hasta - desde) / 2
+            return (
+                _recorrer_ventana(access_token, seller_id, mitad, hasta, pool)
+                + _recorrer_ventana(access_token, seller_id, desde, mitad, pool)
+            )
+        
+        print(f"⚠️ {total} órdenes en la ventana {desde} - {hasta}: solo se pueden leer "
+              f"{config.ML_ORDERS_MAX_OFFSET + page_size} (límite de offset de ML)")
+        total = config.ML_ORDERS_MAX_OFFSET + page_size
+    
+    def pagina(offset: int) -> List[Dict[str, Any]]:
+        resp = _buscar_ordenes(access_token, seller_id, offset, desde, hasta)
+        resp.raise_for_status()
+        return resp.json().get('results', [])
+    
+    for resultados in pool.map(pagina, range(len(ordenes), total, page_size)):
+        ordenes.extend(resultados)
+    
+    return ordenes
+
+
+def _ventana_completa(access_token: str, seller_id: int) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Fecha de la orden más antigua y de la más reciente del vendedor"""
+    
+    extremos = []
+    for sort in ('date_asc', 'date_desc'):
+        response = _buscar_ordenes(access_token, seller_id, 0, sort=sort, limit=1)
+        response.raise_for_status()
+        resultados = response.json().get('results', [])
+        if not resultados:
+            return None, None
+        extremos.append(_fecha_ml(resultados[0]['date_created']))
+    
+    # Bordes inclusivos con un pequeño margen
+    return extremos[0] - timedelta(seconds=1), extremos[1] + timedelta(seconds=1)
+
+
+def get_all_orders(
+    access_token: str,
+    seller_id: int,
+    fecha_desde: Optional[datetime] = None,
+    fecha_hasta: Optional[datetime] = None,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Obtiene TODAS las órdenes de Mercado Libre (no solo la primera página)
+    
+    - Lee paging.total y pide los offsets restantes en paralelo con un pool
+      acotado de hilos, reintentando con backoff cuando ML responde 429
+    - Si el total supera el offset máximo de /orders/search, parte la
+      búsqueda en ventanas de order.date_created
+    - Si el token está vencido lo refresca una vez
+    
+    Args:
+        access_token: Token de acceso
+        seller_id: ID del vendedor
+        fecha_desde / fecha_hasta: Ventana opcional (datetime con zona horaria)
+        max_workers: Páginas simultáneas (default: config.ML_CRAWL_WORKERS)
+    
+    Returns:
+        Lista de órdenes sin duplicados, de la más reciente a la más antigua.
+        Los errores HTTP se propagan como requests.exceptions.RequestException.
+    """
+    
+    # Verificar el token con una página mínima (y refrescarlo si hace falta)
+    response = _buscar_ordenes(access_token, seller_id, 0, fecha_desde, fecha_hasta, limit=1)
+    if response.status_code == 401:
+        print("⚠️ Token expirado, intentando refrescar...")
+        access_token = ml_token_provider.refrescar()
+        if not access_token:
+            raise requests.exceptions.HTTPError("No se pudo refrescar el token de Mercado Libre")
+        response = _buscar_ordenes(access_token, seller_id, 0, fecha_desde, fecha_hasta, limit=1)
+    response.raise_for_status()
+    
+    total = response.json().get('paging', {}).get('total', 0)
+    if total == 0:
+        return []
     
-    url = f"https://api.mercadolibre.com/orders/{order_id}"
-    headers = {'Authorization': f'Bearer {access_token}'}
+    # Si no cabe en los offsets permitidos hace falta una ventana de fechas para partir
+    if total > config.ML_ORDERS_MAX_OFFSET + config.ML_ORDERS_PAGE_SIZE and not (fecha_desde and fecha_hasta):
+        desde_total, hasta_total = _ventana_completa(access_token, seller_id)
+        fecha_desde = fecha_desde or desde_total
+        fecha_hasta = fecha_hasta or hasta_total
+    
+    with ThreadPoolExecutor(max_workers=max_workers or config.ML_CRAWL_WORKERS) as pool:
+        ordenes = _recorrer_ventana(access_token, seller_id, fecha_desde, fecha_hasta, pool)
+    
+    # Quitar duplicados (bordes de ventanas, órdenes nuevas que desplazan páginas)
+    unicas = {}
+    for orden in ordenes:
+        unicas.setdefault(orden.get('id'), orden)
+    
+    print(f"✅ {len(unicas)} órdenes obtenidas de Mercado Libre (total reportado: {total})")
+    return list(unicas.values())
+
+
+def get_order_detail(
+    access_token: str,
+    order_id: str,
+    retry_on_401: bool = True
+) -> Optional[Dict[str, Any]]:
+    """Obtiene el detalle completo de una orden (para muchas: ml_async.get_orders_detail)"""
     
     try:
-        response = requests.get(url, headers=headers)
+        response = ml_http.get(f"/orders/{order_id}", access_token=access_token)
+        
+        if response.status_code == 401 and retry_on_401:
+            print("⚠️ Token expirado, intentando refrescar...")
+            new_token = ml_token_provider.refrescar()
+            
+            if new_token:
+                return get_order_detail(new_token, order_id, retry_on_401=False)
+            print("❌ No se pudo refrescar el token")
+            return None
+        
         response.raise_for_status()
         return response.json()
         
@@ -254,6 +383,32 @@ def transform_order_for_db(order: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def transform_order_for_oms(order: Dict[str, Any]) -> Dict[str, Any]:
+    """Transforma una orden de ML a los campos que recibe upsert_oms_orders_ml"""
+    
+    items = []
+    for item in order.get('order_items', []):
+        item_data = item.get('item', {})
+        items.append({
+            'sku': item_data.get('seller_sku') or '',
+            'title': item_data.get('title') or '',
+            'quantity': item.get('quantity') or 0,
+            'unitPrice': item.get('unit_price') or 0
+        })
+    
+    shipping = order.get('shipping') or {}
+    
+    return {
+        'order_id': str(order.get('id')),
+        'pack_id': str(order.get('pack_id')) if order.get('pack_id') else None,
+        'shipping_id': str(shipping.get('id')) if shipping.get('id') else None,
+        'order_date': order.get('date_created'),
+        'total_amount': float(order.get('total_amount') or 0),
+        'items': items,
+        'ml_status': order.get('status')
+    }
+
+
 # ============================================================================
 # SINCRONIZAR ÓRDENES
 # ============================================================================
@@ -261,14 +416,54 @@ def transform_order_for_db(order: Dict[str, Any]) -> Dict[str, Any]:
 def sync_orders_to_db(
     access_token: str,
     seller_id: int,
-    limit: int = 50
+    limit: Optional[int] = 50,
+    chunk_size: Optional[int] = None,
+    fecha_desde: Optional[datetime] = None,
+    fecha_hasta: Optional[datetime] = None,
+    completo: bool = False
 ) -> Dict[str, Any]:
-    """Sincroniza órdenes de ML a la base de datos"""
+    """
+    Sincroniza órdenes de ML a la base de datos
+    
+    Por defecto trae solo la primera página (las `limit` más recientes).
+    Con limit=None recorre todas las páginas de /orders/search desde
+    fecha_desde (por defecto, la fecha de la última orden ya guardada en
+    ml_orders) hasta fecha_hasta. El histórico completo del vendedor solo se
+    recorre con completo=True.
+    
+    Trabaja por bloques de `chunk_size` órdenes: una consulta `in` para saber
+    cuáles ya existen y una inserción masiva de las nuevas. Si la inserción
+    de un bloque falla, ese bloque se reintenta orden por orden para
+    reportar exactamente cuáles fallaron.
+    """
     
-    from database.supabase_client import insert_ml_order, check_order_exists
+    from database.supabase_client import (
+        insert_ml_order,
+        insert_ml_orders_bulk,
+        get_existing_order_ids,
+        get_ultima_fecha_orden_ml
+    )
+    
+    chunk_size = chunk_size or config.SYNC_CHUNK_SIZE
     
     try:
-        orders = get_orders(access_token, seller_id, limit=limit)
+        if completo:
+            orders = get_all_orders(access_token, seller_id, fecha_desde, fecha_hasta)
+        elif limit is None:
+            if fecha_desde is None:
+                ultima = get_ultima_fecha_orden_ml()
+                if ultima is None:
+                    return {
+                        'total_procesadas': 0,
+                        'nuevas': 0,
+                        'existentes': 0,
+                        'errores': 0,
+                        'mensaje': 'No hay órdenes sincronizadas: indicar fecha_desde o completo=True'
+                    }
+                fecha_desde = _fecha_ml(ultima)
+            orders = get_all_orders(access_token, seller_id, fecha_desde, fecha_hasta)
+        else:
+            orders = get_orders(access_token, seller_id, limit=limit)
         
         if not orders:
             return {
@@ -283,33 +478,78 @@ def sync_orders_to_db(
         existentes = 0
         errores = 0
         error_details = []
+        por_orden = {}
+        
+        def registrar_error(order_id: str, error: str):
+            nonlocal errores
+            errores += 1
+            error_msg = f"Orden {order_id}: {error}"
+            error_details.append(error_msg)
+            por_orden[order_id] = 'error'
+            print(error_msg)
         
+        # Quitar órdenes repetidas en la respuesta de ML
+        unicas = {}
         for order in orders:
-            order_id = str(order.get('id'))
+            unicas.setdefault(str(order.get('id')), order)
+        
+        ids = list(unicas)
+        
+        for inicio in range(0, len(ids), chunk_size):
+            bloque = ids[inicio:inicio + chunk_size]
+            
+            # Verificar cuáles ya existen (una consulta por bloque)
+            ya_existen = get_existing_order_ids(bloque)
+            
+            pendientes = []
+            for order_id in bloque:
+                if order_id in ya_existen:
+                    existentes += 1
+                    por_orden[order_id] = 'existente'
+                    continue
+                
+                try:
+                    pendientes.append(transform_order_for_db(unicas[order_id]))
+                except Exception as e:
+                    registrar_error(order_id, f"Error transformando: {e}")
             
-            # Verificar si ya existe
-            if check_order_exists(order_id):
-                existentes += 1
+            if not pendientes:
                 continue
             
-            # Transformar y guardar
-            order_data = transform_order_for_db(order)
-            result = insert_ml_order(order_data)
+            # Transformar y guardar el bloque completo
+            result = insert_ml_orders_bulk(pendientes)
             
             if result.get('success'):
-                nuevas += 1
-            else:
-                errores += 1
-                error_msg = f"Orden {order_id}: {result.get('error', 'Error desconocido')}"
-                error_details.append(error_msg)
-                print(error_msg)
+                insertadas = {row.get('order_id') for row in result['data']}
+                for order_data in pendientes:
+                    order_id = order_data['order_id']
+                    if order_id in insertadas:
+                        nuevas += 1
+                        por_orden[order_id] = 'nueva'
+                    else:
+                        # Creada por otra sincronización entre la verificación y la inserción
+                        existentes += 1
+                        por_orden[order_id] = 'existente'
+                continue
+            
+            # El bloque falló: reintentar orden por orden para aislar los errores
+            for order_data in pendientes:
+                order_id = order_data['order_id']
+                result = insert_ml_order(order_data)
+                
+                if result.get('success'):
+                    nuevas += 1
+                    por_orden[order_id] = 'nueva'
+                else:
+                    registrar_error(order_id, result.get('error', 'Error desconocido'))
         
         return {
             'total_procesadas': len(orders),
             'nuevas': nuevas,
             'existentes': existentes,
             'errores': errores,
-            'error_details': error_details if error_details else None
+            'error_details': error_details if error_details else None,
+            'por_orden': por_orden
         }
     except Exception as e:
         print(f"Error en sync_orders_to_db: {str(e)}")
@@ -0,0 +1,247 @@
+"""
+Cliente asíncrono de Mercado Libre para enriquecer órdenes en bloque
+Trae el detalle de cientos de órdenes en paralelo (httpx + asyncio) con un
+límite de concurrencia y de peticiones por segundo
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Iterable
+
+import httpx
+
+import config
+from services import ml_http
+
+
+# Máximo de ids que acepta el multiget de /items
+ITEMS_MULTIGET_MAX = 20
+
+
+# ============================================================================
+# LÍMITE DE TASA
+# ============================================================================
+
+class LimitadorTasa:
+    """Reparte las peticiones para no pasar de `por_segundo` (intervalo mínimo entre salidas)"""
+
+    __slots__ = ('intervalo', '_siguiente', '_lock')
+
+    def __init__(self, por_segundo: float):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0.0
+        self._siguiente = 0.0
+        self._lock = asyncio.Lock()
+
+    async def esperar(self):
+        if not self.intervalo:
+            return
+
+        async with self._lock:
+            ahora = time.monotonic()
+            espera = self._siguiente - ahora
+            self._siguiente = max(ahora, self._siguiente) + self.intervalo
+
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+# ============================================================================
+# PETICIONES
+# ============================================================================
+
+async def _get(
+    client: httpx.AsyncClient,
+    semaforo: asyncio.Semaphore,
+    limitador: LimitadorTasa,
+    ruta: str,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> httpx.Response:
+    """
+    GET con el mismo criterio de reintentos que ml_http (429/5xx/conexión)
+    Registra la latencia en las métricas compartidas de ml_http
+    """
+
+    endpoint = ml_http.nombre_endpoint('GET', ml_http.ML_API_URL + ruta)
+    inicio = time.perf_counter()
+
+    for intento in range(config.ML_MAX_REINTENTOS + 1):
+        ultimo = intento == config.ML_MAX_REINTENTOS
+        response = None
+
+        async with semaforo:
+            await limitador.esperar()
+            try:
+                response = await client.get(ruta, params=params, headers=headers)
+            except httpx.TransportError:
+                if ultimo:
+                    ml_http.registrar_metrica(endpoint, time.perf_counter() - inicio, True, intento)
+                    raise
+
+        if response is not None and (response.status_code not in ml_http.CODIGOS_REINTENTABLES or ultimo):
+            ml_http.registrar_metrica(endpoint, time.perf_counter() - inicio, response.status_code >= 400, intento)
+            return response
+
+        await asyncio.sleep(ml_http.espera_reintento(intento, response))
+
+
+def _nuevo_cliente(access_token: str, max_concurrencia: int) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=ml_http.ML_API_URL,
+        headers={'Authorization': f'Bearer {access_token}'},
+        timeout=config.ML_HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=max_concurrencia, max_keepalive_connections=max_concurrencia)
+    )
+
+
+async def obtener_detalles_async(
+    access_token: str,
+    order_ids: Iterable[Any],
+    incluir_envios: bool = False,
+    max_concurrencia: Optional[int] = None,
+    por_segundo: Optional[float] = None
+) -> Dict[Any, Dict[str, Any]]:
+    """
+    Detalle completo de varias órdenes en paralelo
+
+    /orders/{id} ya trae pagos y pack_id; con incluir_envios además se pide
+    /shipments/{id} y se deja en orden['shipment'].
+
+    Returns:
+        Dict order_id -> {'status': código HTTP (None si falló la conexión),
+                          'data': orden o None, 'error': mensaje o None}
+    """
+
+    max_concurrencia = max_concurrencia or config.ML_ASYNC_CONCURRENCIA
+    semaforo = asyncio.Semaphore(max_concurrencia)
+    limitador = LimitadorTasa(por_segundo if por_segundo is not None else config.ML_ASYNC_POR_SEGUNDO)
+
+    async with _nuevo_cliente(access_token, max_concurrencia) as client:
+
+        async def detalle(order_id) -> Dict[str, Any]:
+            try:
+                response = await _get(client, semaforo, limitador, f"/orders/{order_id}")
+            except httpx.HTTPError as e:
+                return {'status': None, 'data': None, 'error': str(e)}
+
+            if response.status_code != 200:
+                return {'status': response.status_code, 'data': None, 'error': response.text[:200]}
+
+            orden = response.json()
+            envio_id = (orden.get('shipping') or {}).get('id')
+
+            if incluir_envios and envio_id:
+                try:
+                    envio = await _get(client, semaforo, limitador, f"/shipments/{envio_id}",
+                                       headers={'x-format-new': 'true'})
+                    orden['shipment'] = envio.json() if envio.status_code == 200 else None
+                except httpx.HTTPError as e:
+                    print(f"⚠️ No se pudo obtener el envío {envio_id}: {e}")
+                    orden['shipment'] = None
+
+            return {'status': 200, 'data': orden, 'error': None}
+
+        ids = list(dict.fromkeys(order_ids))
+        resultados = await asyncio.gather(*(detalle(order_id) for order_id in ids))
+
+    return dict(zip(ids, resultados))
+
+
+async def obtener_items_async(
+    access_token: str,
+    item_ids: Iterable[str],
+    atributos: Optional[List[str]] = None,
+    max_concurrencia: Optional[int] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Publicaciones por multiget (/items?ids=a,b,c de a 20 ids por petición)
+
+    Returns:
+        Dict item_id -> publicación (solo las que ML devolvió con código 200)
+    """
+
+    max_concurrencia = max_concurrencia or config.ML_ASYNC_CONCURRENCIA
+    semaforo = asyncio.Semaphore(max_concurrencia)
+    limitador = LimitadorTasa(config.ML_ASYNC_POR_SEGUNDO)
+
+    ids = list(dict.fromkeys(item_ids))
+    bloques = [ids[i:i + ITEMS_MULTIGET_MAX] for i in range(0, len(ids), ITEMS_MULTIGET_MAX)]
+
+    async with _nuevo_cliente(access_token, max_concurrencia) as client:
+
+        async def bloque(ids_bloque: List[str]) -> List[Dict[str, Any]]:
+            params = {'ids': ','.join(ids_bloque)}
+            if atributos:
+                params['attributes'] = ','.join(atributos)
+            try:
+                response = await _get(client, semaforo, limitador, "/items", params=params)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                print(f"⚠️ Error en multiget de items ({len(ids_bloque)} ids): {e}")
+                return []
+
+        respuestas = await asyncio.gather(*(bloque(b) for b in bloques))
+
+    items = {}
+    for respuesta in respuestas:
+        for entrada in respuesta:
+            if entrada.get('code') == 200 and entrada.get('body'):
+                items[entrada['body']['id']] = entrada['body']
+    return items
+
+
+# ============================================================================
+# ENVOLTURAS SÍNCRONAS
+# ============================================================================
+
+def _ejecutar(corrutina):
+    """asyncio.run, también si ya hay un loop corriendo en este hilo"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(corrutina)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, corrutina).result()
+
+
+def get_orders_detail(
+    access_token: str,
+    order_ids: Iterable[Any],
+    incluir_envios: bool = False,
+    retry_on_401: bool = True
+) -> Dict[Any, Optional[Dict[str, Any]]]:
+    """
+    Versión síncrona de obtener_detalles_async
+
+    Si alguna orden responde 401 refresca el token una vez y reintenta solo esas.
+
+    Returns:
+        Dict order_id -> orden (None si no se pudo obtener)
+    """
+
+    resultados = _ejecutar(obtener_detalles_async(access_token, order_ids, incluir_envios))
+
+    no_autorizadas = [order_id for order_id, r in resultados.items() if r['status'] == 401]
+    if no_autorizadas and retry_on_401:
+        from services import ml_token_provider
+
+        print("⚠️ Token expirado, intentando refrescar...")
+        nuevo_token = ml_token_provider.refrescar()
+        if nuevo_token:
+            resultados.update(_ejecutar(obtener_detalles_async(nuevo_token, no_autorizadas, incluir_envios)))
+
+    detalles = {}
+    for order_id, r in resultados.items():
+        if r['error']:
+            print(f"Error obteniendo detalle de orden {order_id}: {r['status']} {r['error']}")
+        detalles[order_id] = r['data']
+
+    return detalles
+
+
+def get_items(access_token: str, item_ids: Iterable[str], atributos: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Versión síncrona de obtener_items_async"""
+    return _ejecutar(obtener_items_async(access_token, item_ids, atributos))
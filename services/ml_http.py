@@ -0,0 +1,191 @@
+"""
+Cliente HTTP compartido para la API de Mercado Libre
+
+Una sola requests.Session con pool de conexiones (keep-alive), timeout por
+petición, reintentos con backoff + jitter en 429/5xx y contadores de latencia
+por endpoint. Todas las llamadas a ML pasan por aquí.
+"""
+
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+
+ML_API_URL = "https://api.mercadolibre.com"
+
+# Códigos que vale la pena reintentar
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_metricas: Dict[str, Dict[str, float]] = {}
+_metricas_lock = threading.Lock()
+
+
+# ============================================================================
+# SESIÓN
+# ============================================================================
+
+def get_session() -> requests.Session:
+    """Sesión compartida (se crea la primera vez que se usa)"""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config.ML_HTTP_POOL_SIZE,
+                    pool_maxsize=config.ML_HTTP_POOL_SIZE
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+
+    return _session
+
+
+def cerrar_session():
+    """Cierra la sesión y sus conexiones (la próxima llamada abre una nueva)"""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# ============================================================================
+# MÉTRICAS DE LATENCIA
+# ============================================================================
+
+def nombre_endpoint(metodo: str, url: str) -> str:
+    """'GET /orders/123' -> 'GET /orders/:id' para agrupar las métricas"""
+    ruta = url.split('://', 1)[-1]
+    ruta = '/' + ruta.split('/', 1)[1] if '/' in ruta else '/'
+    ruta = ruta.split('?', 1)[0]
+    ruta = re.sub(r'/\d+(?=/|$)', '/:id', ruta)
+    return f"{metodo} {ruta}"
+
+
+def registrar_metrica(endpoint: str, segundos: float, error: bool, reintentos: int):
+    with _metricas_lock:
+        m = _metricas.setdefault(endpoint, {
+            'llamadas': 0, 'errores': 0, 'reintentos': 0,
+            'tiempo_total': 0.0, 'tiempo_max': 0.0
+        })
+        m['llamadas'] += 1
+        m['errores'] += int(error)
+        m['reintentos'] += reintentos
+        m['tiempo_total'] += segundos
+        m['tiempo_max'] = max(m['tiempo_max'], segundos)
+
+
+def get_metricas() -> Dict[str, Dict[str, float]]:
+    """
+    Contadores por endpoint: llamadas, errores, reintentos, tiempo_total,
+    tiempo_max y tiempo_promedio (segundos, incluye reintentos)
+    """
+    with _metricas_lock:
+        resultado = {}
+        for endpoint, m in _metricas.items():
+            resultado[endpoint] = dict(m)
+            resultado[endpoint]['tiempo_promedio'] = m['tiempo_total'] / m['llamadas'] if m['llamadas'] else 0.0
+        return resultado
+
+
+def reiniciar_metricas():
+    with _metricas_lock:
+        _metricas.clear()
+
+
+# ============================================================================
+# PETICIONES
+# ============================================================================
+
+def espera_reintento(intento: int, response: Optional[Any]) -> float:
+    """Retry-After si ML lo envía; si no, backoff exponencial con jitter"""
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return float(retry_after)
+
+    base = config.ML_HTTP_BACKOFF * (2 ** intento)
+    return random.uniform(base / 2, base)
+
+
+def request(
+    metodo: str,
+    url: str,
+    access_token: Optional[str] = None,
+    timeout: Optional[float] = None,
+    reintentar_5xx: Optional[bool] = None,
+    **kwargs
+) -> requests.Response:
+    """
+    Hace una petición a ML por la sesión compartida
+
+    - Acepta URL completa o ruta relativa ('/orders/search')
+    - Reintenta con backoff + jitter en 429 y errores de conexión; en 5xx y
+      timeouts de lectura solo para GET (un POST pudo haberse procesado),
+      salvo reintentar_5xx
+    - No lanza por códigos HTTP: el que llama decide (raise_for_status, 401...)
+
+    Returns:
+        requests.Response. Si se agotan los reintentos por un error de
+        conexión, se propaga la requests.exceptions.RequestException.
+    """
+
+    if not url.startswith('http'):
+        url = ML_API_URL + url
+
+    if access_token:
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), 'Authorization': f'Bearer {access_token}'}
+
+    if reintentar_5xx is None:
+        reintentar_5xx = metodo.upper() == 'GET'
+
+    endpoint = nombre_endpoint(metodo.upper(), url)
+    session = get_session()
+    inicio = time.perf_counter()
+
+    for intento in range(config.ML_MAX_REINTENTOS + 1):
+        ultimo = intento == config.ML_MAX_REINTENTOS
+        response = None
+
+        try:
+            response = session.request(metodo, url, timeout=timeout or config.ML_HTTP_TIMEOUT, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Un ReadTimeout significa que ML pudo recibir la petición
+            enviado = isinstance(e, requests.exceptions.ReadTimeout)
+            if ultimo or (enviado and not reintentar_5xx):
+                registrar_metrica(endpoint, time.perf_counter() - inicio, True, intento)
+                raise
+        else:
+            reintentable = response.status_code == 429 or (
+                reintentar_5xx and response.status_code in CODIGOS_REINTENTABLES
+            )
+            if not reintentable or ultimo:
+                registrar_metrica(endpoint, time.perf_counter() - inicio, response.status_code >= 400, intento)
+                return response
+
+        espera = espera_reintento(intento, response)
+        motivo = response.status_code if response is not None else 'error de conexión'
+        print(f"⚠️ ML {endpoint} respondió {motivo}, reintentando en {espera:.1f}s...")
+        time.sleep(espera)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
@@ -4,9 +4,11 @@ Funciones para gestión de tokens de Mercado Libre en Supabase
 
 from typing import Dict, Any, Optional
 from datetime import datetime
+import time
 import requests
 import json
 import config
+from services import ml_http
 
 
 def load_ml_token_from_supabase() -> Optional[Dict[str, Any]]:
@@ -24,11 +26,34 @@ def load_ml_token_from_supabase() -> Optional[Dict[str, Any]]:
         return None
 
 
-def save_ml_token_to_supabase(token_data: Dict[str, Any]) -> bool:
-    """Guarda el token en Supabase"""
+def save_ml_token_to_supabase(token_data: Dict[str, Any], esperado_updated_at: Optional[str] = None) -> bool:
+    """
+    Guarda el token en Supabase
+    
+    Con esperado_updated_at solo lo guarda si el registro no cambió desde que
+    se leyó (compare-and-swap en update_ml_token); retorna False si otra
+    sesión ya guardó un token más nuevo.
+    """
     try:
         from database.supabase_client import supabase
         
+        if esperado_updated_at:
+            result = supabase.rpc('update_ml_token', {
+                'p_access_token': token_data['access_token'],
+                'p_refresh_token': token_data['refresh_token'],
+                'p_user_id': token_data.get('user_id'),
+                'p_nickname': token_data.get('nickname'),
+                'p_expires_in': token_data.get('expires_in'),
+                'p_expected_updated_at': esperado_updated_at
+            }).execute()
+            
+            if result.data is False:
+                print("⚠️ Otra sesión ya guardó un token más nuevo, no se sobrescribe")
+                return False
+            
+            print("✅ Token guardado en Supabase")
+            return True
+        
         # Eliminar tokens antiguos e insertar el nuevo
         supabase.table('ml_tokens').delete().neq('id', 0).execute()
         
@@ -47,11 +72,71 @@ def save_ml_token_to_supabase(token_data: Dict[str, Any]) -> bool:
         return False
 
 
-def refresh_ml_token_in_supabase() -> Optional[str]:
+# ============================================================================
+# REFRESCO ÚNICO ENTRE SESIONES
+# ============================================================================
+
+def reclamar_refresco(updated_at: Optional[str]) -> Optional[bool]:
+    """
+    Reserva el refresco del token leído (lease en ml_tokens)
+    
+    Returns:
+        True si esta sesión debe refrescar, False si otra ya lo está haciendo
+        (o el token ya cambió), None si la función SQL no está instalada
+    """
+    if not updated_at:
+        return None
+    
+    try:
+        from database.supabase_client import supabase
+        
+        result = supabase.rpc('claim_ml_token_refresh', {
+            'p_expected_updated_at': updated_at,
+            'p_lease_seconds': config.ML_TOKEN_LEASE_SEG
+        }).execute()
+        return bool(result.data)
+    except Exception as e:
+        print(f"⚠️ No se pudo reservar el refresco del token (¿falta claim_ml_token_refresh?): {e}")
+        return None
+
+
+def esperar_token_nuevo(updated_at_anterior: str) -> Optional[Dict[str, Any]]:
+    """Espera a que otra sesión guarde el token refrescado (hasta que venza su lease)"""
+    limite = time.monotonic() + config.ML_TOKEN_LEASE_SEG
+    
+    while time.monotonic() < limite:
+        time.sleep(0.5)
+        token_data = load_ml_token_from_supabase()
+        if token_data and token_data.get('updated_at') != updated_at_anterior:
+            return token_data
+    
+    return None
+
+
+def _token_vigente(token_data: Dict[str, Any]) -> bool:
+    """True si el token guardado no está por vencer (o no se conoce su vencimiento)"""
+    from services.ml_token_provider import _armar_token
+
+    token = _armar_token(token_data, 'supabase')
+    if not token:
+        return False
+    expira_en = token['expira_en']
+    return expira_en is None or expira_en - time.time() > config.ML_TOKEN_MARGEN_SEG
+
+
+def refresh_ml_token_in_supabase(token_actual: Optional[str] = None) -> Optional[str]:
     """
     Refresca el access token usando el refresh token
     Guarda el nuevo token en Supabase
     Retorna el nuevo access token o None si falla
+    
+    Solo una sesión a la vez llama a ML: la que reserva el refresco
+    (claim_ml_token_refresh). Las demás esperan el token que esa guarde.
+    
+    Args:
+        token_actual: access_token que tiene quien pide el refresco. Si el
+            guardado ya es otro y no está por vencer, otra sesión ya refrescó:
+            se devuelve ese sin reservar ni llamar a ML
     """
     try:
         # Obtener el refresh token desde Supabase
@@ -61,12 +146,36 @@ def refresh_ml_token_in_supabase() -> Optional[str]:
             print("❌ No se encontró refresh_token en Supabase")
             return None
         
+        if (token_actual and token_data.get('access_token') != token_actual
+                and _token_vigente(token_data)):
+            return token_data['access_token']
+        
+        updated_at = token_data.get('updated_at')
+        reclamo = reclamar_refresco(updated_at)
+        
+        if reclamo is False:
+            print("⏳ Otra sesión está refrescando el token, esperando...")
+            nuevo = esperar_token_nuevo(updated_at)
+            if nuevo:
+                return nuevo['access_token']
+            
+            # La otra sesión no terminó: reintentar la reserva una vez
+            token_data = load_ml_token_from_supabase()
+            if not token_data:
+                return None
+            if token_data.get('updated_at') != updated_at:
+                return token_data['access_token']
+            reclamo = reclamar_refresco(updated_at)
+            if reclamo is False:
+                print("❌ No se pudo reservar el refresco del token")
+                return None
+        
         refresh_token = token_data['refresh_token']
         user_id = token_data.get('user_id')
         nickname = token_data.get('nickname')
         
         # Hacer request para refrescar el token
-        url = "https://api.mercadolibre.com/oauth/token"
+        url = "/oauth/token"
         
         data = {
             'grant_type': 'refresh_token',
@@ -75,7 +184,7 @@ def refresh_ml_token_in_supabase() -> Optional[str]:
             'refresh_token': refresh_token
         }
         
-        response = requests.post(url, data=data)
+        response = ml_http.post(url, data=data)
         response.raise_for_status()
         
         new_token_data = response.json()
@@ -89,8 +198,15 @@ def refresh_ml_token_in_supabase() -> Optional[str]:
             'nickname': nickname
         }
         
-        # Guardar en Supabase
-        save_ml_token_to_supabase(token_info)
+        # Guardar en Supabase (compare-and-swap si se reservó el refresco)
+        if not save_ml_token_to_supabase(token_info, esperado_updated_at=updated_at if reclamo else None):
+            # El refresh_token rotado no quedó guardado: usar el que haya en
+            # Supabase (si otra sesión guardó uno nuevo) en vez de este
+            print("❌ No se pudo guardar el token refrescado en Supabase")
+            guardado = load_ml_token_from_supabase()
+            if guardado and guardado.get('updated_at') != updated_at:
+                return guardado['access_token']
+            return None
         
         print("✅ Token refrescado exitosamente en Supabase")
         return new_token_data['access_token']
@@ -0,0 +1,266 @@
+"""
+Proveedor del token de Mercado Libre en memoria
+
+Guarda access_token / user_id en el proceso con su vencimiento (expires_in)
+y lo refresca en segundo plano poco antes de que expire, para que las
+peticiones no tengan que ir a Supabase ni esperar un 401 en cada llamada.
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+import config
+
+
+_token: Optional[Dict[str, Any]] = None
+_lock = threading.RLock()
+# Cambia con cada refresco: quien esperó el lock sabe si otro hilo ya refrescó
+_generacion = 0
+_timer: Optional[threading.Timer] = None
+
+
+# ============================================================================
+# FUENTES DEL TOKEN
+# ============================================================================
+
+def _segundos_desde(fecha: Optional[str]) -> Optional[float]:
+    """Segundos transcurridos desde una fecha ISO (sin zona = hora local)"""
+    if not fecha:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(fecha).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return (datetime.now(timezone.utc) - dt).total_seconds()
+
+
+def _armar_token(datos: Dict[str, Any], origen: str) -> Optional[Dict[str, Any]]:
+    """
+    Token en caché a partir de un registro de Supabase / secrets / archivo
+
+    expira_en es un instante de time.time(); si no se conoce (sin expires_in
+    o sin fecha de emisión) queda None y solo se vuelve a leer la fuente
+    cada ML_TOKEN_RECARGA_SEG.
+    """
+    if not datos or not datos.get('access_token'):
+        return None
+
+    expira_en = None
+    expires_in = datos.get('expires_in')
+    edad = _segundos_desde(datos.get('updated_at') or datos.get('created_at'))
+    if expires_in and edad is not None:
+        expira_en = time.time() + float(expires_in) - edad
+
+    return {
+        'access_token': datos['access_token'],
+        'user_id': datos.get('user_id'),
+        'expira_en': expira_en,
+        'leido_en': time.time(),
+        'origen': origen
+    }
+
+
+def _leer_token_fuentes() -> Optional[Dict[str, Any]]:
+    """Lee el token desde Supabase, Streamlit Secrets o archivo local (en ese orden)"""
+    # 1. Supabase (fuente principal en producción)
+    try:
+        from services.ml_token_manager import load_ml_token_from_supabase
+        token = _armar_token(load_ml_token_from_supabase(), 'supabase')
+        if token:
+            return token
+    except Exception:
+        pass
+
+    # 2. Streamlit Secrets (fallback para Streamlit Cloud)
+    try:
+        import streamlit as st
+        if hasattr(st, 'secrets') and 'mercadolibre_token' in st.secrets:
+            token = _armar_token(dict(st.secrets['mercadolibre_token']), 'secrets')
+            if token:
+                return token
+    except (ImportError, KeyError, FileNotFoundError):
+        pass
+
+    # 3. Archivo local (desarrollo)
+    try:
+        with open('meli_tokens.json', 'r') as f:
+            return _armar_token(json.load(f), 'archivo')
+    except FileNotFoundError:
+        return None
+
+
+def _leer_user_id_alternativo() -> Optional[int]:
+    """user_id desde Streamlit Secrets o archivo local (el registro de Supabase puede no traerlo)"""
+    # 1. Streamlit Secrets
+    try:
+        import streamlit as st
+        if hasattr(st, 'secrets') and 'mercadolibre_token' in st.secrets:
+            user_id = st.secrets['mercadolibre_token'].get('user_id')
+            if user_id:
+                return user_id
+    except (ImportError, KeyError, FileNotFoundError):
+        pass
+
+    # 2. Archivo local
+    try:
+        with open('meli_tokens.json', 'r') as f:
+            return json.load(f).get('user_id')
+    except FileNotFoundError:
+        return None
+
+
+# ============================================================================
+# CACHÉ Y REFRESCO
+# ============================================================================
+
+def _vigente(token: Optional[Dict[str, Any]]) -> bool:
+    """True si el token en caché se puede usar sin ir a la fuente"""
+    if not token:
+        return False
+    if token['expira_en'] is None:
+        return time.time() - token['leido_en'] < config.ML_TOKEN_RECARGA_SEG
+    return time.time() < token['expira_en'] - config.ML_TOKEN_MARGEN_SEG
+
+
+def _programar_refresco(token: Dict[str, Any], en_segundos: Optional[float] = None):
+    """Agenda el refresco en segundo plano un poco antes del vencimiento"""
+    global _timer
+
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
+
+    if en_segundos is None:
+        if token['expira_en'] is None:
+            return
+        en_segundos = token['expira_en'] - config.ML_TOKEN_MARGEN_SEG - time.time()
+
+    _timer = threading.Timer(max(en_segundos, 0), _refrescar_en_segundo_plano)
+    _timer.daemon = True
+    _timer.start()
+
+
+def _establecer(token: Optional[Dict[str, Any]], programar: bool = True):
+    global _token
+
+    _token = token
+    if token and programar:
+        _programar_refresco(token)
+
+
+def _refrescar_en_segundo_plano():
+    try:
+        if not refrescar():
+            print(f"⚠️ No se pudo refrescar el token ML, reintentando en {config.ML_TOKEN_REINTENTO_SEG}s")
+            with _lock:
+                if _token:
+                    _programar_refresco(_token, config.ML_TOKEN_REINTENTO_SEG)
+    except Exception as e:
+        print(f"❌ Error refrescando token ML en segundo plano: {e}")
+
+
+def refrescar() -> Optional[str]:
+    """
+    Refresca el token contra ML ahora mismo y actualiza la caché
+
+    Single-flight: si otro hilo refrescó mientras este esperaba el lock, se
+    usa ese token en vez de pedir otro (entre procesos lo coordina
+    ml_token_manager.refresh_ml_token_in_supabase).
+
+    Returns:
+        Nuevo access_token o None si falla
+    """
+    global _generacion
+    from services.ml_api import refresh_access_token
+
+    generacion = _generacion
+    with _lock:
+        if _generacion != generacion and _token:
+            return _token['access_token']
+
+        nuevo = refresh_access_token((_token or {}).get('access_token'))
+        if not nuevo:
+            return None
+        _generacion += 1
+
+        token = _leer_token_fuentes()
+        if not token or token['access_token'] != nuevo:
+            # La fuente no quedó actualizada: usar el token nuevo igual
+            token = _armar_token({
+                'access_token': nuevo,
+                'user_id': (_token or {}).get('user_id'),
+                'expires_in': config.ML_TOKEN_TTL_SEG,
+                'updated_at': datetime.now(timezone.utc).isoformat()
+            }, 'refresco')
+
+        _establecer(token)
+        return nuevo
+
+
+def get_token() -> Optional[Dict[str, Any]]:
+    """
+    Token vigente desde la caché (solo va a la fuente si no hay o venció)
+
+    Returns:
+        Dict con access_token, user_id, expira_en y origen, o None
+    """
+    token = _token
+    if _vigente(token):
+        return token
+
+    with _lock:
+        if _vigente(_token):
+            return _token
+
+        token = _leer_token_fuentes()
+        por_vencer = (
+            token is not None and token['expira_en'] is not None
+            and time.time() >= token['expira_en'] - config.ML_TOKEN_MARGEN_SEG
+        )
+        _establecer(token, programar=not por_vencer)
+
+        if por_vencer:
+            print("⚠️ Token ML vencido o por vencer, refrescando...")
+            if refrescar():
+                return _token
+            _programar_refresco(token, config.ML_TOKEN_REINTENTO_SEG)
+
+        return token
+
+
+def get_access_token() -> Optional[str]:
+    token = get_token()
+    return token['access_token'] if token else None
+
+
+def get_user_id() -> Optional[int]:
+    """
+    user_id del token en caché; si la fuente del token no lo trae, se busca
+    en Streamlit Secrets y luego en meli_tokens.json (y queda en la caché)
+    """
+    token = get_token()
+    if token and token['user_id']:
+        return token['user_id']
+
+    user_id = _leer_user_id_alternativo()
+    if user_id and token:
+        with _lock:
+            if _token is token:
+                token['user_id'] = user_id
+    return user_id
+
+
+def invalidar():
+    """Descarta la caché (la próxima llamada vuelve a leer la fuente)"""
+    global _token, _timer
+
+    with _lock:
+        _token = None
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
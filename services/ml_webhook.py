@@ -0,0 +1,268 @@
+"""
+Ingesta de notificaciones de Mercado Libre (topic orders_v2)
+
+ML avisa por POST cada vez que cambia una orden. Este servicio responde de
+inmediato, junta los order_id en una cola sin duplicados y un hilo trabajador
+los procesa por lotes: trae el detalle (ml_async) y lo escribe en `orders`
+del OMS, que es la tabla que lee get_ml_orders.
+
+Uso:
+    python -m services.ml_webhook                 # escucha en ML_WEBHOOK_PORT
+    python -m services.ml_webhook --prueba 123    # envía una notificación falsa
+
+Para probar sin ML ni Supabase, ProcesadorNotificaciones recibe funciones
+`obtener` y `guardar` de reemplazo.
+"""
+
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional, Callable
+
+import requests
+
+import config
+
+
+TOPIC_ORDENES = "orders_v2"
+_RECURSO_ORDEN = re.compile(r'^/orders/(\d+)$')
+
+
+# ============================================================================
+# NOTIFICACIONES
+# ============================================================================
+
+def order_id_de_notificacion(payload: Dict[str, Any]) -> Optional[str]:
+    """
+    order_id de una notificación de ML, o None si no es de órdenes o no es
+    de esta aplicación / vendedor
+
+    Formato: {"topic": "orders_v2", "resource": "/orders/2000001234",
+              "user_id": 123, "application_id": 456, ...}
+    """
+    if payload.get('topic') != TOPIC_ORDENES:
+        return None
+
+    app_id = payload.get('application_id')
+    if app_id and config.ML_APP_ID and str(app_id) != str(config.ML_APP_ID):
+        return None
+
+    match = _RECURSO_ORDEN.match(str(payload.get('resource', '')))
+    return match.group(1) if match else None
+
+
+def _obtener_desde_ml(order_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Detalle de las órdenes desde la API de ML (por defecto)"""
+    from services import ml_async, ml_token_provider
+
+    access_token = ml_token_provider.get_access_token()
+    if not access_token:
+        raise RuntimeError("No hay token de Mercado Libre disponible")
+    return ml_async.get_orders_detail(access_token, order_ids)
+
+
+def _guardar_en_oms(filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Escribe las órdenes en `orders` del OMS (por defecto)"""
+    from database import supabase_client as db
+
+    return db.upsert_oms_orders_ml(filas)
+
+
+# ============================================================================
+# COLA Y TRABAJADOR POR LOTES
+# ============================================================================
+
+class ProcesadorNotificaciones:
+    """
+    Cola de order_id pendientes + hilo que los procesa por lotes
+
+    Un lote sale cuando junta `tamano_lote` órdenes o cuando la más antigua
+    lleva `espera_seg` en la cola. Varias notificaciones de la misma orden
+    dentro de un lote se procesan una sola vez.
+    """
+
+    def __init__(
+        self,
+        obtener: Callable[[List[str]], Dict[str, Optional[Dict[str, Any]]]] = _obtener_desde_ml,
+        guardar: Callable[[List[Dict[str, Any]]], Dict[str, Any]] = _guardar_en_oms,
+        tamano_lote: Optional[int] = None,
+        espera_seg: Optional[float] = None,
+        max_intentos: Optional[int] = None
+    ):
+        self.obtener = obtener
+        self.guardar = guardar
+        self.tamano_lote = tamano_lote or config.ML_WEBHOOK_LOTE
+        self.espera_seg = espera_seg if espera_seg is not None else config.ML_WEBHOOK_ESPERA_SEG
+        self.max_intentos = max_intentos or config.ML_WEBHOOK_MAX_INTENTOS
+
+        self._pendientes: Dict[str, int] = {}  # order_id -> intentos fallidos
+        self._desde: Optional[float] = None
+        self._cond = threading.Condition()
+        self._detener = False
+        self._hilo: Optional[threading.Thread] = None
+        self.stats = {'recibidas': 0, 'guardadas': 0, 'fallidas': 0, 'lotes': 0}
+
+    def encolar(self, order_id: str, intentos: int = 0):
+        with self._cond:
+            self._pendientes.setdefault(order_id, intentos)
+            if self._desde is None:
+                self._desde = time.monotonic()
+            if len(self._pendientes) >= self.tamano_lote:
+                self._cond.notify()
+
+    def recibir(self, payload: Dict[str, Any]) -> bool:
+        """Encola la orden de una notificación; False si la notificación se ignora"""
+        order_id = order_id_de_notificacion(payload)
+        if not order_id:
+            return False
+        self.stats['recibidas'] += 1
+        self.encolar(order_id)
+        return True
+
+    def _tomar_lote(self) -> Dict[str, int]:
+        with self._cond:
+            while not self._detener:
+                if self._pendientes and (
+                    len(self._pendientes) >= self.tamano_lote
+                    or time.monotonic() - self._desde >= self.espera_seg
+                ):
+                    break
+                espera = self.espera_seg if self._desde is None else self.espera_seg - (time.monotonic() - self._desde)
+                self._cond.wait(timeout=max(espera, 0.05))
+
+            ids = list(self._pendientes)[:self.tamano_lote]
+            lote = {order_id: self._pendientes.pop(order_id) for order_id in ids}
+            self._desde = time.monotonic() if self._pendientes else None
+            return lote
+
+    def procesar_lote(self, lote: Dict[str, int]) -> Dict[str, Any]:
+        """Trae el detalle del lote y lo guarda; reencola lo que falló"""
+        from services.ml_api import transform_order_for_oms
+
+        if not lote:
+            return {"success": True, "guardadas": 0, "fallidas": 0}
+
+        try:
+            detalles = self.obtener(list(lote))
+        except Exception as e:
+            print(f"[ERROR] Webhook: no se pudo obtener el detalle de {len(lote)} órdenes: {e}")
+            detalles = {}
+
+        filas = [transform_order_for_oms(orden) for orden in detalles.values() if orden]
+        sin_detalle = [order_id for order_id in lote if not detalles.get(order_id)]
+
+        resultado = self.guardar(filas) if filas else {"success": True}
+        if not resultado.get("success"):
+            print(f"[ERROR] Webhook: no se pudieron guardar {len(filas)} órdenes: {resultado.get('error')}")
+            sin_detalle = list(lote)
+            filas = []
+
+        self.stats['lotes'] += 1
+        self.stats['guardadas'] += len(filas)
+
+        for order_id in sin_detalle:
+            intentos = lote[order_id] + 1
+            if intentos < self.max_intentos:
+                self.encolar(order_id, intentos)
+            else:
+                self.stats['fallidas'] += 1
+                print(f"[WARN] Webhook: orden {order_id} descartada tras {intentos} intentos")
+
+        return {"success": not sin_detalle, "guardadas": len(filas), "fallidas": len(sin_detalle)}
+
+    def _ciclo(self):
+        while True:
+            lote = self._tomar_lote()
+            if lote:
+                self.procesar_lote(lote)
+            elif self._detener:
+                return
+
+    def iniciar(self):
+        self._detener = False
+        self._hilo = threading.Thread(target=self._ciclo, name="ml-webhook", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 10):
+        """Procesa lo pendiente y detiene el hilo"""
+        with self._cond:
+            self._detener = True
+            self._cond.notify()
+        if self._hilo:
+            self._hilo.join(timeout)
+
+
+# ============================================================================
+# SERVIDOR HTTP
+# ============================================================================
+
+def crear_servidor(procesador: ProcesadorNotificaciones, host: str = "0.0.0.0", port: Optional[int] = None) -> ThreadingHTTPServer:
+    """Servidor que recibe las notificaciones en ML_WEBHOOK_PATH y responde 200 al instante"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.split('?', 1)[0] != config.ML_WEBHOOK_PATH:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            try:
+                largo = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(largo) or b'{}')
+            except (ValueError, json.JSONDecodeError):
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            procesador.recibir(payload)
+
+            # ML reintenta si no recibe 200 rápido: siempre 200 para notificaciones válidas
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port or config.ML_WEBHOOK_PORT), Handler)
+
+
+def enviar_notificacion_prueba(order_id: str, url: Optional[str] = None, user_id: Optional[int] = None) -> int:
+    """Envía una notificación falsa de orders_v2 (para pruebas locales); retorna el código HTTP"""
+    url = url or f"http://localhost:{config.ML_WEBHOOK_PORT}{config.ML_WEBHOOK_PATH}"
+    payload = {
+        'topic': TOPIC_ORDENES,
+        'resource': f"/orders/{order_id}",
+        'user_id': user_id,
+        'application_id': config.ML_APP_ID,
+        'attempts': 1,
+        'sent': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+    }
+    return requests.post(url, json=payload, timeout=5).status_code
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--prueba':
+        for order_id in sys.argv[2:]:
+            print(f"📨 {order_id}: {enviar_notificacion_prueba(order_id)}")
+        return
+
+    procesador = ProcesadorNotificaciones()
+    procesador.iniciar()
+    servidor = crear_servidor(procesador)
+    print(f"🔔 Escuchando notificaciones de ML en :{config.ML_WEBHOOK_PORT}{config.ML_WEBHOOK_PATH}")
+
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        procesador.detener()
+        print(f"✅ Webhook detenido: {procesador.stats}")
+
+
+if __name__ == "__main__":
+    main()
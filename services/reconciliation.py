@@ -4,6 +4,7 @@ Motor de Reconciliación - Comparar órdenes ML con facturas TBC
 
 from typing import List, Dict, Any
 from datetime import datetime
+import hashlib
 import json
 
 # ============================================================================
@@ -17,6 +18,13 @@ TIPO_FACTURA_SIN_REMISION = "factura_sin_remision"
 TIPO_FECHA_DIFERENTE = "fecha_diferente"
 TIPO_PEDIDOS_SIN_FACTURAR = "pedidos_sin_facturar"  # Nuevo: pedidos antiguos sin remisión
 
+# Resultado de una remisión que coincide (no es discrepancia; lo usan el
+# motor DuckDB y la reconciliación incremental para el estado por remisión)
+TIPO_COINCIDENCIA = "coincidencia"
+
+# Tolerancia de valor entre ML y TBC (en pesos)
+TOLERANCIA_VALOR = 100
+
 # ============================================================================
 # RECONCILIACIÓN
 # ============================================================================
@@ -30,6 +38,9 @@ def reconciliar_ml_tbc(
     """
     Compara órdenes de ML con facturas de TBC y encuentra discrepancias
     
+    Las coincidencias y discrepancias guardan referencias a las listas de
+    órdenes / facturas de entrada, no copias.
+    
     Args:
         ordenes_ml: Lista de órdenes de ML (desde Supabase)
         facturas_tbc: Diccionario de facturas agrupadas por remisión
@@ -54,9 +65,11 @@ def reconciliar_ml_tbc(
     for orden in ordenes_ml:
         remision = orden.get('remision')
         if remision:
-            if remision not in ordenes_por_remision:
-                ordenes_por_remision[remision] = []
-            ordenes_por_remision[remision].append(orden)
+            grupo = ordenes_por_remision.get(remision)
+            if grupo is None:
+                ordenes_por_remision[remision] = [orden]
+            else:
+                grupo.append(orden)
     
     # Comparar cada remisión de ML con TBC
     for remision, ordenes in ordenes_por_remision.items():
@@ -76,12 +89,12 @@ def reconciliar_ml_tbc(
         
         # Calcular totales
         total_ml = sum(orden['total'] for orden in ordenes)
-        total_tbc = sum(f.get('valor_total', 0) for f in facturas if f.get('valor_total'))
+        total_tbc = _total_tbc(facturas)
         
         # Comparar valores
         diferencia = abs(total_ml - total_tbc)
         
-        if diferencia > 100:  # Tolerancia de $100
+        if diferencia > TOLERANCIA_VALOR:
             discrepancias.append({
                 'tipo': TIPO_VALOR_DIFERENTE,
                 'remision': remision,
@@ -117,20 +130,21 @@ def reconciliar_ml_tbc(
                     'fecha': fecha_ml,
                     'cantidad_ordenes': len(ordenes),
                     'cantidad_productos': len(facturas),
-                    'ordenes_ml': ordenes,  # Incluir detalles completos de órdenes ML
-                    'facturas_tbc': facturas  # Incluir detalles completos de facturas TBC
+                    'ordenes_ml': ordenes,  # Referencia a las órdenes ML
+                    'facturas_tbc': facturas  # Referencia a las facturas TBC
                 })
     
-    # Buscar facturas en TBC que no están en ML
+    # Buscar facturas en TBC que no están en ML (contadas en la misma pasada)
+    total_comparaciones = len(ordenes_por_remision)
     for remision, facturas in facturas_tbc.items():
         if remision not in ordenes_por_remision:
-            total_tbc = sum(f.get('valor_total', 0) for f in facturas if f.get('valor_total'))
+            total_comparaciones += 1
             
             discrepancias.append({
                 'tipo': TIPO_FACTURA_SIN_REMISION,
                 'remision': remision,
                 'detalle': {
-                    'total_tbc': total_tbc,
+                    'total_tbc': _total_tbc(facturas),
                     'facturas_tbc': facturas,
                     'mensaje': f'Factura {remision} en TBC pero no tiene remisión asignada en ML'
                 }
@@ -138,23 +152,7 @@ def reconciliar_ml_tbc(
     
     # Buscar pedidos sin facturar (sin remisión) anteriores a la fecha TBC
     if fecha_minima_tbc and ordenes_sin_remision:
-        import pytz
-        COLOMBIA_TZ = pytz.timezone('America/Bogota')
-        
-        pedidos_antiguos_sin_facturar = []
-        
-        for orden in ordenes_sin_remision:
-            if orden.get('fecha_orden'):
-                # Convertir fecha_orden de UTC a hora de Colombia
-                fecha_utc = datetime.fromisoformat(orden['fecha_orden'].replace('Z', '+00:00'))
-                fecha_colombia = fecha_utc.astimezone(COLOMBIA_TZ)
-                
-                # Extraer solo la fecha (YYYY-MM-DD) en hora de Colombia
-                fecha_orden_str = fecha_colombia.strftime('%Y-%m-%d')
-                
-                # Comparar fechas como strings (formato YYYY-MM-DD)
-                if fecha_orden_str < fecha_minima_tbc:
-                    pedidos_antiguos_sin_facturar.append(orden)
+        pedidos_antiguos_sin_facturar = filtrar_pedidos_sin_facturar(ordenes_sin_remision, fecha_minima_tbc)
         
         if pedidos_antiguos_sin_facturar:
             discrepancias.append({
@@ -169,7 +167,6 @@ def reconciliar_ml_tbc(
             })
     
     # Calcular porcentaje de coincidencia
-    total_comparaciones = len(ordenes_por_remision) + len([r for r in facturas_tbc.keys() if r not in ordenes_por_remision])
     porcentaje = (len(coincidencias) / total_comparaciones * 100) if total_comparaciones > 0 else 0
     
     return {
@@ -181,6 +178,52 @@ def reconciliar_ml_tbc(
     }
 
 
+def _total_tbc(facturas: List[Dict[str, Any]]) -> float:
+    """Suma de valor_total de las líneas de una remisión (sin vacíos ni ceros)"""
+    total = 0
+    for factura in facturas:
+        valor = factura.get('valor_total')
+        if valor:
+            total += valor
+    return total
+
+
+def filtrar_pedidos_sin_facturar(
+    ordenes_sin_remision: List[Dict[str, Any]],
+    fecha_minima_tbc: str
+) -> List[Dict[str, Any]]:
+    """
+    Órdenes cuya fecha (en hora de Colombia) es anterior a fecha_minima_tbc
+    
+    En vez de convertir cada orden a hora de Colombia, se compara contra el
+    instante en que empieza fecha_minima_tbc en Colombia.
+    """
+    
+    import pytz
+    COLOMBIA_TZ = pytz.timezone('America/Bogota')
+    
+    corte = COLOMBIA_TZ.localize(datetime.fromisoformat(fecha_minima_tbc))
+    
+    pendientes = []
+    
+    for orden in ordenes_sin_remision:
+        fecha_orden = orden.get('fecha_orden')
+        if not fecha_orden:
+            continue
+        
+        fecha_utc = datetime.fromisoformat(fecha_orden.replace('Z', '+00:00'))
+        
+        if fecha_utc.tzinfo is None:
+            # Sin zona horaria: se interpreta en la hora local, como astimezone()
+            fecha_str = fecha_utc.astimezone(COLOMBIA_TZ).strftime('%Y-%m-%d')
+            if fecha_str < fecha_minima_tbc:
+                pendientes.append(orden)
+        elif fecha_utc < corte:
+            pendientes.append(orden)
+    
+    return pendientes
+
+
 # ============================================================================
 # GENERAR REPORTE
 # ============================================================================
@@ -205,3 +248,57 @@ def generar_resumen_discrepancias(resultado: Dict[str, Any]) -> Dict[str, int]:
             resumen[tipo] += 1
     
     return resumen
+
+
+# ============================================================================
+# PERSISTIR RESULTADOS
+# ============================================================================
+
+def clave_discrepancia(remision: str, tipo: str, alcance: str) -> str:
+    """Clave determinística de una discrepancia: la misma en cada corrida del mismo alcance"""
+    return hashlib.sha256(f"{alcance}|{tipo}|{remision}".encode('utf-8')).hexdigest()
+
+
+def _detalle_compacto(detalle: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Detalle para guardar en la base: los valores simples tal cual y, en vez
+    de las órdenes / líneas completas, sus order_id y la cantidad de líneas
+    """
+    compacto = {
+        k: v for k, v in detalle.items()
+        if k not in ('ordenes_ml', 'facturas_tbc', 'ordenes')
+    }
+    
+    ordenes = detalle.get('ordenes_ml') or detalle.get('ordenes')
+    if ordenes:
+        compacto['order_ids'] = [o.get('order_id') for o in ordenes]
+    if detalle.get('facturas_tbc') is not None:
+        compacto['lineas_tbc'] = len(detalle['facturas_tbc'])
+    
+    return compacto
+
+
+def discrepancias_para_guardar(resultado: Dict[str, Any], alcance: str) -> List[Dict[str, Any]]:
+    """
+    Filas de la tabla discrepancias a partir de la salida de reconciliar_ml_tbc
+    
+    Args:
+        resultado: Salida de reconciliar_ml_tbc (o de los otros motores)
+        alcance: Identificador de la corrida (p. ej. hash del archivo TBC)
+    """
+    filas = []
+    
+    for disc in resultado['discrepancias']:
+        detalle = _detalle_compacto(disc.get('detalle') or {})
+        order_ids = detalle.get('order_ids') or []
+        
+        filas.append({
+            'clave': clave_discrepancia(disc['remision'], disc['tipo'], alcance),
+            'alcance': alcance,
+            'remision': disc['remision'],
+            'order_id': order_ids[0] if len(order_ids) == 1 else None,
+            'tipo_error': disc['tipo'],
+            'detalle': detalle
+        })
+    
+    return filas
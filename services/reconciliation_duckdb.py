@@ -0,0 +1,304 @@
+"""
+Motor de reconciliación sobre DuckDB
+
+Carga las órdenes ML y las líneas TBC como tablas en una base DuckDB en
+memoria y resuelve el cruce por remisión, la tolerancia de valor, la
+comparación de fechas y los faltantes de cada lado con un FULL JOIN y
+agregaciones. Pensado para corridas de varios meses (millones de líneas)
+sin crear un objeto Python por remisión.
+
+Devuelve la misma estructura que reconciliation.reconciliar_ml_tbc.
+DuckDB es opcional: si no está instalado, reconciliar_duckdb lanza ImportError.
+"""
+
+from typing import Dict, List, Any, Optional, Union
+
+import pandas as pd
+
+from services import reconciliation
+from services.reconciliation import (
+    TIPO_COINCIDENCIA,
+    TIPO_VALOR_DIFERENTE,
+    TIPO_REMISION_SIN_FACTURA,
+    TIPO_FACTURA_SIN_REMISION,
+    TIPO_FECHA_DIFERENTE,
+    TIPO_PEDIDOS_SIN_FACTURAR,
+    TOLERANCIA_VALOR,
+)
+
+# ============================================================================
+# CONSULTA
+# ============================================================================
+
+_SQL_RECONCILIACION = f"""
+WITH ml AS (
+    SELECT
+        remision,
+        SUM(total) AS total_ml,
+        FIRST(fecha_remision ORDER BY pos) AS fecha_ml,
+        COUNT(*) AS cantidad_ordenes,
+        MIN(pos) AS pos_ml,
+        LIST(pos ORDER BY pos) AS posiciones_ml
+    FROM ordenes
+    WHERE remision IS NOT NULL AND remision <> ''
+    GROUP BY remision
+),
+tbc AS (
+    SELECT
+        remision,
+        COALESCE(SUM(valor_total) FILTER (WHERE es_linea AND valor_total IS NOT NULL AND valor_total <> 0), 0) AS total_tbc,
+        FIRST(fecha ORDER BY pos) FILTER (WHERE es_linea) AS fecha_tbc,
+        COUNT(*) FILTER (WHERE es_linea) AS cantidad_productos,
+        MIN(pos) AS pos_tbc,
+        LIST(pos ORDER BY pos) FILTER (WHERE es_linea) AS posiciones_tbc
+    FROM lineas
+    GROUP BY remision
+)
+SELECT
+    COALESCE(ml.remision, tbc.remision) AS remision,
+    CASE
+        WHEN ml.remision IS NULL THEN '{TIPO_FACTURA_SIN_REMISION}'
+        WHEN tbc.remision IS NULL OR cantidad_productos = 0 THEN '{TIPO_REMISION_SIN_FACTURA}'
+        WHEN ABS(total_ml - total_tbc) > $tolerancia THEN '{TIPO_VALOR_DIFERENTE}'
+        WHEN COALESCE(fecha_ml, '') <> '' AND COALESCE(fecha_tbc, '') <> ''
+             AND fecha_ml <> fecha_tbc THEN '{TIPO_FECHA_DIFERENTE}'
+        ELSE '{TIPO_COINCIDENCIA}'
+    END AS tipo,
+    total_ml,
+    total_tbc,
+    ABS(total_ml - total_tbc) AS diferencia,
+    fecha_ml,
+    fecha_tbc,
+    cantidad_ordenes,
+    cantidad_productos,
+    ml.remision IS NOT NULL AS en_ml,
+    tbc.remision IS NOT NULL AS en_tbc,
+    posiciones_ml,
+    posiciones_tbc
+FROM ml
+FULL OUTER JOIN tbc ON ml.remision = tbc.remision
+ORDER BY ml.remision IS NULL, COALESCE(pos_ml, pos_tbc)
+"""
+
+
+# ============================================================================
+# CARGA DE DATOS
+# ============================================================================
+
+def _tabla_ordenes(ordenes_ml: Union[List[Dict[str, Any]], pd.DataFrame]) -> pd.DataFrame:
+    """Columnas mínimas de las órdenes (remision, total, fecha_remision) + posición"""
+    if isinstance(ordenes_ml, pd.DataFrame):
+        df = pd.DataFrame({
+            'remision': ordenes_ml['remision'],
+            'total': ordenes_ml['total'],
+            'fecha_remision': ordenes_ml.get('fecha_remision'),
+        }).reset_index(drop=True)
+    else:
+        df = pd.DataFrame({
+            'remision': [o.get('remision') for o in ordenes_ml],
+            'total': [o.get('total') for o in ordenes_ml],
+            'fecha_remision': [o.get('fecha_remision') for o in ordenes_ml],
+        })
+
+    return _normalizar(df, texto=('remision', 'fecha_remision'), numero='total')
+
+
+def _tabla_lineas(facturas_tbc: Union[Dict[str, List[Dict[str, Any]]], List[Dict[str, Any]], pd.DataFrame]):
+    """
+    Columnas mínimas de las líneas TBC (remision, fecha, valor_total) + posición
+
+    Acepta las facturas agrupadas por remisión (formato de reconciliar_ml_tbc),
+    la lista plana del parser o el DataFrame de parse_resuxdoc_xls_vectorizado.
+    Una remisión agrupada sin líneas queda como una fila con es_linea=False:
+    reconciliar_ml_tbc la cuenta igual (total_facturas_tbc y comparaciones).
+
+    Returns:
+        (DataFrame, lista de líneas originales indexada por posición o None)
+    """
+    if isinstance(facturas_tbc, pd.DataFrame):
+        df = facturas_tbc[['remision', 'fecha', 'valor_total']].reset_index(drop=True)
+        df['es_linea'] = True
+        originales = None
+    elif isinstance(facturas_tbc, dict):
+        remisiones, originales = [], []
+        for remision, facturas in facturas_tbc.items():
+            if facturas:
+                remisiones.extend([remision] * len(facturas))
+                originales.extend(facturas)
+            else:
+                remisiones.append(remision)
+                originales.append(None)
+        df = pd.DataFrame({
+            'remision': remisiones,
+            'fecha': [f.get('fecha') if f else None for f in originales],
+            'valor_total': [f.get('valor_total') if f else None for f in originales],
+            'es_linea': [f is not None for f in originales],
+        })
+    else:
+        originales = facturas_tbc
+        df = pd.DataFrame({
+            'remision': [f.get('remision') for f in originales],
+            'fecha': [f.get('fecha') for f in originales],
+            'valor_total': [f.get('valor_total') for f in originales],
+            'es_linea': True,
+        })
+
+    return _normalizar(df, texto=('remision', 'fecha'), numero='valor_total'), originales
+
+
+def _normalizar(df: pd.DataFrame, texto: tuple, numero: str) -> pd.DataFrame:
+    """Tipos fijos para DuckDB: texto como string (nulos conservados) y número como float"""
+    df = df.copy()
+    for columna in texto:
+        df[columna] = df[columna].astype('string')
+    df[numero] = pd.to_numeric(df[numero], errors='coerce').astype('float64')
+    if 'es_linea' in df:
+        df['es_linea'] = df['es_linea'].astype('bool')
+    df['pos'] = range(len(df))
+    return df
+
+
+# ============================================================================
+# MOTOR
+# ============================================================================
+
+def reconciliar_duckdb(
+    ordenes_ml: Union[List[Dict[str, Any]], pd.DataFrame],
+    facturas_tbc: Union[Dict[str, List[Dict[str, Any]]], List[Dict[str, Any]], pd.DataFrame],
+    fecha_minima_tbc: str = None,
+    ordenes_sin_remision: List[Dict[str, Any]] = None,
+    incluir_detalle: bool = True,
+    conexion=None
+) -> Dict[str, Any]:
+    """
+    Reconciliación ML vs TBC resuelta en DuckDB
+
+    Mismas reglas y misma salida que reconciliar_ml_tbc. Con
+    incluir_detalle=False los hallazgos no llevan las listas ordenes_ml /
+    facturas_tbc (solo totales, fechas y cantidades), que es lo que más
+    memoria ocupa en corridas grandes.
+
+    Args:
+        ordenes_ml: Órdenes ML (lista de dicts o DataFrame con remision, total, fecha_remision)
+        facturas_tbc: Facturas agrupadas por remisión, lista plana o DataFrame del parser
+        fecha_minima_tbc: Fecha mínima del archivo TBC para detectar pedidos sin facturar
+        ordenes_sin_remision: Órdenes sin remisión para detectar pedidos antiguos
+        incluir_detalle: Incluir las órdenes y líneas de cada remisión
+        conexion: Conexión DuckDB a usar (por defecto una en memoria)
+    """
+    import duckdb
+
+    tabla_ordenes = _tabla_ordenes(ordenes_ml)
+    tabla_lineas, lineas_originales = _tabla_lineas(facturas_tbc)
+
+    con = conexion or duckdb.connect()
+    try:
+        con.register('ordenes', tabla_ordenes)
+        con.register('lineas', tabla_lineas)
+        filas = con.execute(_SQL_RECONCILIACION, {'tolerancia': TOLERANCIA_VALOR}).fetchall()
+        columnas = [d[0] for d in con.description]
+    finally:
+        con.unregister('ordenes')
+        con.unregister('lineas')
+        if conexion is None:
+            con.close()
+
+    ordenes_originales = None
+    if incluir_detalle:
+        if isinstance(ordenes_ml, pd.DataFrame):
+            ordenes_originales = ordenes_ml.to_dict('records')
+        else:
+            ordenes_originales = ordenes_ml
+        if lineas_originales is None:
+            lineas_originales = facturas_tbc.to_dict('records')
+
+    coincidencias = []
+    discrepancias = []
+    total_ml_remisiones = 0
+    total_tbc_remisiones = 0
+
+    for fila in filas:
+        r = dict(zip(columnas, fila))
+        tipo = r['tipo']
+        remision = r['remision']
+
+        if r['en_ml']:
+            total_ml_remisiones += 1
+        if r['en_tbc']:
+            total_tbc_remisiones += 1
+
+        ordenes = facturas = None
+        if incluir_detalle:
+            if r['en_ml']:
+                ordenes = [ordenes_originales[p] for p in r['posiciones_ml']]
+            # Remisión en ML con grupo TBC vacío: como en reconciliar_ml_tbc, sin facturas_tbc
+            if r['en_tbc'] and tipo != TIPO_REMISION_SIN_FACTURA:
+                facturas = [lineas_originales[p] for p in (r['posiciones_tbc'] or [])]
+
+        if tipo == TIPO_COINCIDENCIA:
+            coincidencia = {
+                'remision': remision,
+                'total': r['total_ml'],
+                'fecha': r['fecha_ml'],
+                'cantidad_ordenes': r['cantidad_ordenes'],
+                'cantidad_productos': r['cantidad_productos'],
+            }
+            if incluir_detalle:
+                coincidencia['ordenes_ml'] = ordenes
+                coincidencia['facturas_tbc'] = facturas
+            coincidencias.append(coincidencia)
+            continue
+
+        if tipo == TIPO_REMISION_SIN_FACTURA:
+            detalle = {'mensaje': f'Remisión {remision} asignada en ML pero no encontrada en TBC'}
+        elif tipo == TIPO_FACTURA_SIN_REMISION:
+            detalle = {
+                'total_tbc': r['total_tbc'],
+                'mensaje': f'Factura {remision} en TBC pero no tiene remisión asignada en ML'
+            }
+        elif tipo == TIPO_VALOR_DIFERENTE:
+            detalle = {
+                'total_ml': r['total_ml'],
+                'total_tbc': r['total_tbc'],
+                'diferencia': r['diferencia'],
+            }
+        else:  # TIPO_FECHA_DIFERENTE
+            detalle = {
+                'fecha_ml': r['fecha_ml'],
+                'fecha_tbc': r['fecha_tbc'],
+            }
+
+        if incluir_detalle:
+            if ordenes is not None:
+                detalle['ordenes_ml'] = ordenes
+            if facturas is not None:
+                detalle['facturas_tbc'] = facturas
+
+        discrepancias.append({'tipo': tipo, 'remision': remision, 'detalle': detalle})
+
+    # Pedidos sin facturar (sin remisión) anteriores a la fecha TBC
+    if fecha_minima_tbc and ordenes_sin_remision:
+        pendientes = reconciliation.filtrar_pedidos_sin_facturar(ordenes_sin_remision, fecha_minima_tbc)
+
+        if pendientes:
+            discrepancias.append({
+                'tipo': TIPO_PEDIDOS_SIN_FACTURAR,
+                'remision': 'N/A',
+                'detalle': {
+                    'fecha_limite': fecha_minima_tbc,
+                    'cantidad': len(pendientes),
+                    'ordenes': pendientes,
+                    'mensaje': f'Se encontraron {len(pendientes)} pedidos sin facturar anteriores a {fecha_minima_tbc}'
+                }
+            })
+
+    total_comparaciones = len(filas)
+    porcentaje = (len(coincidencias) / total_comparaciones * 100) if total_comparaciones > 0 else 0
+
+    return {
+        'coincidencias': coincidencias,
+        'discrepancias': discrepancias,
+        'total_ordenes_ml': total_ml_remisiones,
+        'total_facturas_tbc': total_tbc_remisiones,
+        'porcentaje_coincidencia': round(porcentaje, 2)
+    }
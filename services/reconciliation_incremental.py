@@ -0,0 +1,369 @@
+"""
+Reconciliación incremental
+Guarda el resultado de cada remisión de la corrida anterior sobre el mismo
+archivo TBC y solo trae del OMS las órdenes modificadas desde entonces; se
+reconcilian de nuevo únicamente las remisiones que esas órdenes tocan y el
+resultado se compara con el anterior
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Iterable, Set
+
+import config
+from services.reconciliation import (
+    TIPO_COINCIDENCIA,
+    TIPO_REMISION_SIN_FACTURA,
+    TIPO_PEDIDOS_SIN_FACTURAR,
+    reconciliar_ml_tbc,
+    filtrar_pedidos_sin_facturar,
+)
+
+# Versión del formato del archivo de estado
+ESTADO_VERSION = 2
+
+# Margen hacia atrás al pedir órdenes modificadas (relojes y transacciones en curso)
+MARGEN_ACTUALIZACION = timedelta(minutes=5)
+
+# ============================================================================
+# PERSISTENCIA DEL ESTADO
+# ============================================================================
+
+def _ruta_estado(alcance: str) -> str:
+    return os.path.join(config.RECONCILIACION_ESTADO_DIR, f"{alcance}.json")
+
+
+def cargar_estado(alcance: str) -> Optional[Dict[str, Any]]:
+    """Carga el estado de la corrida anterior para un alcance (hash del archivo TBC)"""
+    
+    try:
+        with open(_ruta_estado(alcance), 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[WARN] Estado de reconciliación ilegible, se hará corrida completa: {e}")
+        return None
+    
+    if estado.get('version') != ESTADO_VERSION:
+        return None
+    
+    return estado
+
+
+def guardar_estado(alcance: str, estado: Dict[str, Any]) -> None:
+    """Guarda el estado de la corrida (escritura atómica)"""
+    
+    os.makedirs(config.RECONCILIACION_ESTADO_DIR, exist_ok=True)
+    
+    ruta = _ruta_estado(alcance)
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    
+    with open(ruta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False)
+    
+    os.replace(ruta_tmp, ruta)
+
+
+# ============================================================================
+# ESTADO POR REMISIÓN
+# ============================================================================
+
+def _clave_orden(orden: Dict[str, Any]):
+    """Mismo orden que devuelve el OMS (order_date y order_id descendentes)"""
+    return (orden.get('fecha_orden') or '', str(orden['order_id']))
+
+
+def _ordenes_entrada(entrada: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Órdenes ML de una coincidencia o discrepancia ([] si no tiene)"""
+    return entrada.get('ordenes_ml') or entrada.get('detalle', {}).get('ordenes_ml') or []
+
+
+def _entradas_por_remision(resultado: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Resultado de reconciliar_ml_tbc indexado por remisión: {'tipo', 'entrada'}"""
+    
+    remisiones = {}
+    
+    for coincidencia in resultado['coincidencias']:
+        remisiones[coincidencia['remision']] = {'tipo': TIPO_COINCIDENCIA, 'entrada': coincidencia}
+    
+    for disc in resultado['discrepancias']:
+        if disc['tipo'] != TIPO_PEDIDOS_SIN_FACTURAR:
+            remisiones[disc['remision']] = {'tipo': disc['tipo'], 'entrada': disc}
+    
+    return remisiones
+
+
+def _sin_facturas(remision: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia persistible: las facturas salen del archivo TBC en cada corrida"""
+    entrada = {k: v for k, v in remision['entrada'].items() if k != 'facturas_tbc'}
+    if 'detalle' in entrada:
+        entrada['detalle'] = {k: v for k, v in entrada['detalle'].items() if k != 'facturas_tbc'}
+    return {'tipo': remision['tipo'], 'entrada': entrada}
+
+
+def _con_facturas(remision: Dict[str, Any], facturas: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Vuelve a enlazar las facturas TBC de una remisión guardada sin ellas"""
+    entrada = remision['entrada']
+    if remision['tipo'] == TIPO_COINCIDENCIA:
+        entrada['facturas_tbc'] = facturas
+    elif remision['tipo'] != TIPO_REMISION_SIN_FACTURA:
+        entrada['detalle']['facturas_tbc'] = facturas
+    return remision
+
+
+def _armar_resultado(
+    remisiones: Dict[str, Dict[str, Any]],
+    pendientes: List[Dict[str, Any]],
+    facturas_tbc: Dict[str, List[Dict[str, Any]]],
+    fecha_minima_tbc: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Resultado con el formato (y el orden) de reconciliar_ml_tbc a partir del
+    resultado de cada remisión y de los pedidos sin facturar
+    """
+    
+    coincidencias = []
+    discrepancias = []
+    
+    con_ordenes = [r for r, datos in remisiones.items() if _ordenes_entrada(datos['entrada'])]
+    con_ordenes.sort(key=lambda r: _clave_orden(_ordenes_entrada(remisiones[r]['entrada'])[0]), reverse=True)
+    
+    for remision in con_ordenes:
+        datos = remisiones[remision]
+        if datos['tipo'] == TIPO_COINCIDENCIA:
+            coincidencias.append(datos['entrada'])
+        else:
+            discrepancias.append(datos['entrada'])
+    
+    for remision in facturas_tbc:
+        datos = remisiones.get(remision)
+        if datos and not _ordenes_entrada(datos['entrada']):
+            discrepancias.append(datos['entrada'])
+    
+    # Solo los pedidos ya pendientes pasan otra vez por el corte de fecha
+    discrepancias.extend(
+        reconciliar_ml_tbc([], {}, fecha_minima_tbc, pendientes)['discrepancias']
+    )
+    
+    total_comparaciones = len(remisiones)
+    porcentaje = (len(coincidencias) / total_comparaciones * 100) if total_comparaciones > 0 else 0
+    
+    return {
+        'coincidencias': coincidencias,
+        'discrepancias': discrepancias,
+        'total_ordenes_ml': len(con_ordenes),
+        'total_facturas_tbc': len(facturas_tbc),
+        'porcentaje_coincidencia': round(porcentaje, 2)
+    }
+
+
+# ============================================================================
+# RECONCILIACIÓN INCREMENTAL
+# ============================================================================
+
+def aplicar_cambios(
+    estado: Optional[Dict[str, Any]],
+    ordenes_cambiadas: List[Dict[str, Any]],
+    facturas_tbc: Dict[str, List[Dict[str, Any]]],
+    fechas_tbc: Iterable[str],
+    fecha_minima_tbc: str = None,
+    marca_tiempo: str = None
+) -> Dict[str, Any]:
+    """
+    Aplica las órdenes modificadas sobre el resultado anterior: solo se
+    reconcilian de nuevo las remisiones que tocan (la anterior y la nueva de
+    cada orden) y se compara el tipo de cada remisión con la corrida anterior
+    
+    Sin estado anterior, `ordenes_cambiadas` debe ser el universo completo
+    de órdenes.
+    
+    Args:
+        estado: Estado de la corrida anterior (o None)
+        ordenes_cambiadas: Órdenes mapeadas, con `vigente` = False para las
+            que ya no deben considerarse (canceladas, Medellín)
+        facturas_tbc: Facturas agrupadas por remisión
+        fechas_tbc: Fechas del archivo TBC
+        fecha_minima_tbc: Fecha mínima del archivo TBC
+        marca_tiempo: Momento (ISO, UTC) en que se consultaron las órdenes;
+            la próxima corrida pedirá las modificadas desde ahí
+    
+    Returns:
+        {
+            'resultado': Mismo formato que reconciliar_ml_tbc,
+            'diff': {'nuevas', 'resueltas', 'sin_cambio', 'pedidos_sin_facturar'},
+            'ordenes_actualizadas': Órdenes recibidas del OMS en esta corrida,
+            'estado': Nuevo estado para persistir
+        }
+    """
+    
+    fechas_tbc = set(fechas_tbc)
+    completo = estado is None
+    
+    remisiones_previas = {} if completo else {
+        remision: _con_facturas(datos, facturas_tbc.get(remision))
+        for remision, datos in estado['remisiones'].items()
+    }
+    pendientes = {} if completo else {
+        orden['order_id']: orden for orden in estado['pedidos_sin_facturar']
+    }
+    pendientes_previos = set(pendientes)
+    
+    # Remisión en la que quedó cada orden en la corrida anterior
+    ubicacion = {
+        orden['order_id']: remision
+        for remision, datos in remisiones_previas.items()
+        for orden in _ordenes_entrada(datos['entrada'])
+    }
+    grupos = {}
+    afectadas = set(facturas_tbc) if completo else set()
+    
+    def grupo(remision):
+        if remision not in grupos:
+            previa = remisiones_previas.get(remision)
+            ordenes = _ordenes_entrada(previa['entrada']) if previa else []
+            grupos[remision] = {orden['order_id']: orden for orden in ordenes}
+        return grupos[remision]
+    
+    # 1. Mover cada orden modificada de su remisión anterior a la nueva
+    for orden in ordenes_cambiadas:
+        orden = dict(orden)
+        vigente = orden.pop('vigente', True)
+        order_id = orden['order_id']
+        
+        anterior = ubicacion.pop(order_id, None)
+        if anterior is not None:
+            grupo(anterior).pop(order_id, None)
+            afectadas.add(anterior)
+        pendientes.pop(order_id, None)
+        
+        if not vigente:
+            continue
+        
+        remision = orden.get('remision')
+        if not remision:
+            if fecha_minima_tbc and filtrar_pedidos_sin_facturar([orden], fecha_minima_tbc):
+                pendientes[order_id] = orden
+        elif orden.get('fecha_remision') in fechas_tbc:
+            grupo(remision)[order_id] = orden
+            ubicacion[order_id] = remision
+            afectadas.add(remision)
+    
+    # 2. Reconciliar solo las remisiones afectadas
+    ordenes_afectadas = sorted(
+        (orden for remision in afectadas for orden in grupo(remision).values()),
+        key=_clave_orden,
+        reverse=True
+    )
+    parcial = reconciliar_ml_tbc(
+        ordenes_afectadas,
+        {remision: facturas for remision, facturas in facturas_tbc.items() if remision in afectadas}
+    )
+    
+    remisiones = {r: datos for r, datos in remisiones_previas.items() if r not in afectadas}
+    remisiones.update(_entradas_por_remision(parcial))
+    
+    pendientes_ordenados = sorted(pendientes.values(), key=_clave_orden, reverse=True)
+    resultado = _armar_resultado(remisiones, pendientes_ordenados, facturas_tbc, fecha_minima_tbc)
+    
+    # 3. Diferencias con la corrida anterior
+    nuevas = []
+    resueltas = []
+    
+    for remision in afectadas:
+        antes = remisiones_previas.get(remision, {}).get('tipo')
+        despues = remisiones.get(remision, {}).get('tipo')
+        
+        if antes == despues:
+            continue
+        
+        if antes and antes != TIPO_COINCIDENCIA:
+            resueltas.append({'remision': remision, 'tipo': antes})
+        
+        if despues and despues != TIPO_COINCIDENCIA:
+            nuevas.append({'remision': remision, 'tipo': despues, 'tipo_anterior': antes})
+    
+    cambiadas = {d['remision'] for d in nuevas} | {d['remision'] for d in resueltas}
+    sin_cambio = [
+        {'remision': remision, 'tipo': datos['tipo']}
+        for remision, datos in remisiones.items()
+        if datos['tipo'] != TIPO_COINCIDENCIA and remision not in cambiadas
+    ]
+    
+    nuevo_estado = {
+        'version': ESTADO_VERSION,
+        'ultima_ejecucion': marca_tiempo or datetime.now(timezone.utc).isoformat(),
+        'remisiones': {remision: _sin_facturas(datos) for remision, datos in remisiones.items()},
+        'pedidos_sin_facturar': pendientes_ordenados,
+    }
+    
+    return {
+        'resultado': resultado,
+        'diff': {
+            'nuevas': nuevas,
+            'resueltas': resueltas,
+            'sin_cambio': sin_cambio,
+            'pedidos_sin_facturar': {
+                'nuevos': sorted(pendientes.keys() - pendientes_previos),
+                'resueltos': sorted(pendientes_previos - pendientes.keys()),
+            },
+        },
+        'ordenes_actualizadas': len(ordenes_cambiadas),
+        'estado': nuevo_estado,
+    }
+
+
+def reconciliar_incremental(
+    alcance: str,
+    facturas_tbc: Dict[str, List[Dict[str, Any]]],
+    fechas_tbc: Iterable[str],
+    fecha_minima_tbc: str = None,
+    fecha_desde: str = "2026-01-01"
+) -> Dict[str, Any]:
+    """
+    Reconcilia el archivo TBC contra el OMS trayendo solo las órdenes
+    modificadas desde la corrida anterior sobre el mismo archivo
+    
+    Args:
+        alcance: Identificador del archivo TBC (hash del contenido)
+        facturas_tbc: Facturas agrupadas por remisión
+        fechas_tbc: Fechas del archivo TBC
+        fecha_minima_tbc: Fecha mínima del archivo TBC
+        fecha_desde: Fecha de orden desde la que se consideran órdenes
+    
+    Returns:
+        Lo mismo que aplicar_cambios (sin 'estado'), más 'incremental'
+    
+    Raises:
+        Exception: Si falla la consulta al OMS. En ese caso no se guarda el
+            estado, así la próxima corrida vuelve a pedir la misma ventana.
+    """
+    
+    from database import supabase_client as db
+    
+    estado = cargar_estado(alcance)
+    marca_tiempo = datetime.now(timezone.utc).isoformat()
+    
+    # Consultas que propagan los errores (las get_* devuelven [] al fallar,
+    # lo que aquí se confundiría con "no hubo cambios")
+    if estado is None:
+        # Corrida completa: todas las órdenes vigentes, con y sin remisión
+        ordenes = list(db.iterar_ml_orders(
+            fecha_desde=fecha_desde, limit=None, campos=db.CAMPOS_RECONCILIACION
+        ))
+    else:
+        ultima = datetime.fromisoformat(estado['ultima_ejecucion'])
+        desde = (ultima - MARGEN_ACTUALIZACION).isoformat()
+        ordenes = list(db.iterar_ml_orders_actualizadas(
+            desde, fecha_desde=fecha_desde, campos=db.CAMPOS_RECONCILIACION
+        ))
+    
+    salida = aplicar_cambios(
+        estado, ordenes, facturas_tbc, fechas_tbc, fecha_minima_tbc, marca_tiempo
+    )
+    
+    guardar_estado(alcance, salida.pop('estado'))
+    salida['incremental'] = estado is not None
+    
+    return salida
@@ -0,0 +1,237 @@
+"""
+Reporte Excel de discrepancias de una reconciliación
+
+Escribe las filas directamente desde el resultado de reconciliar_ml_tbc con
+xlsxwriter en modo constant_memory (cada fila se vuelca al disco al pasar a
+la siguiente), sin DataFrame intermedio. Se puede usar fuera de Streamlit:
+
+    from services import reporte_excel
+    reporte_excel.escribir_reporte(resultado, "reporte.xlsx", fechas_tbc)
+"""
+
+import json
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, List, Any, Optional, Iterator, Tuple, Union, BinaryIO
+
+import pytz
+import xlsxwriter
+
+import config
+from services import reconciliation
+
+
+COLOMBIA_TZ = pytz.timezone(config.TIMEZONE)
+
+COLUMNAS_DISCREPANCIAS = (
+    'Tipo', 'Remisión', 'Order ID', 'Fecha', 'Total ML', 'Total TBC', 'Diferencia', 'Productos'
+)
+
+ANCHOS_DISCREPANCIAS = (30, 12, 20, 12, 12, 12, 12, 50)
+
+# Etiqueta y color de fondo por tipo (en el orden del resumen)
+ESTILO_POR_TIPO = {
+    reconciliation.TIPO_PEDIDOS_SIN_FACTURAR: ('Pedidos sin facturar', '#FFF2CC'),        # Amarillo claro
+    reconciliation.TIPO_REMISION_SIN_FACTURA: ('Remisión sin factura en TBC', '#FFE699'),  # Amarillo
+    reconciliation.TIPO_FACTURA_SIN_REMISION: ('Factura sin remisión en ML', '#F4B084'),   # Naranja claro
+    reconciliation.TIPO_VALOR_DIFERENTE: ('Valor diferente', '#F8CBAD'),                   # Rojo claro
+}
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+# ============================================================================
+# FILAS
+# ============================================================================
+
+def _display_id(orden: Dict[str, Any]) -> Any:
+    return orden.get('pack_id') if orden.get('pack_id') else orden['order_id']
+
+
+def _productos_ml(orden: Dict[str, Any]) -> str:
+    """Títulos de los productos de una orden ML separados por coma"""
+    if not orden.get('productos'):
+        return ''
+    try:
+        prods = json.loads(orden['productos']) if isinstance(orden['productos'], str) else orden['productos']
+        return ', '.join([p.get('title', 'N/A') for p in prods])
+    except (ValueError, TypeError, AttributeError):
+        return ''
+
+
+def _fecha_colombia(fecha_iso: Optional[str]) -> str:
+    if not fecha_iso:
+        return ''
+    fecha_utc = datetime.fromisoformat(fecha_iso.replace('Z', '+00:00'))
+    return fecha_utc.astimezone(COLOMBIA_TZ).strftime('%Y-%m-%d')
+
+
+def filas_discrepancias(resultado: Dict[str, Any]) -> Iterator[Tuple[str, tuple]]:
+    """
+    Filas de la hoja Discrepancias, una por orden / remisión
+
+    Yields:
+        (tipo, valores en el orden de COLUMNAS_DISCREPANCIAS)
+    """
+    for disc in resultado['discrepancias']:
+        tipo = disc['tipo']
+        detalle = disc['detalle']
+
+        if tipo == reconciliation.TIPO_PEDIDOS_SIN_FACTURAR:
+            etiqueta = ESTILO_POR_TIPO[tipo][0]
+            for orden in detalle['ordenes']:
+                yield tipo, (
+                    etiqueta, 'N/A', _display_id(orden), _fecha_colombia(orden.get('fecha_orden')),
+                    orden.get('total', 0), '', '', _productos_ml(orden)
+                )
+
+        elif tipo == reconciliation.TIPO_REMISION_SIN_FACTURA:
+            etiqueta = ESTILO_POR_TIPO[tipo][0]
+            for orden in detalle['ordenes_ml']:
+                yield tipo, (
+                    etiqueta, disc['remision'], _display_id(orden), orden.get('fecha_remision', ''),
+                    orden.get('total', 0), '', '', _productos_ml(orden)
+                )
+
+        elif tipo == reconciliation.TIPO_FACTURA_SIN_REMISION:
+            productos = ''
+            if detalle.get('facturas_tbc'):
+                productos = ', '.join([f.get('producto_nombre', 'N/A') for f in detalle['facturas_tbc']])
+            yield tipo, (
+                ESTILO_POR_TIPO[tipo][0], disc['remision'], '', detalle.get('fecha_tbc', ''),
+                '', detalle.get('total_tbc', 0), '', productos
+            )
+
+        elif tipo == reconciliation.TIPO_VALOR_DIFERENTE:
+            yield tipo, (
+                ESTILO_POR_TIPO[tipo][0], disc['remision'], '', detalle.get('fecha_ml', ''),
+                detalle.get('total_ml', 0), detalle.get('total_tbc', 0), detalle.get('diferencia', 0), ''
+            )
+
+
+# ============================================================================
+# LIBRO
+# ============================================================================
+
+def _formatos(workbook: xlsxwriter.Workbook) -> Dict[str, Any]:
+    formatos = {
+        'encabezado': workbook.add_format({
+            'bold': True,
+            'bg_color': '#4472C4',
+            'font_color': 'white',
+            'border': 1,
+            'align': 'center',
+            'valign': 'vcenter'
+        }),
+        'titulo': workbook.add_format({
+            'bold': True,
+            'font_size': 14,
+            'bg_color': '#2E5090',
+            'font_color': 'white',
+            'align': 'center',
+            'valign': 'vcenter'
+        }),
+        'normal': workbook.add_format({'border': 1}),
+    }
+    for tipo, (_, color) in ESTILO_POR_TIPO.items():
+        formatos[tipo] = workbook.add_format({'bg_color': color, 'border': 1})
+    return formatos
+
+
+def _hoja_resumen(workbook, formatos, resultado: Dict[str, Any], fechas_tbc: Optional[List[str]]):
+    hoja = workbook.add_worksheet('Resumen')
+    hoja.set_column('A:A', 30)
+    hoja.set_column('B:B', 25)
+
+    # constant_memory: las filas se escriben en orden creciente
+    hoja.merge_range('A1:B1', 'RESUMEN EJECUTIVO - RECONCILIACIÓN', formatos['titulo'])
+
+    row = 2
+    hoja.write(row, 0, 'Fecha de Reconciliación:', formatos['encabezado'])
+    hoja.write(row, 1, datetime.now(COLOMBIA_TZ).strftime('%Y-%m-%d %H:%M'))
+
+    row += 1
+    hoja.write(row, 0, 'Rango de Fechas:', formatos['encabezado'])
+    if fechas_tbc:
+        rango = f"{fechas_tbc[0]} a {fechas_tbc[-1]}" if len(fechas_tbc) > 1 else fechas_tbc[0]
+        hoja.write(row, 1, rango)
+
+    row += 2
+    hoja.write(row, 0, 'Total Coincidencias:', formatos['encabezado'])
+    hoja.write(row, 1, len(resultado['coincidencias']))
+
+    row += 1
+    hoja.write(row, 0, 'Total Discrepancias:', formatos['encabezado'])
+    hoja.write(row, 1, len(resultado['discrepancias']))
+
+    if not resultado['discrepancias']:
+        return
+
+    resumen = reconciliation.generar_resumen_discrepancias(resultado)
+
+    row += 2
+    hoja.write(row, 0, 'DISCREPANCIAS POR TIPO', formatos['titulo'])
+    hoja.write(row, 1, '', formatos['titulo'])
+
+    for tipo, (etiqueta, _) in ESTILO_POR_TIPO.items():
+        row += 1
+        hoja.write_row(row, 0, (f"{etiqueta}:", resumen[tipo]), formatos[tipo])
+
+
+def _hoja_discrepancias(workbook, formatos, resultado: Dict[str, Any]) -> int:
+    hoja = workbook.add_worksheet('Discrepancias')
+    for col, ancho in enumerate(ANCHOS_DISCREPANCIAS):
+        hoja.set_column(col, col, ancho)
+
+    hoja.write_row(0, 0, COLUMNAS_DISCREPANCIAS, formatos['encabezado'])
+
+    row = 0
+    for tipo, valores in filas_discrepancias(resultado):
+        row += 1
+        hoja.write_row(row, 0, valores, formatos.get(tipo, formatos['normal']))
+
+    return row
+
+
+def escribir_reporte(
+    resultado: Dict[str, Any],
+    destino: Union[str, BinaryIO],
+    fechas_tbc: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Escribe el reporte (hojas Resumen y Discrepancias) en una ruta o archivo binario
+
+    Args:
+        resultado: Resultado de reconciliar_ml_tbc
+        destino: Ruta del .xlsx o buffer (BytesIO, archivo abierto en 'wb')
+        fechas_tbc: Fechas del archivo TBC (para el rango del resumen)
+
+    Returns:
+        {"filas": filas escritas en Discrepancias}
+    """
+    # Sin detección de URLs / fórmulas en cada texto: el reporte no tiene ninguna
+    workbook = xlsxwriter.Workbook(destino, {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        'strings_to_formulas': False,
+    })
+    try:
+        formatos = _formatos(workbook)
+        _hoja_resumen(workbook, formatos, resultado, fechas_tbc)
+        filas = _hoja_discrepancias(workbook, formatos, resultado) if resultado['discrepancias'] else 0
+    finally:
+        workbook.close()
+
+    return {"filas": filas}
+
+
+def generar_reporte_excel(resultado: Dict[str, Any], fechas_tbc: Optional[List[str]] = None) -> bytes:
+    """Reporte completo como bytes (para st.download_button)"""
+    output = BytesIO()
+    escribir_reporte(resultado, output, fechas_tbc)
+    return output.getvalue()
+
+
+def nombre_reporte() -> str:
+    timestamp = datetime.now(COLOMBIA_TZ).strftime("%Y%m%d_%H%M%S")
+    return f"Discrepancias_Reconciliacion_{timestamp}.xlsx"
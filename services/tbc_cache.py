@@ -0,0 +1,193 @@
+"""
+Caché en disco de archivos TBC parseados
+Evita volver a parsear el mismo RESUXDOC.XLS en cada rerun de Streamlit
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import List, Dict, Any, Optional
+
+import config
+from services import tbc_parser
+
+# ============================================================================
+# ESQUEMA DEL CACHÉ
+# ============================================================================
+
+_EXTENSION = ".parquet"
+
+
+def _esquema_facturas():
+    """Esquema fijo (Arrow) de las facturas guardadas en caché"""
+    import pyarrow as pa
+    
+    return pa.schema([
+        ('evento', pa.string()),
+        ('nombre_evento', pa.string()),
+        ('remision', pa.string()),
+        ('fecha', pa.string()),
+        ('producto_codigo', pa.string()),
+        ('producto_nombre', pa.string()),
+        ('unidad', pa.string()),
+        ('cantidad', pa.float64()),
+        ('valor_unitario', pa.float64()),
+        ('valor_total', pa.float64()),
+    ])
+
+
+# ============================================================================
+# CLAVES
+# ============================================================================
+
+def calcular_hash_archivo(contenido: bytes) -> str:
+    """SHA-256 del contenido del archivo"""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def clave_cache(hash_archivo: str, evento_filtro: str = "S66") -> str:
+    """
+    Clave del caché: hash del archivo + versión del parser + evento filtrado
+    """
+    base = f"{hash_archivo}|{tbc_parser.PARSER_VERSION}|{evento_filtro}"
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def _ruta_cache(clave: str) -> str:
+    return os.path.join(config.TBC_CACHE_DIR, f"{clave}{_EXTENSION}")
+
+
+# ============================================================================
+# LECTURA / ESCRITURA
+# ============================================================================
+
+def leer_facturas_cache(clave: str) -> Optional[List[Dict[str, Any]]]:
+    """Lee las facturas guardadas para una clave; None si no están en caché"""
+    
+    ruta = _ruta_cache(clave)
+    if not os.path.exists(ruta):
+        return None
+    
+    try:
+        import pyarrow.parquet as pq
+        
+        facturas = pq.read_table(ruta).to_pylist()
+        
+        # Marcar como usado recientemente (LRU por fecha de modificación)
+        os.utime(ruta, None)
+        return facturas
+    except Exception as e:
+        print(f"[WARN] Caché TBC ilegible ({ruta}): {e}")
+        return None
+
+
+def guardar_facturas_cache(clave: str, facturas: List[Dict[str, Any]]) -> bool:
+    """Guarda las facturas en caché y aplica la expulsión LRU por tamaño"""
+    
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        os.makedirs(config.TBC_CACHE_DIR, exist_ok=True)
+        
+        tabla = pa.Table.from_pylist(facturas, schema=_esquema_facturas())
+        
+        # Escribir a un archivo temporal y renombrar para no dejar archivos a medias
+        ruta = _ruta_cache(clave)
+        ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+        pq.write_table(tabla, ruta_tmp, compression='zstd')
+        os.replace(ruta_tmp, ruta)
+        
+        expulsar_lru(config.TBC_CACHE_MAX_MB * 1024 * 1024)
+        return True
+    except Exception as e:
+        print(f"[WARN] No se pudo guardar el caché TBC: {e}")
+        return False
+
+
+def expulsar_lru(max_bytes: int) -> int:
+    """
+    Elimina los archivos usados hace más tiempo hasta que el caché
+    ocupe como máximo `max_bytes`
+    
+    Returns:
+        Cantidad de archivos eliminados
+    """
+    
+    if not os.path.isdir(config.TBC_CACHE_DIR):
+        return 0
+    
+    entradas = []
+    for nombre in os.listdir(config.TBC_CACHE_DIR):
+        if not nombre.endswith(_EXTENSION):
+            continue
+        ruta = os.path.join(config.TBC_CACHE_DIR, nombre)
+        try:
+            stat = os.stat(ruta)
+        except FileNotFoundError:
+            continue
+        entradas.append((stat.st_mtime, stat.st_size, ruta))
+    
+    total = sum(tamano for _, tamano, _ in entradas)
+    eliminados = 0
+    
+    for _, tamano, ruta in sorted(entradas):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamano
+            eliminados += 1
+        except FileNotFoundError:
+            pass
+    
+    return eliminados
+
+
+# ============================================================================
+# FUNCIÓN PRINCIPAL
+# ============================================================================
+
+def procesar_archivo_tbc_cacheado(
+    contenido: bytes,
+    nombre_archivo: str,
+    evento_filtro: str = "S66"
+) -> Dict[str, Any]:
+    """
+    Igual que tbc_parser.procesar_archivo_tbc, pero recibe el contenido del
+    archivo subido y reutiliza el resultado si ese mismo archivo ya se parseó
+    (en esta sesión, en otra o antes de un reinicio)
+    
+    Args:
+        contenido: Bytes del archivo RESUXDOC.XLS / .XLSX
+        nombre_archivo: Nombre original (se usa para inferir el formato)
+        evento_filtro: Tipo de evento a filtrar (default: S66)
+    
+    Returns:
+        Mismo diccionario que procesar_archivo_tbc, más 'hash_archivo'
+    """
+    
+    hash_archivo = calcular_hash_archivo(contenido)
+    clave = clave_cache(hash_archivo, evento_filtro)
+    
+    facturas = leer_facturas_cache(clave)
+    
+    if facturas is not None:
+        print(f"[INFO] Archivo TBC leido desde cache: {len(facturas)} facturas")
+    else:
+        extension = os.path.splitext(nombre_archivo)[1] or ".xls"
+        fd, ruta_tmp = tempfile.mkstemp(suffix=extension)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(contenido)
+            facturas = tbc_parser.procesar_archivo_tbc(ruta_tmp, evento_filtro)['facturas']
+        finally:
+            os.remove(ruta_tmp)
+        
+        # No cachear archivos que no produjeron facturas (posible error de lectura)
+        if facturas:
+            guardar_facturas_cache(clave, facturas)
+    
+    resultado = tbc_parser.armar_resultado_tbc(facturas)
+    resultado['hash_archivo'] = hash_archivo
+    return resultado
@@ -4,9 +4,35 @@ Extrae información de facturas de Mercado Libre Flex
 """
 
 import pandas as pd
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Union, Iterator, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import chain
+import os
 import re
+import tempfile
+import zipfile
+
+# Columnas (en orden) de cada registro de factura
+COLUMNAS_FACTURA = [
+    'evento', 'nombre_evento', 'remision', 'fecha', 'producto_codigo',
+    'producto_nombre', 'unidad', 'cantidad', 'valor_unitario', 'valor_total'
+]
+
+# Columnas 0-14 (EVENTO ... NROFAC): las únicas que usa el parser
+COLUMNAS_RESUXDOC = 15
+
+# Textos que pandas.read_excel lee como celda vacía (na_values por defecto);
+# la lectura por streaming los normaliza igual
+VALORES_NA = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null'
+})
+
+# Versión de las reglas de parseo; subirla invalida el caché de archivos parseados
+PARSER_VERSION = "2"
 
 # ============================================================================
 # PARSER DEL ARCHIVO TBC
@@ -46,93 +72,13 @@ def parse_resuxdoc_xls(file_path: str, evento_filtro: str = "S66") -> List[Dict[
         
         # La primera fila (índice 0) contiene los encabezados, empezar desde la fila 1
         for idx in range(1, len(df)):
-            row = df.iloc[idx]
+            factura, advertencia = _parsear_fila_resuxdoc(df.iloc[idx], evento_filtro)
             
-            # Verificar que sea una fila con evento S66
-            evento = str(row[0]).strip() if pd.notna(row[0]) else ''
-            if evento != evento_filtro:
-                continue
+            if advertencia:
+                print(f"[WARN] Fila {idx}: {advertencia}")
             
-            try:
-                # Extraer datos usando las columnas específicas
-                
-                # col_12: CONSEC - Remisión (número de 4 o 5 dígitos)
-                remision = None
-                if pd.notna(row[12]):
-                    remision_str = str(row[12]).strip()
-                    # Limpiar espacios y extraer solo dígitos
-                    remision = ''.join(filter(str.isdigit, remision_str))
-                    if len(remision) not in [4, 5]:
-                        # Intentar con col_14 (NROFAC)
-                        if pd.notna(row[14]):
-                            nrofac = str(row[14]).strip()
-                            match = re.search(r'(\d{4,5})', nrofac)
-                            if match:
-                                remision = match.group(1)
-                
-                if not remision or len(remision) not in [4, 5]:
-                    print(f"[WARN] Fila {idx}: No se pudo extraer remision valida")
-                    continue
-                
-                # col_3: DDMMAA - Fecha
-                fecha = None
-                if pd.notna(row[3]):
-                    fecha_str = str(row[3]).strip()
-                    fecha = parse_tbc_fecha(fecha_str)
-                
-                # col_2: PRODUC - Código de producto
-                producto_codigo = str(row[2]).strip() if pd.notna(row[2]) else 'UNKNOWN'
-                
-                # col_4: DETALL - Nombre de producto
-                producto_nombre = str(row[4]).strip() if pd.notna(row[4]) else 'Producto sin nombre'
-                
-                # col_5: UNIMED - Unidad
-                unidad = str(row[5]).strip() if pd.notna(row[5]) else 'UN'
-                
-                # col_6: CANTID - Cantidad
-                cantidad = 1
-                if pd.notna(row[6]):
-                    try:
-                        cantidad = float(str(row[6]).strip())
-                    except:
-                        cantidad = 1
-                
-                # col_7: VALUNI - Valor unitario
-                valor_unitario = 0
-                if pd.notna(row[7]):
-                    try:
-                        valor_unitario = float(str(row[7]).strip())
-                    except:
-                        valor_unitario = 0
-                
-                # col_8: VALTOT - Valor total ⭐ USAR ESTE DIRECTAMENTE
-                valor_total = 0
-                if pd.notna(row[8]):
-                    try:
-                        valor_total = float(str(row[8]).strip())
-                    except:
-                        # Si falla, calcular manualmente
-                        valor_total = cantidad * valor_unitario
-                
-                # Crear registro de factura
-                factura = {
-                    'evento': evento,
-                    'nombre_evento': str(row[1]).strip() if pd.notna(row[1]) else 'Remision Mercancia A',
-                    'remision': remision,
-                    'fecha': fecha,
-                    'producto_codigo': producto_codigo,
-                    'producto_nombre': producto_nombre,
-                    'unidad': unidad,
-                    'cantidad': cantidad,
-                    'valor_unitario': valor_unitario,
-                    'valor_total': valor_total
-                }
-                
+            if factura:
                 facturas.append(factura)
-                
-            except Exception as e:
-                print(f"[WARN] Error parseando fila {idx}: {e}")
-                continue
         
         print(f"\n[OK] Total facturas parseadas: {len(facturas)}")
         return facturas
@@ -144,6 +90,526 @@ def parse_resuxdoc_xls(file_path: str, evento_filtro: str = "S66") -> List[Dict[
         return []
 
 
+def _parsear_fila_resuxdoc(row, evento_filtro: str):
+    """
+    Parsea una fila de RESUXDOC (Series de pandas o secuencia de 15 valores)
+    
+    Returns:
+        (factura o None, mensaje de advertencia o None)
+    """
+    
+    # Verificar que sea una fila con evento S66
+    evento = str(row[0]).strip() if pd.notna(row[0]) else ''
+    if evento != evento_filtro:
+        return None, None
+    
+    try:
+        # Extraer datos usando las columnas específicas
+        
+        # col_12: CONSEC - Remisión (número de 4 o 5 dígitos)
+        remision = None
+        if pd.notna(row[12]):
+            remision_str = str(row[12]).strip()
+            # Limpiar espacios y extraer solo dígitos
+            remision = ''.join(filter(str.isdigit, remision_str))
+            if len(remision) not in [4, 5]:
+                # Intentar con col_14 (NROFAC)
+                if pd.notna(row[14]):
+                    nrofac = str(row[14]).strip()
+                    match = re.search(r'(\d{4,5})', nrofac)
+                    if match:
+                        remision = match.group(1)
+        
+        if not remision or len(remision) not in [4, 5]:
+            return None, "No se pudo extraer remision valida"
+        
+        # col_3: DDMMAA - Fecha
+        fecha = None
+        if pd.notna(row[3]):
+            fecha_str = str(row[3]).strip()
+            fecha = parse_tbc_fecha(fecha_str)
+        
+        # col_2: PRODUC - Código de producto
+        producto_codigo = str(row[2]).strip() if pd.notna(row[2]) else 'UNKNOWN'
+        
+        # col_4: DETALL - Nombre de producto
+        producto_nombre = str(row[4]).strip() if pd.notna(row[4]) else 'Producto sin nombre'
+        
+        # col_5: UNIMED - Unidad
+        unidad = str(row[5]).strip() if pd.notna(row[5]) else 'UN'
+        
+        # col_6: CANTID - Cantidad
+        cantidad = 1
+        if pd.notna(row[6]):
+            try:
+                cantidad = float(str(row[6]).strip())
+            except:
+                cantidad = 1
+        
+        # col_7: VALUNI - Valor unitario
+        valor_unitario = 0
+        if pd.notna(row[7]):
+            try:
+                valor_unitario = float(str(row[7]).strip())
+            except:
+                valor_unitario = 0
+        
+        # col_8: VALTOT - Valor total ⭐ USAR ESTE DIRECTAMENTE
+        valor_total = 0
+        if pd.notna(row[8]):
+            try:
+                valor_total = float(str(row[8]).strip())
+            except:
+                # Si falla, calcular manualmente
+                valor_total = cantidad * valor_unitario
+        
+        # Crear registro de factura
+        factura = {
+            'evento': evento,
+            'nombre_evento': str(row[1]).strip() if pd.notna(row[1]) else 'Remision Mercancia A',
+            'remision': remision,
+            'fecha': fecha,
+            'producto_codigo': producto_codigo,
+            'producto_nombre': producto_nombre,
+            'unidad': unidad,
+            'cantidad': cantidad,
+            'valor_unitario': valor_unitario,
+            'valor_total': valor_total
+        }
+        
+        return factura, None
+        
+    except Exception as e:
+        return None, f"Error parseando fila: {e}"
+
+
+def parse_resuxdoc_xls_vectorizado(
+    file_path: str,
+    evento_filtro: str = "S66",
+    como_dataframe: bool = False,
+    lanzar_errores: bool = False
+) -> Union[List[Dict[str, Any]], pd.DataFrame]:
+    """
+    Versión vectorizada de parse_resuxdoc_xls
+    
+    Aplica las mismas reglas que el parser fila por fila, pero como
+    operaciones sobre columnas completas de pandas/NumPy: filtro por evento,
+    remisión desde CONSEC con NROFAC como respaldo, conversión numérica de
+    CANTID/VALUNI/VALTOT y mapeo de fechas DD-Mmm-AA.
+    
+    Las advertencias por fila se reportan en un solo bloque al final.
+    
+    Args:
+        file_path: Ruta al archivo RESUXDOC.XLS
+        evento_filtro: Tipo de evento a filtrar (default: S66 - Mercado Libre Flex)
+        como_dataframe: Si es True retorna un DataFrame en vez de la lista de diccionarios
+        lanzar_errores: Si es True propaga el error de lectura en vez de retornar vacío
+    
+    Returns:
+        Lista de diccionarios (mismo formato que parse_resuxdoc_xls) o DataFrame
+    """
+    
+    try:
+        df = pd.read_excel(file_path, sheet_name=0, header=None)
+        print(f"[INFO] Archivo leido: {len(df)} filas, {len(df.columns)} columnas")
+        
+        facturas_df, advertencias = _parsear_dataframe_resuxdoc(df, evento_filtro)
+        
+    except Exception as e:
+        if lanzar_errores:
+            raise
+        print(f"[ERROR] Error parseando archivo: {e}")
+        import traceback
+        traceback.print_exc()
+        return pd.DataFrame(columns=COLUMNAS_FACTURA) if como_dataframe else []
+    
+    _reportar_advertencias(advertencias)
+    print(f"\n[OK] Total facturas parseadas: {len(facturas_df)}")
+    
+    if como_dataframe:
+        return facturas_df
+    
+    return _dataframe_a_facturas(facturas_df)
+
+
+def _columna(df: pd.DataFrame, indice: int) -> pd.Series:
+    """Retorna la columna indicada o una columna vacía si el archivo no la trae"""
+    if indice in df.columns:
+        return df[indice]
+    return pd.Series(np.nan, index=df.index, dtype=object)
+
+
+def _columna_texto(df: pd.DataFrame, indice: int, default: str = None) -> pd.Series:
+    """Equivalente vectorizado de `str(valor).strip() if pd.notna(valor) else default`"""
+    columna = _columna(df, indice)
+    texto = columna.astype(str).str.strip().astype(object)
+    return texto.where(columna.notna(), default)
+
+
+def _columna_numero(df: pd.DataFrame, indice: int) -> pd.Series:
+    """Equivalente vectorizado de `float(str(valor).strip())`; NaN si no es numérico"""
+    columna = _columna(df, indice)
+    texto = columna.astype(str).str.strip().where(columna.notna())
+    return pd.to_numeric(texto, errors='coerce').astype(float)
+
+
+def _parsear_dataframe_resuxdoc(df: pd.DataFrame, evento_filtro: str):
+    """
+    Aplica las reglas de parseo de RESUXDOC sobre columnas completas
+    
+    Returns:
+        (DataFrame con COLUMNAS_FACTURA, lista de (fila, mensaje) de advertencias)
+    """
+    
+    # La primera fila (índice 0) contiene los encabezados
+    df = df.iloc[1:]
+    
+    # col_0: EVENTO
+    evento = _columna_texto(df, 0, '')
+    df = df[evento == evento_filtro]
+    evento = evento[df.index]
+    
+    # col_12: CONSEC - Remisión, solo dígitos
+    consec = _columna(df, 12)
+    remision = consec.astype(str).str.strip().str.replace(r'\D', '', regex=True)
+    remision_valida = remision.str.len().isin([4, 5])
+    
+    # col_14: NROFAC - respaldo cuando CONSEC no tiene 4 o 5 dígitos
+    nrofac = _columna(df, 14)
+    remision_nrofac = nrofac.astype(str).str.strip().str.extract(r'(\d{4,5})', expand=False)
+    usar_nrofac = ~remision_valida & nrofac.notna() & remision_nrofac.notna()
+    remision = remision.where(~usar_nrofac, remision_nrofac)
+    
+    # Si CONSEC está vacío la fila se descarta (no se intenta NROFAC)
+    remision = remision.where(consec.notna())
+    valida = remision.notna() & remision.str.len().isin([4, 5])
+    
+    advertencias = [
+        (idx, "No se pudo extraer remision valida")
+        for idx in df.index[~valida.to_numpy(dtype=bool)]
+    ]
+    
+    df = df[valida.to_numpy(dtype=bool)]
+    
+    # col_3: DDMMAA - Fecha; el archivo trae pocas fechas distintas,
+    # así que se convierte cada valor único una sola vez
+    fecha_texto = _columna_texto(df, 3)
+    fechas_unicas = {
+        valor: parse_tbc_fecha(valor)
+        for valor in fecha_texto.dropna().unique()
+    }
+    fecha = fecha_texto.map(fechas_unicas).astype(object)
+    fecha = fecha.where(fecha.notna(), None)
+    
+    # col_6 / col_7 / col_8: CANTID, VALUNI, VALTOT
+    cantidad = _columna_numero(df, 6).fillna(1)
+    valor_unitario = _columna_numero(df, 7).fillna(0)
+    valor_total = _columna_numero(df, 8)
+    # VALTOT vacío -> 0; VALTOT no numérico -> cantidad * valor unitario
+    valor_total = valor_total.where(
+        valor_total.notna(),
+        np.where(_columna(df, 8).notna(), cantidad * valor_unitario, 0)
+    )
+    
+    facturas_df = pd.DataFrame({
+        'evento': evento[df.index],
+        'nombre_evento': _columna_texto(df, 1, 'Remision Mercancia A'),
+        'remision': remision[df.index],
+        'fecha': fecha,
+        'producto_codigo': _columna_texto(df, 2, 'UNKNOWN'),
+        'producto_nombre': _columna_texto(df, 4, 'Producto sin nombre'),
+        'unidad': _columna_texto(df, 5, 'UN'),
+        'cantidad': cantidad,
+        'valor_unitario': valor_unitario,
+        'valor_total': valor_total.astype(float),
+    }, columns=COLUMNAS_FACTURA)
+    
+    return facturas_df, advertencias
+
+
+def _dataframe_a_facturas(facturas_df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convierte el DataFrame de facturas a la lista de diccionarios del parser"""
+    
+    columnas = {col: facturas_df[col].tolist() for col in COLUMNAS_FACTURA}
+    
+    return [
+        dict(zip(COLUMNAS_FACTURA, valores))
+        for valores in zip(*(columnas[col] for col in COLUMNAS_FACTURA))
+    ]
+
+
+def _reportar_advertencias(advertencias: List) -> None:
+    """Imprime en un solo bloque las advertencias acumuladas por fila"""
+    
+    if not advertencias:
+        return
+    
+    por_mensaje = {}
+    for fila, mensaje in advertencias:
+        por_mensaje.setdefault(mensaje, []).append(str(fila))
+    
+    for mensaje, filas in por_mensaje.items():
+        print(f"[WARN] {mensaje} en {len(filas)} fila(s): {', '.join(filas)}")
+
+
+# ============================================================================
+# LECTURA POR STREAMING (MEMORIA ACOTADA)
+# ============================================================================
+
+def iterar_resuxdoc(
+    file_path: str,
+    evento_filtro: str = "S66",
+    tamano_lote: int = 5000
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lee RESUXDOC fila por fila y entrega las facturas en lotes
+    
+    Solo se leen las columnas 0-14 y las filas de otros eventos se descartan
+    apenas llegan; la hoja nunca se carga completa:
+    - .xlsx: iterador de filas de openpyxl en modo read_only
+    - .xls: registros de celda BIFF8 de la primera hoja, fila por fila
+    
+    Los textos vacíos o tipo "N/A" / "nan" quedan como celda vacía, igual que
+    con pandas.read_excel. La memoria queda acotada mientras el llamador
+    procese cada lote y lo suelte (por ejemplo, pasando
+    itertools.chain.from_iterable(iterar_resuxdoc(...)) a
+    supabase_client.importar_tbc_facturas) en vez de acumularlos.
+    
+    Args:
+        file_path: Ruta al archivo RESUXDOC.XLS / .XLSX
+        evento_filtro: Tipo de evento a filtrar (default: S66 - Mercado Libre Flex)
+        tamano_lote: Cantidad de facturas por lote
+    
+    Yields:
+        Listas de hasta `tamano_lote` facturas (mismo formato que parse_resuxdoc_xls)
+    """
+    
+    lote = []
+    advertencias = []
+    total = 0
+    
+    for idx, valores in _iterar_filas_excel(file_path):
+        factura, advertencia = _parsear_fila_resuxdoc(valores, evento_filtro)
+        
+        if advertencia:
+            advertencias.append((idx, advertencia))
+        
+        if factura:
+            lote.append(factura)
+            
+            if len(lote) >= tamano_lote:
+                total += len(lote)
+                yield lote
+                lote = []
+    
+    if lote:
+        total += len(lote)
+        yield lote
+    
+    _reportar_advertencias(advertencias)
+    print(f"\n[OK] Total facturas parseadas: {total}")
+
+
+def _iterar_filas_excel(file_path: str) -> Iterator[Tuple[int, tuple]]:
+    """
+    Itera las filas de datos (sin encabezado) de la primera hoja
+    
+    Cada fila se entrega como tupla de COLUMNAS_RESUXDOC valores, con las
+    celdas vacías como None.
+    """
+    
+    extension = os.path.splitext(file_path)[1].lower()
+    
+    if extension == '.xls':
+        yield from _iterar_filas_xls(file_path)
+    else:
+        yield from _iterar_filas_xlsx(file_path)
+
+
+def _valor_como_pandas(valor: Any) -> Any:
+    """
+    Normaliza un valor leído de la hoja como lo haría pandas.read_excel:
+    textos de VALORES_NA como vacío (None) y números enteros como int
+    """
+    if isinstance(valor, str):
+        return None if valor in VALORES_NA else valor
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+
+def _completar_fila(valores) -> tuple:
+    """Fila con exactamente COLUMNAS_RESUXDOC valores normalizados"""
+    valores = tuple(_valor_como_pandas(v) for v in valores[:COLUMNAS_RESUXDOC])
+    if len(valores) < COLUMNAS_RESUXDOC:
+        valores += (None,) * (COLUMNAS_RESUXDOC - len(valores))
+    return valores
+
+
+def _iterar_filas_xlsx(file_path: str) -> Iterator[Tuple[int, tuple]]:
+    """Filas de un .xlsx usando openpyxl en modo read_only"""
+    
+    import openpyxl
+    
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    
+    try:
+        worksheet = workbook.worksheets[0]
+        filas = worksheet.iter_rows(min_row=2, max_col=COLUMNAS_RESUXDOC, values_only=True)
+        
+        for idx, valores in enumerate(filas, start=1):
+            yield idx, _completar_fila(valores)
+    finally:
+        workbook.close()
+
+
+def _iterar_filas_xls(file_path: str) -> Iterator[Tuple[int, tuple]]:
+    """
+    Filas de un .xls (BIFF8) leyendo los registros de celda de la primera
+    hoja uno a uno
+    
+    xlrd arma la hoja completa en memoria aunque se abra con on_demand, así
+    que aquí solo se usa para abrir el archivo y leer el área global (tabla
+    de textos compartidos, formatos de fecha); los registros de la hoja se
+    recorren directamente y cada fila se entrega apenas termina (Excel
+    escribe las celdas ordenadas por fila). Archivos anteriores a BIFF8 se
+    leen con la hoja completa de xlrd.
+    """
+    
+    import xlrd
+    from xlrd import biffh
+    from xlrd.sheet import unpack_RK
+    
+    workbook = xlrd.open_workbook(file_path, on_demand=True)
+    
+    try:
+        if workbook.biff_version < 80:
+            yield from _iterar_filas_xls_hoja(workbook)
+            return
+        
+        # Misma posición que usa xlrd para cargar la hoja (ver Book.get_sheet)
+        workbook._position = workbook._sh_abs_posn[0]
+        workbook.getbof(biffh.XL_WORKSHEET)
+        
+        tipos_xf = workbook._xf_index_to_xl_type_map
+        textos = workbook._sharedstrings
+        
+        fila_actual = None
+        valores = {}
+        
+        def fila_lista():
+            return fila_actual, _completar_fila([valores.get(col) for col in range(COLUMNAS_RESUXDOC)])
+        
+        for rowx, colx, tipo, valor in _celdas_biff8(workbook, tipos_xf, textos, unpack_RK):
+            if rowx != fila_actual:
+                # La fila 0 es el encabezado
+                if fila_actual:
+                    yield fila_lista()
+                fila_actual = rowx
+                valores = {}
+            if colx < COLUMNAS_RESUXDOC:
+                valores[colx] = _valor_celda_xls(tipo, valor, workbook.datemode)
+        
+        if fila_actual:
+            yield fila_lista()
+    finally:
+        workbook.release_resources()
+
+
+def _celdas_biff8(workbook, tipos_xf, textos, unpack_RK) -> Iterator[Tuple[int, int, int, Any]]:
+    """(fila, columna, tipo xlrd, valor) de cada registro de celda de la hoja actual"""
+    
+    import struct
+    import xlrd
+    from xlrd import biffh
+    
+    while True:
+        codigo, _, datos = workbook.get_record_parts()
+        
+        if codigo is None or codigo == biffh.XL_EOF:
+            return
+        
+        if codigo == biffh.XL_LABELSST:
+            rowx, colx, _, indice = struct.unpack('<HHHi', datos[:10])
+            yield rowx, colx, xlrd.XL_CELL_TEXT, textos[indice]
+        
+        elif codigo == biffh.XL_NUMBER:
+            rowx, colx, xf, numero = struct.unpack('<HHHd', datos[:14])
+            yield rowx, colx, tipos_xf.get(xf, xlrd.XL_CELL_NUMBER), numero
+        
+        elif codigo == biffh.XL_RK:
+            rowx, colx, xf = struct.unpack('<HHH', datos[:6])
+            yield rowx, colx, tipos_xf.get(xf, xlrd.XL_CELL_NUMBER), unpack_RK(datos[6:10])
+        
+        elif codigo == biffh.XL_MULRK:
+            rowx, primera = struct.unpack('<HH', datos[:4])
+            ultima, = struct.unpack('<H', datos[-2:])
+            pos = 4
+            for colx in range(primera, ultima + 1):
+                xf, = struct.unpack('<H', datos[pos:pos + 2])
+                yield rowx, colx, tipos_xf.get(xf, xlrd.XL_CELL_NUMBER), unpack_RK(datos[pos + 2:pos + 6])
+                pos += 6
+        
+        elif codigo in (biffh.XL_LABEL, biffh.XL_RSTRING):
+            rowx, colx = struct.unpack('<HH', datos[:4])
+            yield rowx, colx, xlrd.XL_CELL_TEXT, biffh.unpack_unicode(datos, 6, lenlen=2)
+        
+        elif codigo == biffh.XL_BOOLERR:
+            rowx, colx, _, valor, es_error = struct.unpack('<HHHBB', datos[:8])
+            yield rowx, colx, (xlrd.XL_CELL_ERROR if es_error else xlrd.XL_CELL_BOOLEAN), valor
+        
+        elif codigo in biffh.XL_FORMULA_OPCODES:
+            rowx, colx, xf, resultado = struct.unpack('<HHH8s', datos[:14])
+            if resultado[6:8] != b'\xff\xff':
+                yield rowx, colx, tipos_xf.get(xf, xlrd.XL_CELL_NUMBER), struct.unpack('<d', resultado)[0]
+            elif resultado[0] == 0:
+                # Resultado de texto: viene en el registro STRING siguiente
+                # (puede haber un SHRFMLA / ARRAY / TABLEOP antes)
+                codigo, _, datos = workbook.get_record_parts()
+                while codigo not in (biffh.XL_STRING, None, biffh.XL_EOF):
+                    codigo, _, datos = workbook.get_record_parts()
+                if codigo != biffh.XL_STRING:
+                    return
+                yield rowx, colx, xlrd.XL_CELL_TEXT, biffh.unpack_unicode(datos, 0, lenlen=2)
+            elif resultado[0] == 1:
+                yield rowx, colx, xlrd.XL_CELL_BOOLEAN, resultado[2]
+            elif resultado[0] == 3:
+                yield rowx, colx, xlrd.XL_CELL_TEXT, ''
+
+
+def _iterar_filas_xls_hoja(workbook) -> Iterator[Tuple[int, tuple]]:
+    """Filas de la primera hoja cargada completa por xlrd (archivos anteriores a BIFF8)"""
+    
+    sheet = workbook.sheet_by_index(0)
+    
+    for idx in range(1, sheet.nrows):
+        celdas = sheet.row_slice(idx, 0, min(COLUMNAS_RESUXDOC, sheet.ncols))
+        yield idx, _completar_fila([
+            _valor_celda_xls(celda.ctype, celda.value, workbook.datemode) for celda in celdas
+        ])
+
+
+def _valor_celda_xls(tipo: int, valor: Any, datemode: int) -> Any:
+    """
+    Convierte una celda de xlrd al valor que entregaría pandas.read_excel
+    (fechas como datetime, errores y vacías como None; _completar_fila
+    termina de normalizar números y textos)
+    """
+    
+    import xlrd
+    
+    if tipo in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    
+    if tipo == xlrd.XL_CELL_DATE:
+        return xlrd.xldate_as_datetime(valor, datemode)
+    
+    if tipo == xlrd.XL_CELL_BOOLEAN:
+        return bool(valor)
+    
+    return valor
+
+
 def parse_tbc_fecha(fecha_str: str) -> str:
     """
     Parsea fecha del formato TBC (DD-Mmm-AA) a YYYY-MM-DD
@@ -253,10 +719,22 @@ def calcular_total_remision(facturas_remision: List[Dict[str, Any]]) -> float:
 # FUNCIÓN PRINCIPAL DE PARSEO
 # ============================================================================
 
-def procesar_archivo_tbc(file_path: str) -> Dict[str, Any]:
+def procesar_archivo_tbc(
+    file_path: str,
+    evento_filtro: str = "S66",
+    streaming: bool = False
+) -> Dict[str, Any]:
     """
     Procesa el archivo RESUXDOC.XLS completo y retorna datos estructurados
     
+    Args:
+        file_path: Ruta al archivo RESUXDOC.XLS
+        evento_filtro: Tipo de evento a filtrar (default: S66 - Mercado Libre Flex)
+        streaming: Si es True lee el archivo fila por fila (iterar_resuxdoc) en
+            vez de cargar la hoja completa en un DataFrame. El resultado igual
+            contiene todas las facturas; para no tenerlas todas en memoria hay
+            que consumir iterar_resuxdoc directamente
+    
     Returns:
         {
             'facturas': Lista de todas las facturas,
@@ -266,7 +744,21 @@ def procesar_archivo_tbc(file_path: str) -> Dict[str, Any]:
         }
     """
     
-    facturas = parse_resuxdoc_xls(file_path)
+    if streaming:
+        try:
+            facturas = list(chain.from_iterable(iterar_resuxdoc(file_path, evento_filtro)))
+        except Exception as e:
+            print(f"[ERROR] Error parseando archivo: {e}")
+            facturas = []
+    else:
+        facturas = parse_resuxdoc_xls_vectorizado(file_path, evento_filtro)
+    
+    return armar_resultado_tbc(facturas)
+
+
+def armar_resultado_tbc(facturas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Arma la estructura de procesar_archivo_tbc a partir de las facturas parseadas"""
+    
     agrupadas = agrupar_por_remision(facturas)
     
     return {
@@ -275,3 +767,146 @@ def procesar_archivo_tbc(file_path: str) -> Dict[str, Any]:
         'total_lineas': len(facturas),
         'remisiones_unicas': set([f['remision'] for f in facturas])
     }
+
+
+# ============================================================================
+# PROCESAR VARIOS ARCHIVOS (LOTE)
+# ============================================================================
+
+EXTENSIONES_TBC = ('.xls', '.xlsx')
+
+
+def _parsear_archivo_proceso(file_path: str, evento_filtro: str) -> List[Dict[str, Any]]:
+    """
+    Parsea un archivo dentro de un proceso del pool (debe ser de módulo para
+    poder serializarse). Los errores se propagan para que procesar_archivos_tbc
+    los reporte en el detalle del archivo.
+    """
+    return parse_resuxdoc_xls_vectorizado(file_path, evento_filtro, lanzar_errores=True)
+
+
+def _extraer_zip(zip_path: str, destino: str) -> List[str]:
+    """Extrae los .xls/.xlsx de un zip (sin respetar carpetas internas) y retorna sus rutas"""
+    rutas = []
+    
+    with zipfile.ZipFile(zip_path) as zf:
+        for i, info in enumerate(zf.infolist()):
+            nombre = os.path.basename(info.filename)
+            if info.is_dir() or not nombre.lower().endswith(EXTENSIONES_TBC) or nombre.startswith('.'):
+                continue
+            
+            # Prefijo por si dos carpetas del zip traen el mismo nombre
+            ruta = os.path.join(destino, f"{i:04d}_{nombre}")
+            with zf.open(info) as origen, open(ruta, 'wb') as salida:
+                salida.write(origen.read())
+            rutas.append(ruta)
+    
+    return rutas
+
+
+def combinar_facturas(listas: List[List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Une las facturas de varios archivos quitando las líneas repetidas entre exportes
+    
+    Una línea idéntica puede aparecer legítimamente varias veces en un mismo
+    archivo (mismo producto dos veces en una remisión), así que no se eliminan
+    todas las repetidas: cada línea queda tantas veces como el máximo de veces
+    que aparece en un solo archivo. El orden es el de aparición.
+    
+    Returns:
+        (facturas, cantidad de líneas descartadas por duplicadas)
+    """
+    
+    emitidas = {}
+    facturas = []
+    descartadas = 0
+    
+    for lista in listas:
+        en_archivo = {}
+        for factura in lista:
+            clave = tuple(factura.get(col) for col in COLUMNAS_FACTURA)
+            veces = en_archivo.get(clave, 0) + 1
+            en_archivo[clave] = veces
+            
+            if veces > emitidas.get(clave, 0):
+                emitidas[clave] = veces
+                facturas.append(factura)
+            else:
+                descartadas += 1
+    
+    return facturas, descartadas
+
+
+def procesar_archivos_tbc(
+    archivos: Union[str, List[str]],
+    evento_filtro: str = "S66",
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Procesa varios archivos RESUXDOC (o un .zip con ellos) en paralelo
+    
+    Cada archivo se parsea en un proceso aparte con el parser vectorizado;
+    luego se unen las facturas quitando las líneas repetidas entre exportes
+    que se solapan (ver combinar_facturas).
+    
+    Args:
+        archivos: Lista de rutas, o ruta a un .zip con los archivos
+        evento_filtro: Tipo de evento a filtrar (default: S66 - Mercado Libre Flex)
+        max_workers: Procesos simultáneos (default: config.TBC_PARSE_WORKERS)
+    
+    Returns:
+        Misma estructura que procesar_archivo_tbc, más:
+        'archivos': [{'archivo', 'lineas', 'error'}] en el orden recibido,
+        'duplicadas': líneas descartadas por repetidas entre archivos
+    """
+    import config
+    
+    with tempfile.TemporaryDirectory(prefix="tbc_lote_") as temp_dir:
+        if isinstance(archivos, str):
+            if not zipfile.is_zipfile(archivos):
+                raise ValueError(f"{archivos} no es un archivo .zip")
+            rutas = _extraer_zip(archivos, temp_dir)
+            nombres = [os.path.basename(r)[5:] for r in rutas]
+        else:
+            rutas = list(archivos)
+            nombres = [os.path.basename(r) for r in rutas]
+        
+        print(f"[INFO] Procesando {len(rutas)} archivos TBC")
+        
+        listas = []
+        detalle = []
+        
+        # Con un solo archivo no vale la pena levantar procesos
+        pool = None
+        if len(rutas) > 1:
+            workers = min(max_workers or config.TBC_PARSE_WORKERS, len(rutas))
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futuros = [pool.submit(_parsear_archivo_proceso, ruta, evento_filtro) for ruta in rutas]
+        
+        try:
+            for i, nombre in enumerate(nombres):
+                try:
+                    if pool is None:
+                        facturas = _parsear_archivo_proceso(rutas[i], evento_filtro)
+                    else:
+                        facturas = futuros[i].result()
+                    error = None
+                except Exception as e:
+                    print(f"[ERROR] {nombre}: {e}")
+                    facturas, error = [], str(e)
+                
+                listas.append(facturas)
+                detalle.append({'archivo': nombre, 'lineas': len(facturas), 'error': error})
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    
+    facturas, duplicadas = combinar_facturas(listas)
+    
+    if duplicadas:
+        print(f"[INFO] {duplicadas} líneas repetidas entre archivos descartadas")
+    
+    resultado = armar_resultado_tbc(facturas)
+    resultado['archivos'] = detalle
+    resultado['duplicadas'] = duplicadas
+    return resultado
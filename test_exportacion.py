@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de la exportación para BI (services/exportacion.py)
+
+Los tres formatos deben llevar exactamente las columnas del esquema fijo y
+las mismas filas.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from services import exportacion
+from services.reconciliation import reconciliar_ml_tbc
+from test_reconciliation import datos_sinteticos
+
+
+FECHA_CORRIDA = datetime(2026, 2, 3, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def resultado():
+    ordenes_ml, facturas_tbc, sin_remision = datos_sinteticos(semilla=3, ordenes=200, remisiones=100)
+    ordenes_ml[0]['productos'] = json.dumps([{'sku': 'SKU1', 'title': 'Producto', 'quantity': 2, 'unitPrice': 5000}])
+    return reconciliar_ml_tbc(ordenes_ml, facturas_tbc, '2026-02-01', sin_remision)
+
+
+def test_esquema_en_todos_los_formatos(resultado):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    filas = list(exportacion.filas_exportacion(resultado, 'abc', FECHA_CORRIDA))
+    assert all(tuple(fila) == exportacion.COLUMNAS for fila in filas)
+
+    tabla = pq.read_table(io.BytesIO(exportacion.exportar(resultado, 'parquet', 'abc', FECHA_CORRIDA)))
+    assert tabla.schema.equals(exportacion.esquema_exportacion())
+    assert tabla.num_rows == len(filas)
+
+    jsonl = exportacion.exportar(resultado, 'jsonl', 'abc', FECHA_CORRIDA).decode('utf-8').splitlines()
+    assert [tuple(json.loads(linea)) for linea in jsonl] == [exportacion.COLUMNAS] * len(filas)
+
+    lector = csv.DictReader(io.StringIO(exportacion.exportar(resultado, 'csv', 'abc', FECHA_CORRIDA).decode('utf-8')))
+    assert tuple(lector.fieldnames) == exportacion.COLUMNAS
+    assert len(list(lector)) == len(filas)
+
+
+def test_coincidencia_lleva_la_fecha_de_tbc():
+    ordenes_ml = [{'order_id': '1', 'remision': 'A', 'total': 1000, 'fecha_remision': None}]
+    facturas_tbc = {'A': [{'fecha': '2026-02-01', 'valor_total': 1000, 'producto_nombre': 'X'}]}
+
+    resultado = reconciliar_ml_tbc(ordenes_ml, facturas_tbc)
+    filas = list(exportacion.filas_exportacion(resultado))
+
+    assert len(resultado['coincidencias']) == 1
+    assert {(f['fecha_ml'], f['fecha_tbc']) for f in filas} == {(None, '2026-02-01')}
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de la ingesta de notificaciones (services/ml_webhook.py)
+
+ProcesadorNotificaciones recibe `obtener` y `guardar` falsos: no se llama
+a ML ni al OMS.
+"""
+
+import config
+from services.ml_webhook import ProcesadorNotificaciones, order_id_de_notificacion
+
+
+def notificacion(order_id, topic='orders_v2', application_id=None):
+    return {'topic': topic, 'resource': f"/orders/{order_id}", 'application_id': application_id}
+
+
+def orden_ml(order_id, total=1000, status='paid'):
+    return {
+        'id': int(order_id),
+        'date_created': '2026-02-01T10:00:00.000-05:00',
+        'total_amount': total,
+        'status': status,
+        'shipping': {'id': 99},
+        'order_items': [{'item': {'seller_sku': 'SKU1', 'title': 'Producto'}, 'quantity': 1, 'unit_price': total}],
+    }
+
+
+class OmsFalso:
+    """obtener / guardar en memoria; `sin_detalle` simula órdenes que ML no devuelve"""
+
+    def __init__(self, sin_detalle=(), falla_guardar=False):
+        self.sin_detalle = set(sin_detalle)
+        self.falla_guardar = falla_guardar
+        self.pedidas = []
+        self.guardadas = []
+
+    def obtener(self, order_ids):
+        self.pedidas.append(list(order_ids))
+        return {i: None if i in self.sin_detalle else orden_ml(i) for i in order_ids}
+
+    def guardar(self, filas):
+        if self.falla_guardar:
+            return {"success": False, "error": "OMS caído"}
+        self.guardadas.extend(filas)
+        return {"success": True, "count": len(filas)}
+
+
+def test_solo_notificaciones_de_ordenes_de_esta_app(monkeypatch):
+    monkeypatch.setattr(config, 'ML_APP_ID', '456')
+
+    assert order_id_de_notificacion(notificacion('123', application_id=456)) == '123'
+    assert order_id_de_notificacion(notificacion('123', topic='items')) is None
+    assert order_id_de_notificacion(notificacion('123', application_id=789)) is None
+    assert order_id_de_notificacion({'topic': 'orders_v2', 'resource': '/orders/abc'}) is None
+
+
+def test_lote_sin_duplicados_y_reintentos():
+    oms = OmsFalso(sin_detalle={'3'})
+    procesador = ProcesadorNotificaciones(oms.obtener, oms.guardar, tamano_lote=10, espera_seg=0, max_intentos=2)
+
+    for order_id in ['1', '2', '1', '3', '2']:
+        procesador.recibir(notificacion(order_id))
+
+    resultado = procesador.procesar_lote(procesador._tomar_lote())
+
+    assert oms.pedidas == [['1', '2', '3']]
+    assert [fila['order_id'] for fila in oms.guardadas] == ['1', '2']
+    assert resultado == {"success": False, "guardadas": 2, "fallidas": 1}
+
+    # La orden sin detalle vuelve a la cola hasta agotar los intentos
+    assert procesador._pendientes == {'3': 1}
+    procesador.procesar_lote(procesador._tomar_lote())
+    assert procesador._pendientes == {}
+    assert procesador.stats == {'recibidas': 5, 'guardadas': 2, 'fallidas': 1, 'lotes': 2}
+
+
+def test_falla_al_guardar_reencola_el_lote():
+    oms = OmsFalso(falla_guardar=True)
+    procesador = ProcesadorNotificaciones(oms.obtener, oms.guardar, tamano_lote=10, espera_seg=0, max_intentos=3)
+
+    procesador.recibir(notificacion('1'))
+    procesador.recibir(notificacion('2'))
+    resultado = procesador.procesar_lote(procesador._tomar_lote())
+
+    assert resultado["guardadas"] == 0
+    assert procesador._pendientes == {'1': 1, '2': 1}
+
+
+def test_hilo_procesa_por_lotes_y_vacia_la_cola_al_detener():
+    oms = OmsFalso()
+    procesador = ProcesadorNotificaciones(oms.obtener, oms.guardar, tamano_lote=2, espera_seg=60)
+    procesador.iniciar()
+
+    for order_id in ['1', '2', '3']:
+        procesador.recibir(notificacion(order_id))
+    procesador.detener()
+
+    assert sorted(fila['order_id'] for fila in oms.guardadas) == ['1', '2', '3']
+    assert all(len(lote) <= 2 for lote in oms.pedidas)
+    assert oms.guardadas[0]['total_amount'] == 1000.0
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas del motor de reconciliación (services/reconciliation.py)
+
+_reconciliar_referencia es la versión original de reconciliar_ml_tbc (antes
+de las optimizaciones): la salida del motor actual debe ser idéntica.
+"""
+
+import random
+from datetime import datetime
+
+import pytz
+
+from services import reconciliation
+from services.reconciliation import (
+    TIPO_VALOR_DIFERENTE,
+    TIPO_REMISION_SIN_FACTURA,
+    TIPO_FACTURA_SIN_REMISION,
+    TIPO_FECHA_DIFERENTE,
+    TIPO_PEDIDOS_SIN_FACTURAR,
+)
+
+
+# ============================================================================
+# REFERENCIA
+# ============================================================================
+
+def _reconciliar_referencia(ordenes_ml, facturas_tbc, fecha_minima_tbc=None, ordenes_sin_remision=None):
+    coincidencias = []
+    discrepancias = []
+
+    ordenes_por_remision = {}
+    for orden in ordenes_ml:
+        remision = orden.get('remision')
+        if remision:
+            ordenes_por_remision.setdefault(remision, []).append(orden)
+
+    for remision, ordenes in ordenes_por_remision.items():
+        facturas = facturas_tbc.get(remision)
+        if not facturas:
+            discrepancias.append({
+                'tipo': TIPO_REMISION_SIN_FACTURA,
+                'remision': remision,
+                'detalle': {
+                    'ordenes_ml': ordenes,
+                    'mensaje': f'Remisión {remision} asignada en ML pero no encontrada en TBC'
+                }
+            })
+            continue
+
+        total_ml = sum(orden['total'] for orden in ordenes)
+        total_tbc = sum(f.get('valor_total', 0) for f in facturas if f.get('valor_total'))
+        diferencia = abs(total_ml - total_tbc)
+
+        if diferencia > 100:
+            discrepancias.append({
+                'tipo': TIPO_VALOR_DIFERENTE,
+                'remision': remision,
+                'detalle': {
+                    'total_ml': total_ml,
+                    'total_tbc': total_tbc,
+                    'diferencia': diferencia,
+                    'ordenes_ml': ordenes,
+                    'facturas_tbc': facturas
+                }
+            })
+            continue
+
+        fecha_ml = ordenes[0].get('fecha_remision')
+        fecha_tbc = facturas[0].get('fecha')
+        if fecha_ml and fecha_tbc and fecha_ml != fecha_tbc:
+            discrepancias.append({
+                'tipo': TIPO_FECHA_DIFERENTE,
+                'remision': remision,
+                'detalle': {
+                    'fecha_ml': fecha_ml,
+                    'fecha_tbc': fecha_tbc,
+                    'ordenes_ml': ordenes,
+                    'facturas_tbc': facturas
+                }
+            })
+        else:
+            coincidencias.append({
+                'remision': remision,
+                'total': total_ml,
+                'fecha': fecha_ml,
+                'cantidad_ordenes': len(ordenes),
+                'cantidad_productos': len(facturas),
+                'ordenes_ml': ordenes,
+                'facturas_tbc': facturas
+            })
+
+    for remision, facturas in facturas_tbc.items():
+        if remision not in ordenes_por_remision:
+            discrepancias.append({
+                'tipo': TIPO_FACTURA_SIN_REMISION,
+                'remision': remision,
+                'detalle': {
+                    'total_tbc': sum(f.get('valor_total', 0) for f in facturas if f.get('valor_total')),
+                    'facturas_tbc': facturas,
+                    'mensaje': f'Factura {remision} en TBC pero no tiene remisión asignada en ML'
+                }
+            })
+
+    if fecha_minima_tbc and ordenes_sin_remision:
+        colombia = pytz.timezone('America/Bogota')
+        antiguos = []
+        for orden in ordenes_sin_remision:
+            if orden.get('fecha_orden'):
+                fecha_utc = datetime.fromisoformat(orden['fecha_orden'].replace('Z', '+00:00'))
+                if fecha_utc.astimezone(colombia).strftime('%Y-%m-%d') < fecha_minima_tbc:
+                    antiguos.append(orden)
+        if antiguos:
+            discrepancias.append({
+                'tipo': TIPO_PEDIDOS_SIN_FACTURAR,
+                'remision': 'N/A',
+                'detalle': {
+                    'fecha_limite': fecha_minima_tbc,
+                    'cantidad': len(antiguos),
+                    'ordenes': antiguos,
+                    'mensaje': f'Se encontraron {len(antiguos)} pedidos sin facturar anteriores a {fecha_minima_tbc}'
+                }
+            })
+
+    total_comparaciones = len(ordenes_por_remision) + len([r for r in facturas_tbc if r not in ordenes_por_remision])
+    porcentaje = (len(coincidencias) / total_comparaciones * 100) if total_comparaciones > 0 else 0
+
+    return {
+        'coincidencias': coincidencias,
+        'discrepancias': discrepancias,
+        'total_ordenes_ml': len(ordenes_por_remision),
+        'total_facturas_tbc': len(facturas_tbc),
+        'porcentaje_coincidencia': round(porcentaje, 2)
+    }
+
+
+# ============================================================================
+# DATOS
+# ============================================================================
+
+FECHAS = ['2026-02-01', '2026-02-02', '2026-02-03']
+
+
+def datos_sinteticos(semilla=7, ordenes=600, remisiones=300):
+    """
+    Órdenes ML, facturas TBC agrupadas y órdenes sin remisión con todos los
+    casos: coincidencias, valor / fecha diferente, remisiones de un solo lado,
+    grupos TBC vacíos, valores nulos o cero y fechas con y sin zona horaria
+    """
+    rnd = random.Random(semilla)
+
+    ordenes_ml = []
+    for i in range(ordenes):
+        ordenes_ml.append({
+            'order_id': str(i),
+            'remision': f"R{rnd.randrange(remisiones)}",
+            'total': rnd.choice([10000, 20000, 35000]),
+            'fecha_remision': rnd.choice(FECHAS + [None]),
+        })
+
+    facturas_tbc = {}
+    for n in range(remisiones // 3, remisiones + remisiones // 3):
+        remision = f"R{n}"
+        if n % 17 == 0:
+            facturas_tbc[remision] = []
+            continue
+        facturas_tbc[remision] = [
+            {
+                'remision': remision,
+                'fecha': rnd.choice(FECHAS),
+                'valor_total': rnd.choice([10000, 20000, 35000, 0, None]),
+            }
+            for _ in range(rnd.randint(1, 4))
+        ]
+
+    ordenes_sin_remision = [
+        {'order_id': f"S{i}", 'remision': None, 'total': 1000, 'fecha_orden': fecha}
+        for i, fecha in enumerate([
+            '2026-01-31T23:30:00.000-05:00',
+            '2026-02-01T04:59:59Z',
+            '2026-02-01T05:00:00Z',
+            '2026-02-02T10:00:00.000-05:00',
+            '2026-01-15T10:00:00',
+            None,
+        ])
+    ]
+
+    return ordenes_ml, facturas_tbc, ordenes_sin_remision
+
+
+# ============================================================================
+# PRUEBAS
+# ============================================================================
+
+def test_paridad_con_motor_original():
+    for semilla in range(5):
+        ordenes_ml, facturas_tbc, sin_remision = datos_sinteticos(semilla)
+
+        esperado = _reconciliar_referencia(ordenes_ml, facturas_tbc, '2026-02-01', sin_remision)
+        obtenido = reconciliation.reconciliar_ml_tbc(ordenes_ml, facturas_tbc, '2026-02-01', sin_remision)
+
+        assert obtenido == esperado
+
+
+def test_reglas_por_remision():
+    ordenes_ml = [
+        {'order_id': '1', 'remision': 'A', 'total': 1000, 'fecha_remision': '2026-02-01'},
+        {'order_id': '2', 'remision': 'A', 'total': 500, 'fecha_remision': '2026-02-01'},
+        {'order_id': '3', 'remision': 'B', 'total': 1000, 'fecha_remision': '2026-02-01'},
+        {'order_id': '4', 'remision': 'C', 'total': 1000, 'fecha_remision': '2026-02-01'},
+        {'order_id': '5', 'remision': 'D', 'total': 1000, 'fecha_remision': '2026-02-01'},
+        {'order_id': '6', 'remision': 'E', 'total': 1000, 'fecha_remision': '2026-02-01'},
+    ]
+    facturas_tbc = {
+        'A': [{'fecha': '2026-02-01', 'valor_total': 1450}],   # dentro de la tolerancia
+        'B': [{'fecha': '2026-02-01', 'valor_total': 1200}],   # fuera de la tolerancia
+        'C': [{'fecha': '2026-02-02', 'valor_total': 1000}],   # otra fecha
+        'E': [],                                               # grupo vacío
+        'F': [{'fecha': '2026-02-01', 'valor_total': 800}],    # sin órdenes ML
+    }
+
+    resultado = reconciliation.reconciliar_ml_tbc(ordenes_ml, facturas_tbc)
+    tipos = {d['remision']: d['tipo'] for d in resultado['discrepancias']}
+
+    assert [c['remision'] for c in resultado['coincidencias']] == ['A']
+    assert tipos == {
+        'B': TIPO_VALOR_DIFERENTE,
+        'C': TIPO_FECHA_DIFERENTE,
+        'D': TIPO_REMISION_SIN_FACTURA,
+        'E': TIPO_REMISION_SIN_FACTURA,
+        'F': TIPO_FACTURA_SIN_REMISION,
+    }
+    assert resultado['total_ordenes_ml'] == 5
+    assert resultado['total_facturas_tbc'] == 5
+    assert resultado['porcentaje_coincidencia'] == round(1 / 6 * 100, 2)
+
+
+def test_resultado_referencia_las_listas_de_entrada():
+    ordenes_ml, facturas_tbc, _ = datos_sinteticos()
+
+    resultado = reconciliation.reconciliar_ml_tbc(ordenes_ml, facturas_tbc)
+
+    for coincidencia in resultado['coincidencias']:
+        assert coincidencia['facturas_tbc'] is facturas_tbc[coincidencia['remision']]
+    for disc in resultado['discrepancias']:
+        if 'facturas_tbc' in disc['detalle']:
+            assert disc['detalle']['facturas_tbc'] is facturas_tbc[disc['remision']]
+
+
+def test_pedidos_sin_facturar_en_hora_colombia():
+    _, _, sin_remision = datos_sinteticos()
+
+    pendientes = reconciliation.filtrar_pedidos_sin_facturar(sin_remision, '2026-02-01')
+
+    # 04:59:59Z es 23:59:59 del 31 en Colombia; 05:00:00Z ya es el 1
+    assert [o['order_id'] for o in pendientes] == ['S0', 'S1', 'S4']
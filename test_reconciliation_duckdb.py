@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas del motor DuckDB (services/reconciliation_duckdb.py)
+
+Mismas reglas y misma salida que reconciliar_ml_tbc sobre los mismos datos.
+"""
+
+import pytest
+
+from services import reconciliation, reconciliation_duckdb
+from test_reconciliation import datos_sinteticos
+
+pytest.importorskip("duckdb")
+
+
+def _por_remision(resultado):
+    coincidencias = sorted(resultado['coincidencias'], key=lambda c: c['remision'])
+    discrepancias = sorted(resultado['discrepancias'], key=lambda d: (d['tipo'], d['remision']))
+    return coincidencias, discrepancias
+
+
+def test_paridad_con_reconciliar_ml_tbc():
+    for semilla in range(3):
+        ordenes_ml, facturas_tbc, sin_remision = datos_sinteticos(semilla)
+
+        esperado = reconciliation.reconciliar_ml_tbc(ordenes_ml, facturas_tbc, '2026-02-01', sin_remision)
+        obtenido = reconciliation_duckdb.reconciliar_duckdb(ordenes_ml, facturas_tbc, '2026-02-01', sin_remision)
+
+        for clave in ('total_ordenes_ml', 'total_facturas_tbc', 'porcentaje_coincidencia'):
+            assert obtenido[clave] == esperado[clave]
+        assert _por_remision(obtenido) == _por_remision(esperado)
+
+
+def test_sin_detalle_conserva_tipos_y_totales():
+    ordenes_ml, facturas_tbc, _ = datos_sinteticos(semilla=4)
+
+    esperado = reconciliation.reconciliar_ml_tbc(ordenes_ml, facturas_tbc)
+    obtenido = reconciliation_duckdb.reconciliar_duckdb(ordenes_ml, facturas_tbc, incluir_detalle=False)
+
+    assert sorted((d['tipo'], d['remision']) for d in obtenido['discrepancias']) == \
+        sorted((d['tipo'], d['remision']) for d in esperado['discrepancias'])
+    assert obtenido['porcentaje_coincidencia'] == esperado['porcentaje_coincidencia']
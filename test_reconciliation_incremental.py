@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de la reconciliación incremental (services/reconciliation_incremental.py)
+
+Después de aplicar órdenes modificadas sobre el estado guardado, el resultado
+debe ser idéntico al de reconciliar_ml_tbc sobre el universo completo.
+"""
+
+import json
+import random
+
+from services import reconciliation_incremental
+from services.reconciliation import (
+    TIPO_COINCIDENCIA,
+    TIPO_PEDIDOS_SIN_FACTURAR,
+    reconciliar_ml_tbc,
+)
+from test_reconciliation import FECHAS
+
+
+FECHA_MINIMA = '2026-02-01'
+
+
+# ============================================================================
+# DATOS
+# ============================================================================
+
+def universo_sintetico(rnd, ordenes=500, remisiones=200):
+    """Órdenes del OMS (con y sin remisión, dentro y fuera de las fechas TBC) y facturas"""
+
+    universo = {}
+    for i in range(ordenes):
+        universo[str(i)] = _orden_aleatoria(rnd, str(i), remisiones)
+
+    facturas_tbc = {}
+    for n in range(remisiones // 4, remisiones + remisiones // 4):
+        remision = f"R{n}"
+        facturas_tbc[remision] = [
+            {'remision': remision, 'fecha': rnd.choice(FECHAS), 'valor_total': rnd.choice([10000, 20000, None])}
+            for _ in range(rnd.randint(0, 3))
+        ]
+
+    return universo, facturas_tbc
+
+
+def _orden_aleatoria(rnd, order_id, remisiones):
+    sin_remision = rnd.random() < 0.2
+    return {
+        'order_id': order_id,
+        'remision': None if sin_remision else f"R{rnd.randrange(remisiones)}",
+        'total': rnd.choice([10000, 20000, 30000]),
+        'fecha_remision': None if sin_remision else rnd.choice(FECHAS + ['2026-01-20']),
+        'fecha_orden': f"2026-01-{rnd.randint(25, 31):02d}T{rnd.randint(0, 23):02d}:00:00Z",
+    }
+
+
+def reconciliar_completo(universo, facturas_tbc):
+    """Lo que hace la página sin modo incremental sobre el mismo universo"""
+
+    ordenes = sorted(universo.values(), key=lambda o: (o['fecha_orden'], o['order_id']), reverse=True)
+    ordenes_ml = [o for o in ordenes if o['remision'] and o['fecha_remision'] in FECHAS]
+    sin_remision = [o for o in ordenes if not o['remision']]
+
+    return reconciliar_ml_tbc(ordenes_ml, facturas_tbc, FECHA_MINIMA, sin_remision)
+
+
+def _tipos(resultado):
+    tipos = {c['remision']: TIPO_COINCIDENCIA for c in resultado['coincidencias']}
+    for disc in resultado['discrepancias']:
+        if disc['tipo'] != TIPO_PEDIDOS_SIN_FACTURAR:
+            tipos[disc['remision']] = disc['tipo']
+    return tipos
+
+
+# ============================================================================
+# PRUEBAS
+# ============================================================================
+
+def test_incremental_igual_a_corrida_completa():
+    for semilla in range(5):
+        rnd = random.Random(semilla)
+        universo, facturas_tbc = universo_sintetico(rnd)
+
+        salida = reconciliation_incremental.aplicar_cambios(
+            None, list(universo.values()), facturas_tbc, FECHAS, FECHA_MINIMA
+        )
+        assert salida['resultado'] == reconciliar_completo(universo, facturas_tbc)
+
+        for _ in range(3):
+            # El estado pasa por JSON igual que entre corridas
+            estado = json.loads(json.dumps(salida['estado']))
+            tipos_antes = _tipos(salida['resultado'])
+
+            cambiadas = []
+            for order_id in rnd.sample(sorted(universo), 60):
+                orden = _orden_aleatoria(rnd, order_id, 200)
+                vigente = rnd.random() > 0.2
+                if vigente:
+                    universo[order_id] = orden
+                else:
+                    universo.pop(order_id, None)
+                cambiadas.append({**orden, 'vigente': vigente})
+
+            salida = reconciliation_incremental.aplicar_cambios(
+                estado, cambiadas, facturas_tbc, FECHAS, FECHA_MINIMA
+            )
+            esperado = reconciliar_completo(universo, facturas_tbc)
+
+            assert salida['resultado'] == esperado
+
+            tipos_despues = _tipos(esperado)
+            cambios = {
+                r for r in tipos_antes.keys() | tipos_despues.keys()
+                if tipos_antes.get(r) != tipos_despues.get(r)
+            }
+            diff = salida['diff']
+            assert {d['remision'] for d in diff['nuevas']} == {
+                r for r in cambios if tipos_despues.get(r) not in (None, TIPO_COINCIDENCIA)
+            }
+            assert {d['remision'] for d in diff['resueltas']} == {
+                r for r in cambios if tipos_antes.get(r) not in (None, TIPO_COINCIDENCIA)
+            }
+
+
+def test_estado_guarda_resultado_por_remision():
+    universo, facturas_tbc = universo_sintetico(random.Random(1))
+
+    estado = reconciliation_incremental.aplicar_cambios(
+        None, list(universo.values()), facturas_tbc, FECHAS, FECHA_MINIMA
+    )['estado']
+
+    # Ni las facturas (vienen del archivo) ni las órdenes fuera de alcance
+    guardadas = {
+        orden['order_id']
+        for datos in estado['remisiones'].values()
+        for orden in reconciliation_incremental._ordenes_entrada(datos['entrada'])
+    }
+    assert 'facturas_tbc' not in json.dumps(estado)
+    assert guardadas == {
+        o['order_id'] for o in universo.values() if o['remision'] and o['fecha_remision'] in FECHAS
+    }
+    assert {o['order_id'] for o in estado['pedidos_sin_facturar']} == {
+        o['order_id'] for o in universo.values() if not o['remision']
+    }
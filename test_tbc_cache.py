@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas del caché de archivos TBC parseados (services/tbc_cache.py)
+
+Lo que se lee del caché debe ser idéntico a lo que entrega el parser.
+"""
+
+import openpyxl
+import pytest
+
+import config
+from services import tbc_cache, tbc_parser
+from test_tbc_parser import ENCABEZADO, FILAS
+
+
+@pytest.fixture
+def contenido_xlsx(tmp_path):
+    workbook = openpyxl.Workbook()
+    hoja = workbook.active
+    hoja.append(ENCABEZADO)
+    for fila in FILAS:
+        hoja.append(fila)
+
+    ruta = tmp_path / "RESUXDOC.xlsx"
+    workbook.save(ruta)
+    return ruta.read_bytes()
+
+
+def test_ida_y_vuelta_por_el_cache(tmp_path, monkeypatch, contenido_xlsx):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(config, 'TBC_CACHE_DIR', str(tmp_path / "cache"))
+
+    parseado = tbc_cache.procesar_archivo_tbc_cacheado(contenido_xlsx, "RESUXDOC.xlsx")
+
+    # La segunda vez no se vuelve a parsear
+    def sin_parsear(*args, **kwargs):
+        raise AssertionError("se volvió a parsear un archivo en caché")
+    monkeypatch.setattr(tbc_parser, 'procesar_archivo_tbc', sin_parsear)
+
+    desde_cache = tbc_cache.procesar_archivo_tbc_cacheado(contenido_xlsx, "RESUXDOC.xlsx")
+
+    assert parseado['facturas']
+    assert desde_cache == parseado
+    assert desde_cache['hash_archivo'] == tbc_cache.calcular_hash_archivo(contenido_xlsx)
+
+
+def test_expulsion_lru(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(config, 'TBC_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'TBC_CACHE_MAX_MB', 1024)
+
+    factura = dict.fromkeys(tbc_parser.COLUMNAS_FACTURA)
+    for clave in ('a', 'b'):
+        assert tbc_cache.guardar_facturas_cache(clave, [factura])
+
+    assert tbc_cache.expulsar_lru(0) == 2
+    assert tbc_cache.leer_facturas_cache('a') is None
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas del parser RESUXDOC (services/tbc_parser.py)
+
+El parser fila por fila sobre pandas es la referencia: el vectorizado y la
+lectura por streaming (.xlsx y .xls) deben entregar las mismas facturas.
+"""
+
+from itertools import chain
+
+import pytest
+
+from services import tbc_parser
+
+
+ENCABEZADO = [
+    'EVENTO', 'NOMEVE', 'PRODUC', 'DDMMAA', 'DETALL', 'UNIMED', 'CANTID',
+    'VALUNI', 'VALTOT', 'C9', 'C10', 'C11', 'CONSEC', 'C13', 'NROFAC',
+]
+
+
+def _fila(evento='S66', producto='P01', fecha='04-Ene-26', nombre='Producto A',
+          cantidad=2, valor_unitario=1000, valor_total=2000, consec=12345, nrofac='RM12345'):
+    return [
+        evento, 'Remision Mercancia A', producto, fecha, nombre, 'UN',
+        cantidad, valor_unitario, valor_total, None, None, None, consec, None, nrofac,
+    ]
+
+
+FILAS = [
+    _fila(),
+    _fila(consec='  4321 ', fecha='05-Feb-26'),
+    _fila(consec=123456, nrofac='RM 7788'),          # CONSEC inválido: NROFAC
+    _fila(consec=None),                              # sin remisión: se descarta
+    _fila(consec=12, nrofac='sin numero'),           # advertencia
+    _fila(evento='S01'),                             # otro evento
+    _fila(cantidad='N/A', nombre='N/A'),             # textos vacíos para pandas
+    _fila(cantidad='nan', nombre='nan', valor_total='NA'),
+    _fila(cantidad='abc', valor_unitario='x', valor_total='y'),
+    _fila(cantidad=1.5, valor_unitario=10.25, valor_total=15.375, producto=None),
+    _fila(fecha='31-Xyz-26', consec=5555.0),
+]
+
+
+@pytest.fixture
+def archivo_xlsx(tmp_path):
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    hoja = workbook.active
+    hoja.append(ENCABEZADO)
+    for fila in FILAS:
+        hoja.append(fila)
+
+    ruta = tmp_path / "RESUXDOC.xlsx"
+    workbook.save(ruta)
+    return str(ruta)
+
+
+@pytest.fixture
+def archivo_xls(tmp_path):
+    xlwt = pytest.importorskip("xlwt")
+
+    workbook = xlwt.Workbook()
+    hoja = workbook.add_sheet("RESUXDOC")
+    for rowx, fila in enumerate([ENCABEZADO] + FILAS):
+        for colx, valor in enumerate(fila):
+            if valor is not None:
+                hoja.write(rowx, colx, valor)
+
+    ruta = tmp_path / "RESUXDOC.XLS"
+    workbook.save(str(ruta))
+    return str(ruta)
+
+
+def _parsers_coinciden(ruta):
+    referencia = tbc_parser.parse_resuxdoc_xls(ruta)
+    vectorizado = tbc_parser.parse_resuxdoc_xls_vectorizado(ruta)
+    streaming = list(chain.from_iterable(tbc_parser.iterar_resuxdoc(ruta, tamano_lote=3)))
+
+    assert len(referencia) == 8
+    assert vectorizado == referencia
+    assert streaming == referencia
+    return referencia
+
+
+def test_parsers_coinciden_xlsx(archivo_xlsx):
+    _parsers_coinciden(archivo_xlsx)
+
+
+def test_parsers_coinciden_xls(archivo_xls):
+    _parsers_coinciden(archivo_xls)
+
+
+def test_textos_na_como_celda_vacia(archivo_xls):
+    facturas = list(chain.from_iterable(tbc_parser.iterar_resuxdoc(archivo_xls)))
+
+    na = [f for f in facturas if f['producto_nombre'] == 'Producto sin nombre']
+    assert len(na) == 2
+    assert all(f['cantidad'] == 1 for f in na)
+    assert [f['remision'] for f in facturas[:3]] == ['12345', '4321', '7788']
+
+
+def test_streaming_entrega_lotes(archivo_xlsx):
+    lotes = list(tbc_parser.iterar_resuxdoc(archivo_xlsx, tamano_lote=3))
+
+    assert [len(lote) for lote in lotes] == [3, 3, 2]
+    assert tbc_parser.procesar_archivo_tbc(archivo_xlsx, streaming=True)['facturas'] == list(chain(*lotes))